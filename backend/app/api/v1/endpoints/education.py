@@ -10,6 +10,8 @@ from typing import Optional, Dict, Any
 
 from app.core.database import get_db
 from app.core.exceptions import AuthenticationError
+from app.core.rate_governor import Priority, request_priority
+from app.core.sse import sse_response
 from app.services.auth_service import AuthService
 from app.services.education_service import EducationService
 
@@ -68,7 +70,11 @@ async def get_education_content(
     )
 
 
-@router.post("/explain", response_model=EducationResponse)
+@router.post(
+    "/explain",
+    response_model=EducationResponse,
+    dependencies=[request_priority(Priority.INTERACTIVE)]
+)
 async def explain_concept(
     request: EducationRequest,
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -99,6 +105,41 @@ async def explain_concept(
     )
 
 
+@router.post(
+    "/explain/stream",
+    dependencies=[request_priority(Priority.INTERACTIVE)]
+)
+async def stream_concept_explanation(
+    request: EducationRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get an explanation as server-sent events
+    
+    `token` events carry model output as it arrives, `field` events each
+    top-level field once complete, and the final `done` event the full
+    content (as from `/explain`).
+    """
+    auth_service = AuthService(db)
+    education_service = EducationService(db)
+    
+    # Get current user
+    user = await auth_service.get_current_user(credentials.credentials)
+    
+    events = education_service.stream_education_content(
+        topic=request.topic,
+        level=request.level,
+        context=request.context
+    )
+    
+    def transform(event: str, data: Any):
+        if event == "content":
+            return "done", data
+        return event, data
+    
+    return sse_response(events, transform)
+
+
 @router.get("/topics/list")
 async def list_education_topics(
     credentials: HTTPAuthorizationCredentials = Depends(security),
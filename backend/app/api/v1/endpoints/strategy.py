@@ -2,19 +2,27 @@
 Strategy recommendation and execution endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from datetime import datetime
 import uuid
 
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.deadline import request_deadline
+from app.core.rate_governor import Priority, request_priority
 from app.core.exceptions import AuthenticationError, NotFoundError
+from app.core.sse import sse_response
 from app.models.user import User
 from app.models.recommendation import Recommendation
+from app.models.job import RecommendationJob
 from app.services.auth_service import AuthService
 from app.services.strategy_service import StrategyService
+from app.services.job_service import JobService
+from app.services.archive_service import ArchiveService
 
 router = APIRouter()
 security = HTTPBearer()
@@ -44,8 +52,23 @@ class RecommendationResponse(BaseModel):
     explanation: Optional[str]
     status: str
     created_at: str
-    raw_input: Dict[str, Any]
+    raw_input: Optional[Dict[str, Any]]
     ai_output: Dict[str, Any]
+    archived: bool = False
+    reused: bool = False  # Previous recommendation returned because its inputs had not changed
+
+
+class RecommendationJobResponse(BaseModel):
+    """Queued recommendation job response model"""
+    id: str
+    status: str  # queued, running, succeeded, failed
+    attempts: int
+    error: Optional[str]
+    created_at: str
+    started_at: Optional[str]
+    finished_at: Optional[str]
+    recommendation_id: Optional[str]
+    recommendation: Optional[RecommendationResponse] = None
 
 
 class ExecutionResponse(BaseModel):
@@ -56,7 +79,39 @@ class ExecutionResponse(BaseModel):
     gas_used: Optional[float]
 
 
-@router.post("/recommend", response_model=RecommendationResponse)
+def _recommendation_response(
+    recommendation: Recommendation,
+    archived_payload: Optional[Dict[str, Any]] = None
+) -> RecommendationResponse:
+    """Build a response, using the archived payload for archived rows when given"""
+    payload = archived_payload or {
+        "raw_input": recommendation.raw_input,
+        "ai_output": recommendation.ai_output,
+        "explanation": recommendation.explanation
+    }
+    return RecommendationResponse(
+        id=str(recommendation.id),
+        strategy_type=recommendation.strategy_type,
+        risk_score=recommendation.risk_score,
+        expected_apy=recommendation.expected_apy,
+        explanation=payload["explanation"],
+        status=recommendation.status,
+        created_at=recommendation.created_at.isoformat(),
+        raw_input=payload["raw_input"],
+        ai_output=payload["ai_output"],
+        archived=recommendation.archived_at is not None,
+        reused=recommendation.reused
+    )
+
+
+@router.post(
+    "/recommend",
+    response_model=RecommendationResponse,
+    dependencies=[
+        request_deadline(settings.STRATEGY_REQUEST_DEADLINE_SECONDS),
+        request_priority(Priority.INTERACTIVE)
+    ]
+)
 async def get_strategy_recommendation(
     request: StrategyRecommendationRequest,
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -78,52 +133,175 @@ async def get_strategy_recommendation(
         preferred_protocols=request.preferred_protocols
     )
     
-    return RecommendationResponse(
-        id=str(recommendation.id),
-        strategy_type=recommendation.strategy_type,
-        risk_score=recommendation.risk_score,
-        expected_apy=recommendation.expected_apy,
-        explanation=recommendation.explanation,
-        status=recommendation.status,
-        created_at=recommendation.created_at.isoformat(),
-        raw_input=recommendation.raw_input,
-        ai_output=recommendation.ai_output
+    return _recommendation_response(recommendation)
+
+
+def _job_response(
+    job: RecommendationJob,
+    recommendation: Optional[Recommendation] = None
+) -> RecommendationJobResponse:
+    """Build a job response, embedding the recommendation once the job has succeeded"""
+    return RecommendationJobResponse(
+        id=str(job.id),
+        status=job.status,
+        attempts=job.attempts,
+        error=job.error,
+        created_at=job.created_at.isoformat(),
+        started_at=job.started_at.isoformat() if job.started_at else None,
+        finished_at=job.finished_at.isoformat() if job.finished_at else None,
+        recommendation_id=job.recommendation_id,
+        recommendation=_recommendation_response(recommendation) if recommendation else None
+    )
+
+
+@router.post(
+    "/recommend/stream",
+    dependencies=[request_priority(Priority.INTERACTIVE)]
+)
+async def stream_strategy_recommendation(
+    request: StrategyRecommendationRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a strategy recommendation as server-sent events
+    
+    `token` events carry model output as it arrives, `field` events each
+    top-level field of the answer once complete, and the final `done`
+    event the persisted recommendation (as from `/recommend`). Failures
+    after the stream starts arrive as an `error` event.
+    """
+    auth_service = AuthService(db)
+    strategy_service = StrategyService(db)
+    
+    # Get current user
+    user = await auth_service.get_current_user(credentials.credentials)
+    
+    events = strategy_service.stream_recommendation(
+        user_id=user.id,
+        risk_tolerance=request.risk_tolerance,
+        investment_amount=request.investment_amount,
+        time_horizon=request.time_horizon,
+        preferred_protocols=request.preferred_protocols
+    )
+    
+    def transform(event: str, data: Any):
+        if event == "recommendation":
+            return "done", _recommendation_response(data).model_dump()
+        return event, data
+    
+    return sse_response(events, transform)
+
+
+@router.post(
+    "/recommend/jobs",
+    response_model=RecommendationJobResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def queue_strategy_recommendation(
+    request: StrategyRecommendationRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue a strategy recommendation and return immediately
+    
+    The recommendation is generated by a background worker; poll
+    `/jobs/{job_id}` (optionally with `wait`) for its status and result.
+    """
+    auth_service = AuthService(db)
+    job_service = JobService(db)
+    
+    # Get current user
+    user = await auth_service.get_current_user(credentials.credentials)
+    
+    job = await job_service.enqueue(
+        user.id,
+        risk_tolerance=request.risk_tolerance,
+        investment_amount=request.investment_amount,
+        time_horizon=request.time_horizon,
+        preferred_protocols=request.preferred_protocols
     )
+    
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=RecommendationJobResponse)
+async def get_recommendation_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=settings.RECOMMENDATION_JOB_MAX_WAIT_SECONDS),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a queued recommendation's status
+    
+    With `wait`, the request is held for up to that many seconds until
+    the job finishes. Succeeded jobs include the recommendation.
+    """
+    auth_service = AuthService(db)
+    job_service = JobService(db)
+    
+    # Get current user
+    user = await auth_service.get_current_user(credentials.credentials)
+    
+    job = await job_service.get_job(job_id, user_id=user.id)
+    if not job:
+        raise NotFoundError("Job not found")
+    
+    if wait > 0:
+        job = await job_service.wait_for_job(job, wait)
+    
+    recommendation = None
+    if job.recommendation_id:
+        recommendation = await StrategyService(db).get_recommendation_by_id(job.recommendation_id)
+    
+    return _job_response(job, recommendation)
 
 
 @router.get("/recommendations", response_model=List[RecommendationResponse])
 async def get_user_recommendations(
-    limit: int = 10,
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    strategy_type: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    min_risk_score: Optional[float] = Query(None, ge=0.0, le=1.0),
+    max_risk_score: Optional[float] = Query(None, ge=0.0, le=1.0),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    protocol: Optional[str] = None,
+    action: Optional[str] = None,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get user's strategy recommendations history"""
+    """Get user's strategy recommendations history
+    
+    Results are newest first. When more results exist, the `X-Next-Cursor`
+    response header holds the cursor for the next page.
+    """
     auth_service = AuthService(db)
     strategy_service = StrategyService(db)
     
     # Get current user
     user = await auth_service.get_current_user(credentials.credentials)
     
-    # Get user recommendations
-    recommendations = await strategy_service.get_user_recommendations(
+    # Get one page of user recommendations
+    recommendations, next_cursor = await strategy_service.get_recommendation_page(
         user_id=user.id,
-        limit=limit
+        limit=limit,
+        cursor=cursor,
+        strategy_type=strategy_type,
+        status=status_filter,
+        min_risk_score=min_risk_score,
+        max_risk_score=max_risk_score,
+        created_after=created_after,
+        created_before=created_before,
+        protocol=protocol,
+        action=action
     )
     
-    return [
-        RecommendationResponse(
-            id=str(rec.id),
-            strategy_type=rec.strategy_type,
-            risk_score=rec.risk_score,
-            expected_apy=rec.expected_apy,
-            explanation=rec.explanation,
-            status=rec.status,
-            created_at=rec.created_at.isoformat(),
-            raw_input=rec.raw_input,
-            ai_output=rec.ai_output
-        )
-        for rec in recommendations
-    ]
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return [_recommendation_response(rec) for rec in recommendations]
 
 
 @router.get("/recommendations/{recommendation_id}", response_model=RecommendationResponse)
@@ -153,17 +331,12 @@ async def get_recommendation(
             detail="Access denied"
         )
     
-    return RecommendationResponse(
-        id=str(recommendation.id),
-        strategy_type=recommendation.strategy_type,
-        risk_score=recommendation.risk_score,
-        expected_apy=recommendation.expected_apy,
-        explanation=recommendation.explanation,
-        status=recommendation.status,
-        created_at=recommendation.created_at.isoformat(),
-        raw_input=recommendation.raw_input,
-        ai_output=recommendation.ai_output
-    )
+    # Rehydrate archived rows from their archive segment
+    archived_payload = None
+    if recommendation.archived_at is not None:
+        archived_payload = await ArchiveService(db).load_archived(recommendation)
+    
+    return _recommendation_response(recommendation, archived_payload)
 
 
 @router.post("/execute", response_model=ExecutionResponse)
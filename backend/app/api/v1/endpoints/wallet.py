@@ -2,30 +2,38 @@
 Wallet management endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 import uuid
 
+from app.core import serialization
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.exceptions import AuthenticationError, NotFoundError
+from app.core.deadline import request_deadline
+from app.core.exceptions import AuthenticationError, NotFoundError, SatoshiSenseiException, ValidationError
 from app.models.user import User
 from app.models.wallet import Wallet, NetworkType
 from app.services.auth_service import AuthService
 from app.services.wallet_service import WalletService
+from app.services.transaction_service import TransactionService, transaction_cursor
+from app.models.transaction import WalletTransaction
 
 router = APIRouter()
 security = HTTPBearer()
 
 
 class WalletConnectRequest(BaseModel):
-    """Wallet connection request model"""
-    address: str
+    """Wallet connection request model (an address, or an xpub/descriptor for HD wallets)"""
+    address: Optional[str] = None
     network: NetworkType
     label: Optional[str] = None
+    descriptor: Optional[str] = None
+    gap_limit: Optional[int] = Field(None, ge=1, le=200)
 
 
 class WalletResponse(BaseModel):
@@ -36,6 +44,7 @@ class WalletResponse(BaseModel):
     label: Optional[str]
     is_active: bool
     created_at: str
+    descriptor: Optional[str] = None
 
 
 class WalletBalanceResponse(BaseModel):
@@ -59,9 +68,16 @@ async def connect_wallet(
     # Get current user
     user = await auth_service.get_current_user(credentials.credentials)
     
+    address = wallet_data.address
+    descriptor = None
+    if wallet_data.descriptor:
+        address, descriptor = wallet_service.resolve_descriptor(wallet_data.descriptor, wallet_data.network)
+    elif not address:
+        raise ValidationError("An address or descriptor is required")
+    
     # Check if wallet already exists
     existing_wallet = await wallet_service.get_wallet_by_address(
-        wallet_data.address, 
+        address, 
         wallet_data.network
     )
     
@@ -74,9 +90,11 @@ async def connect_wallet(
     # Create new wallet connection
     wallet = await wallet_service.create_wallet(
         user_id=user.id,
-        address=wallet_data.address,
+        address=address,
         network=wallet_data.network,
-        label=wallet_data.label
+        label=wallet_data.label,
+        descriptor=descriptor,
+        gap_limit=wallet_data.gap_limit
     )
     
     return WalletResponse(
@@ -85,7 +103,8 @@ async def connect_wallet(
         network=wallet.network,
         label=wallet.label,
         is_active=wallet.is_active,
-        created_at=wallet.created_at.isoformat()
+        created_at=wallet.created_at.isoformat(),
+        descriptor=wallet.descriptor
     )
 
 
@@ -111,13 +130,18 @@ async def get_user_wallets(
             network=wallet.network,
             label=wallet.label,
             is_active=wallet.is_active,
-            created_at=wallet.created_at.isoformat()
+            created_at=wallet.created_at.isoformat(),
+            descriptor=wallet.descriptor
         )
         for wallet in wallets
     ]
 
 
-@router.get("/{wallet_id}/balances", response_model=WalletBalanceResponse)
+@router.get(
+    "/{wallet_id}/balances",
+    response_model=WalletBalanceResponse,
+    dependencies=[request_deadline(settings.WALLET_REQUEST_DEADLINE_SECONDS)]
+)
 async def get_wallet_balances(
     wallet_id: str,
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -153,6 +177,69 @@ async def get_wallet_balances(
     )
 
 
+@router.get("/{wallet_id}/transactions")
+async def stream_wallet_transactions(
+    wallet_id: str,
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream a wallet's confirmed transactions, newest first, as NDJSON
+    
+    Each line carries a `cursor`; pass the last one received to resume.
+    Without `limit` the whole history is streamed. An upstream failure
+    mid-stream ends the stream with an `{"error": ...}` line.
+    """
+    auth_service = AuthService(db)
+    wallet_service = WalletService(db)
+    
+    # Get current user
+    user = await auth_service.get_current_user(credentials.credentials)
+    
+    # Get wallet
+    wallet = await wallet_service.get_wallet_by_id(uuid.UUID(wallet_id))
+    
+    if not wallet:
+        raise NotFoundError("Wallet not found")
+    
+    if wallet.user_id != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    # Read the first transaction up front so sync and cursor errors get a proper status
+    transactions = TransactionService(db).iter_transactions(wallet, cursor=cursor, limit=limit)
+    try:
+        first = await transactions.__anext__()
+    except StopAsyncIteration:
+        first = None
+    
+    async def ndjson():
+        if first is None:
+            return
+        yield _transaction_line(first)
+        try:
+            async for transaction in transactions:
+                yield _transaction_line(transaction)
+        except SatoshiSenseiException as e:
+            yield serialization.dumps({"error": e.detail}) + b"\n"
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+def _transaction_line(transaction: WalletTransaction) -> bytes:
+    """One NDJSON line for a stored transaction"""
+    return serialization.dumps({
+        "txid": transaction.txid,
+        "block_height": transaction.block_height,
+        "block_time": transaction.block_time.isoformat() if transaction.block_time else None,
+        "cursor": transaction_cursor(transaction),
+        "transaction": transaction.data
+    }) + b"\n"
+
+
 @router.delete("/{wallet_id}")
 async def disconnect_wallet(
     wallet_id: str,
@@ -0,0 +1,276 @@
+"""
+Caching with an in-process LRU tier and an optional shared Redis tier
+"""
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import random
+import time
+
+from app.core import serialization
+from app.core.config import settings
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # pragma: no cover - Redis is optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Bounded LRU mapping with per-entry expiry"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Any:
+        """Return the cached value or `_MISSING`"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a value for `ttl` seconds, evicting the least recently used entry if full"""
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def delete(self, key: str) -> None:
+        """Remove a key if present"""
+        self._entries.pop(key, None)
+    
+    def clear(self) -> None:
+        """Remove all entries"""
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared Redis tier that steps aside for a while after connection errors"""
+    
+    def __init__(self, url: str, retry_after: float = 30.0):
+        self.url = url
+        self.retry_after = retry_after
+        self._client = None
+        self._down_until = 0.0
+    
+    @property
+    def client(self):
+        """Lazily created Redis client"""
+        if self._client is None:
+            self._client = redis.from_url(self.url)
+        return self._client
+    
+    @property
+    def available(self) -> bool:
+        """Whether Redis should be tried right now"""
+        return time.monotonic() >= self._down_until
+    
+    async def get(self, key: str) -> Any:
+        """Return the cached value, `_MISSING`, or `_MISSING` when Redis is down"""
+        if not self.available:
+            return _MISSING
+        try:
+            data = await self.client.get(key)
+        except Exception as e:
+            self._mark_down(e)
+            return _MISSING
+        return _MISSING if data is None else serialization.loads(data)
+    
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a JSON-serializable value for `ttl` seconds"""
+        if not self.available:
+            return
+        try:
+            await self.client.set(key, serialization.dumps(value), px=max(int(ttl * 1000), 1))
+        except Exception as e:
+            self._mark_down(e)
+    
+    async def delete(self, key: str) -> None:
+        """Remove a key if present"""
+        if not self.available:
+            return
+        try:
+            await self.client.delete(key)
+        except Exception as e:
+            self._mark_down(e)
+    
+    async def close(self) -> None:
+        """Close the Redis connection pool"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+    
+    def _mark_down(self, error: Exception) -> None:
+        logger.warning("Redis cache unavailable, using local cache only: %s", error)
+        self._down_until = time.monotonic() + self.retry_after
+
+
+class Cache:
+    """Namespaced cache with TTL jitter and stampede protection
+    
+    Reads check the local LRU tier, then Redis when configured. Values written
+    to Redis must be JSON-serializable, and cached values should be treated as
+    read-only since the local tier hands out the stored object itself.
+    """
+    
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float,
+        max_entries: int,
+        remote: Optional[RedisBackend] = None,
+        jitter: float = 0.1
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.jitter = jitter
+        self.local = MemoryBackend(max_entries)
+        self.remote = remote
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    def key(self, key: str) -> str:
+        """Fully qualified key for the shared tier"""
+        return f"{settings.CACHE_KEY_PREFIX}:{self.namespace}:{key}"
+    
+    async def get(self, key: str, default: Any = None) -> Any:
+        """Get a cached value"""
+        value = await self._get(key)
+        return default if value is _MISSING else value
+    
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, shared: bool = True) -> None:
+        """Cache a value for `ttl` seconds (jittered), in this process only unless `shared`"""
+        ttl = self._jittered(ttl)
+        self.local.set(key, value, ttl)
+        if shared and self.remote is not None:
+            await self.remote.set(self.key(key), value, ttl)
+    
+    async def delete(self, key: str) -> None:
+        """Invalidate a cached value"""
+        self.local.delete(key)
+        if self.remote is not None:
+            await self.remote.delete(self.key(key))
+    
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[T]],
+        ttl: Optional[float] = None,
+        shared: bool = True
+    ) -> T:
+        """Return the cached value, computing and caching it on a miss
+        
+        Concurrent misses for the same key in this process share a single
+        `compute` call. Exceptions are propagated and nothing is cached. If
+        the caller running `compute` is cancelled, a waiting caller runs its
+        own `compute` instead of inheriting the cancellation. Keys whose
+        meaning is local to this process should pass `shared=False` to skip
+        the shared tier.
+        """
+        while True:
+            value = await self._get(key, shared)
+            if value is not _MISSING:
+                return value
+            
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Re-raise our own cancellation; take over from a cancelled owner
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            await self.set(key, value, ttl, shared)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters receive the exception; mark it retrieved for this owner
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    def clear(self) -> None:
+        """Drop the local tier (the shared tier expires on its own)"""
+        self.local.clear()
+    
+    async def _get(self, key: str, shared: bool = True) -> Any:
+        value = self.local.get(key)
+        if value is _MISSING and shared and self.remote is not None:
+            value = await self.remote.get(self.key(key))
+            if value is not _MISSING:
+                self.local.set(key, value, self._jittered(None))
+        return value
+    
+    def _jittered(self, ttl: Optional[float]) -> float:
+        ttl = self.ttl if ttl is None else ttl
+        return ttl * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+def _create_remote() -> Optional[RedisBackend]:
+    """Shared tier for the configured cache backend"""
+    if settings.CACHE_BACKEND != "redis":
+        return None
+    if redis is None:
+        logger.warning("CACHE_BACKEND=redis but the redis package is missing, using memory cache")
+        return None
+    return RedisBackend(settings.REDIS_URL)
+
+
+remote_backend = _create_remote()
+_caches: Dict[str, Cache] = {}
+
+
+def get_cache(namespace: str, ttl: Optional[float] = None, max_entries: Optional[int] = None) -> Cache:
+    """Get the process-wide cache for a namespace, creating it on first use"""
+    cache = _caches.get(namespace)
+    if cache is None:
+        cache = Cache(
+            namespace,
+            ttl=settings.REDIS_CACHE_TTL if ttl is None else ttl,
+            max_entries=max_entries or settings.CACHE_MAX_ENTRIES,
+            remote=remote_backend,
+            jitter=settings.CACHE_TTL_JITTER
+        )
+        _caches[namespace] = cache
+    return cache
+
+
+def clear_caches() -> None:
+    """Clear every local cache tier (used by tests)"""
+    for cache in _caches.values():
+        cache.clear()
+
+
+async def close_cache() -> None:
+    """Close the shared cache tier"""
+    if remote_backend is not None:
+        await remote_backend.close()
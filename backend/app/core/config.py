@@ -33,28 +33,150 @@ class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./satoshi_sensei.db"
     DATABASE_TEST_URL: str = "sqlite:///./satoshi_sensei_test.db"
     
+    # Group commit for high-rate inserts
+    WRITE_COALESCE_ENABLED: bool = False
+    WRITE_COALESCE_MAX_ROWS: int = 100
+    WRITE_COALESCE_MAX_DELAY_MS: int = 10
+    
+    # Recommendation retention
+    RECOMMENDATION_RETENTION_DAYS: int = 180
+    RECOMMENDATION_ARCHIVE_DIR: str = "./data/archive"
+    RECOMMENDATION_ARCHIVE_BATCH_SIZE: int = 500
+    RECOMMENDATION_ARCHIVE_INTERVAL_HOURS: int = 0  # 0 disables the background job
+    
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     REDIS_CACHE_TTL: int = 300  # 5 minutes
     
+    # Cache
+    CACHE_BACKEND: str = "memory"  # memory or redis (local LRU tier is always used)
+    CACHE_KEY_PREFIX: str = "satoshi"
+    CACHE_MAX_ENTRIES: int = 10000  # Per namespace, local tier
+    CACHE_TTL_JITTER: float = 0.1  # Fraction of TTL randomized to spread expiry
+    WALLET_BALANCE_CACHE_TTL: int = 30
+    MARKET_DATA_CACHE_TTL: int = 60
+    EDUCATION_CACHE_TTL: int = 3600
+    AUTH_USER_CACHE_TTL: int = 60
+    WALLET_TRANSACTION_CACHE_TTL: int = 30  # Minimum interval between history syncs per wallet
+    
+    # Strategy LLM output cache, keyed on normalized inputs (0 TTL disables)
+    STRATEGY_CACHE_TTL: int = 900
+    STRATEGY_CACHE_MAX_ENTRIES: int = 2000
+    STRATEGY_CACHE_AMOUNT_STEP: float = 0.25  # Width of the log-scale buckets holdings are rounded to
+    STRATEGY_PROMPT_TOP_POOLS: int = 15  # Pools kept in the prompt, most relevant first
+    
+    # Change detection: reuse a user's last recommendation while its inputs hold (0 max age disables)
+    STRATEGY_REUSE_MAX_AGE: int = 3600
+    STRATEGY_REUSE_PORTFOLIO_THRESHOLD: float = 0.05  # Relative change in any holding or the amount
+    STRATEGY_REUSE_APY_THRESHOLD: float = 1.0  # Percentage points, per pool
+    STRATEGY_REUSE_TVL_THRESHOLD: float = 0.1  # Relative change, per pool
+    
+    # Recommendation jobs (queued generation, run by a worker pool in each process)
+    RECOMMENDATION_JOB_WORKERS: int = 4  # Jobs run at once per process (0 leaves them to other processes)
+    RECOMMENDATION_JOB_POLL_SECONDS: float = 2.0  # How often idle workers look for jobs queued elsewhere
+    RECOMMENDATION_JOB_MAX_ATTEMPTS: int = 2
+    RECOMMENDATION_JOB_STALE_SECONDS: int = 600  # Running jobs older than this are requeued (their worker died)
+    RECOMMENDATION_JOB_MAX_WAIT_SECONDS: int = 30  # Longest long-poll on a job's status
+    
+    # Nightly batch recommendations for every active user
+    BATCH_RECOMMENDATIONS_ENABLED: bool = False
+    BATCH_RECOMMENDATION_HOUR: int = 3  # UTC hour the nightly run starts
+    BATCH_CHUNK_SIZE: int = 100  # Users loaded, and rows committed with each checkpoint, at a time
+    BATCH_BALANCE_CONCURRENCY: int = 16  # Wallet balance fetches in flight
+    BATCH_LLM_CONCURRENCY: int = 4  # LLM calls in flight; the rate is capped by LLM_RATE_PER_MINUTE
+    BATCH_RUN_STALE_SECONDS: int = 1800  # Unfinished runs without a checkpoint this long are resumed elsewhere
+    BATCH_RETRY_SECONDS: int = 60  # First wait before retrying a failed or unfinished run (doubles each time)
+    BATCH_RETRY_MAX_SECONDS: int = 3600
+    
+    # Bitcoin UTXO index (per process, updated incrementally)
+    UTXO_INDEX_MAX_WALLETS: int = 1000
+    UTXO_INDEX_TTL: int = 86400  # Idle sets are dropped after this
+    
+    # HD (xpub/descriptor) wallets
+    HD_WALLET_GAP_LIMIT: int = 20
+    HD_WALLET_SCAN_CONCURRENCY: int = 8  # Address probes in flight per scan
+    HD_WALLET_MAX_ADDRESSES: int = 1000  # Per branch
+    
+    # Local transaction history
+    TRANSACTION_SYNC_MAX_PAGES: int = 10  # Upstream pages fetched per delta sync
+    TRANSACTION_BACKFILL_MAX_PAGES: int = 5  # Older pages fetched per history read
+    
+    # Chain-tip watcher (keys on-chain caches by block height)
+    CHAIN_TIP_WATCH_ENABLED: bool = False
+    CHAIN_TIP_POLL_SECONDS: int = 10
+    CHAIN_TIP_CACHE_TTL: int = 600  # Upper bound while the tip is tracked
+    CHAIN_TIP_PENDING_TTL: int = 60  # Upper bound while the mempool cannot be fully scanned
+    CHAIN_TIP_MAX_WATCHED: int = 100000  # Watched addresses per network before the whole network is invalidated
+    
     # Groq API
     GROQ_API_KEY: str = ""
     GROQ_MODEL: str = "llama3-8b-8192"
+    GROQ_TIMEOUT: float = 5.0
+    
+    # LLM gateway (any OpenAI-compatible API; Groq by default)
+    LLM_BASE_URL: str = "https://api.groq.com/openai/v1"
+    LLM_MAX_RETRIES: int = 2  # On 429/5xx, honouring Retry-After
+    LLM_RETRY_BACKOFF: float = 0.5  # Base of the jittered backoff when there is no Retry-After
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_CONTEXT_WINDOW: int = 8192  # Prompt plus completion tokens of the model
+    LLM_MAX_COMPLETION_TOKENS: int = 2000
+    LLM_MIN_COMPLETION_TOKENS: int = 512  # Reserved before optional prompt sections are cut
+    LLM_TOKEN_ESTIMATE_MARGIN: float = 0.1  # Headroom for error in the local token estimate
+    LLM_PROMPT_COST_PER_MILLION: float = 0.05  # USD per million prompt tokens, for cost reports
+    LLM_COMPLETION_COST_PER_MILLION: float = 0.08  # USD per million completion tokens
+    
+    # Outbound rate governor (0 = no fixed rate; upstream rate-limit headers always apply)
+    LLM_RATE_PER_MINUTE: int = 30
+    STACKS_API_RATE_PER_MINUTE: int = 0  # Per endpoint host in STACKS_API_URLS
+    BITCOIN_API_RATE_PER_MINUTE: int = 0  # Per endpoint host in BITCOIN_API_URLS
     
     # Stacks Network
     STACKS_NETWORK: str = "testnet"  # mainnet or testnet
     STACKS_API_URL: str = "https://api.testnet.hiro.so"
+    STACKS_API_URLS: List[str] = []  # Equivalent endpoints; defaults to [STACKS_API_URL]
     STACKS_EXPLORER_URL: str = "https://explorer.stacks.co"
     
     # Bitcoin
     BITCOIN_NETWORK: str = "testnet"  # mainnet or testnet
     BITCOIN_API_URL: str = "https://blockstream.info/testnet/api"
+    BITCOIN_API_URLS: List[str] = []  # Equivalent endpoints; defaults to [BITCOIN_API_URL]
+    BITCOIN_BACKEND: str = "esplora"  # esplora (BITCOIN_API_URL) or electrum
+    ELECTRUM_HOST: str = "electrum.blockstream.info"
+    ELECTRUM_PORT: int = 60002
+    ELECTRUM_SSL: bool = True
+    ELECTRUM_TIMEOUT: float = 10.0
+    ELECTRUM_MAX_MESSAGE_BYTES: int = 16 * 1024 * 1024  # Longest response line (e.g. a busy address's history)
+    ELECTRUM_MAX_SUBSCRIPTIONS: int = 10000  # Subscriptions kept for replay on reconnect, least recently used dropped
+    
+    # Upstream endpoint pools (failover and latency-based selection)
+    UPSTREAM_EWMA_ALPHA: float = 0.2  # Weight of the newest latency/error sample
+    UPSTREAM_MAX_ERROR_RATE: float = 0.5  # Endpoints above this are demoted until a probe succeeds
+    UPSTREAM_PROBE_SECONDS: int = 30
+    UPSTREAM_TIMEOUT: float = 5.0  # Per attempt
+    UPSTREAM_BREAKER_FAILURES: int = 5  # Consecutive failures that open an endpoint's circuit
+    UPSTREAM_BREAKER_RESET_SECONDS: int = 30  # Open time before a half-open trial request
+    UPSTREAM_HEDGE_ENABLED: bool = False  # Resend GETs still unanswered after the p95 latency
+    UPSTREAM_HEDGE_MIN_DELAY: float = 0.05
+    UPSTREAM_RETRIES: int = 2  # Extra passes over the endpoints for failed GETs
+    UPSTREAM_RETRY_BACKOFF: float = 0.2  # Base of the jittered exponential backoff, in seconds
+    
+    # Request deadlines (budget shared by every upstream call of a request)
+    REQUEST_TIMEOUT_MAX_SECONDS: float = 60.0  # Cap on the X-Request-Timeout header
+    WALLET_REQUEST_DEADLINE_SECONDS: float = 15.0
+    STRATEGY_REQUEST_DEADLINE_SECONDS: float = 30.0
     
     # DeFi APIs
     ALEX_API_URL: str = "https://api.alexlab.co/v1"
     ARKADIKO_API_URL: str = "https://api.arkadiko.finance"
     VELAR_API_URL: str = "https://api.velar.co"
     
+    # Shared market snapshot (one refresher, read by every worker)
+    MARKET_SNAPSHOT_ENABLED: bool = False
+    MARKET_SNAPSHOT_PATH: str = "/dev/shm/satoshi-sensei-market.snap"
+    MARKET_SNAPSHOT_CAPACITY: int = 4096  # Pool rows per slot
+    MARKET_SNAPSHOT_REFRESH_SECONDS: int = 30
+    MARKET_SNAPSHOT_MAX_AGE: int = 120  # Older snapshots are ignored
+    
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = 100
     RATE_LIMIT_WINDOW: int = 60  # seconds
@@ -2,15 +2,23 @@
 Database configuration and session management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, DateTime
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-import redis.asyncio as redis
-from typing import AsyncGenerator
+from sqlalchemy.sql.functions import FunctionElement
+from typing import AsyncGenerator, Optional
 import os
 
 from app.core.config import settings
+from app.core import serialization
+from app.core.cache import remote_backend, close_cache
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Schema revision of databases created before migrations were added
+BASELINE_REVISION = "0001"
 
 # SQLite setup
 database_url = settings.DATABASE_URL
@@ -22,6 +30,8 @@ engine = create_async_engine(
     database_url,
     echo=settings.DEBUG,
     future=True,
+    json_serializer=serialization.json_serializer,
+    json_deserializer=serialization.json_deserializer,
     connect_args={"check_same_thread": False} if "sqlite" in database_url else {}
 )
 
@@ -33,8 +43,27 @@ SessionLocal = sessionmaker(
 
 Base = declarative_base()
 
-# Redis setup
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+class utcnow(FunctionElement):
+    """Current UTC time as a server default, stored like ORM-written datetimes
+    
+    SQLite keeps DateTime as text, and ORM binds always carry microseconds
+    (`2024-01-01 10:00:00.000000`) while CURRENT_TIMESTAMP does not. Columns
+    that are compared with bound datetimes (keyset cursors) need one format.
+    """
+    inherit_cache = True
+    type = DateTime()
+    name = "utcnow"
+
+
+@compiles(utcnow)
+def _compile_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, "sqlite")
+def _compile_utcnow_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
@@ -46,20 +75,41 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
-async def get_redis() -> redis.Redis:
-    """Dependency to get Redis client"""
-    return redis_client
+async def get_redis() -> Optional[object]:
+    """Dependency to get the Redis client, or None when the cache runs in memory"""
+    return remote_backend.client if remote_backend is not None else None
 
 
 async def init_db():
-    """Initialize database tables"""
+    """Create the schema on a new database, or migrate an existing one to the latest revision"""
     async with engine.begin() as conn:
         # Import all models to ensure they're registered
-        from app.models import user, wallet, recommendation
-        await conn.run_sync(Base.metadata.create_all)
+        from app.models import user, wallet, recommendation, blob, transaction, job
+        await conn.run_sync(_migrate)
+
+
+def _migrate(connection) -> None:
+    """Bring the schema up to the head Alembic revision"""
+    from alembic import command
+    from alembic.config import Config
+    
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    config.attributes["connection"] = connection
+    
+    tables = set(inspect(connection).get_table_names())
+    if not tables:
+        Base.metadata.create_all(connection)
+        command.stamp(config, "head")
+        return
+    if "alembic_version" not in tables:
+        # Created by create_all before migrations existed: either the original
+        # schema, or the blob-based one that revision 0002 migrates to
+        command.stamp(config, "0002" if "blobs" in tables else BASELINE_REVISION)
+    command.upgrade(config, "head")
 
 
 async def close_db():
     """Close database connections"""
     await engine.dispose()
-    await redis_client.close()
+    await close_cache()
@@ -0,0 +1,80 @@
+"""
+Per-request deadline budgets shared by every upstream call a request makes
+"""
+
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+import time
+
+from fastapi import Depends
+
+from app.core.exceptions import DeadlineExceededError
+
+# Monotonic time by which the current request must finish (None: no budget)
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, or None if it has none"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def narrow(seconds: float) -> None:
+    """Limit the current request's budget to `seconds` from now (never extends it)"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is None or deadline < current:
+        _deadline.set(deadline)
+
+
+def timeout(default: float) -> float:
+    """Timeout for one upstream call: `default`, capped by the remaining budget"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceededError()
+    return min(default, left)
+
+
+def request_deadline(seconds: float) -> Any:
+    """Route dependency giving an endpoint a budget of `seconds` (or less, if the client asked)"""
+    async def dependency() -> None:
+        narrow(seconds)
+    return Depends(dependency)
+
+
+class DeadlineMiddleware:
+    """Starts each request's budget from its `X-Request-Timeout` header (seconds)
+    
+    The header is capped at `maximum`; without it the request has no
+    budget until an endpoint sets one with `request_deadline`.
+    """
+    
+    def __init__(self, app: Callable, maximum: float):
+        self.app = app
+        self.maximum = maximum
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        deadline = None
+        header = dict(scope.get("headers") or []).get(b"x-request-timeout")
+        if header is not None:
+            try:
+                seconds = float(header)
+            except ValueError:
+                seconds = None
+            if seconds is not None and seconds > 0:
+                deadline = time.monotonic() + min(seconds, self.maximum)
+        
+        token = _deadline.set(deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
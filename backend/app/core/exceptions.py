@@ -49,6 +49,22 @@ class ExternalAPIError(SatoshiSenseiException):
         super().__init__(detail, status.HTTP_502_BAD_GATEWAY)
 
 
+class CircuitOpenError(ExternalAPIError):
+    """Upstream skipped because its circuit breaker is open"""
+    
+    def __init__(self, detail: str = "Upstream temporarily unavailable"):
+        super().__init__(detail)
+        self.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+class DeadlineExceededError(ExternalAPIError):
+    """Request budget ran out before the upstream work finished"""
+    
+    def __init__(self, detail: str = "Request deadline exceeded"):
+        super().__init__(detail)
+        self.status_code = status.HTTP_504_GATEWAY_TIMEOUT
+
+
 class BlockchainError(SatoshiSenseiException):
     """Blockchain related errors"""
     
@@ -0,0 +1,29 @@
+"""
+Opaque cursor helpers for keyset pagination
+"""
+
+from typing import Any, List
+import base64
+import binascii
+import json
+
+from app.core.exceptions import ValidationError
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode keyset values into an opaque URL-safe cursor"""
+    raw = json.dumps(list(values), separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor produced by `encode_cursor`, expecting `size` values"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise ValidationError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValidationError("Invalid cursor")
+    return values
+
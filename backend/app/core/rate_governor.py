@@ -0,0 +1,230 @@
+"""
+Process-wide outbound rate governor with priority lanes per upstream
+"""
+
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import re
+import time
+
+from fastapi import Depends
+
+from app.core import deadline
+from app.core.exceptions import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Outbound request lanes; lower values are served first"""
+    
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+# Lane of the current request or task
+_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.NORMAL)
+
+# Headers carrying the remaining quota and the time until it resets, most specific first
+REMAINING_HEADERS = (
+    "x-ratelimit-remaining-requests", "x-ratelimit-remaining-minute", "x-ratelimit-remaining", "ratelimit-remaining"
+)
+RESET_HEADERS = ("x-ratelimit-reset-requests", "x-ratelimit-reset", "ratelimit-reset")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def current_priority() -> Priority:
+    """Lane of the current request or task"""
+    return _priority.get()
+
+
+def set_priority(priority: Priority) -> None:
+    """Put the rest of the current request or task in a lane"""
+    _priority.set(priority)
+
+
+def request_priority(priority: Priority) -> Any:
+    """Route dependency putting an endpoint's outbound calls in a lane"""
+    async def dependency() -> None:
+        set_priority(priority)
+    return Depends(dependency)
+
+
+class RateGovernor:
+    """Token bucket for one upstream, served in priority order
+    
+    `rate_per_minute` refills the bucket (0 means no fixed rate; only the
+    upstream's own signals apply). Callers that cannot take a token wait
+    in a queue ordered by lane, then arrival, so background work never
+    gets ahead of interactive requests. Rate-limit headers and 429s from
+    the upstream shrink the bucket or pause it until the quota resets.
+    """
+    
+    def __init__(self, name: str, rate_per_minute: float = 0, burst: Optional[int] = None):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute // 6)))
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.metrics = {
+            lane.name.lower(): {"requests": 0, "queued": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for lane in Priority
+        }
+    
+    async def acquire(self, priority: Optional[Priority] = None) -> None:
+        """Wait for a token in the caller's lane (bounded by the request deadline)"""
+        priority = current_priority() if priority is None else priority
+        lane = self.metrics[priority.name.lower()]
+        lane["requests"] += 1
+        if not self._waiters and self._take():
+            return
+        
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        lane["queued"] += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, deadline.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError(f"Request deadline exceeded waiting for {self.name} rate limit")
+        finally:
+            waited = time.monotonic() - started
+            lane["wait_seconds"] += waited
+            lane["max_wait_seconds"] = max(lane["max_wait_seconds"], waited)
+    
+    @property
+    def paused(self) -> bool:
+        """Whether the upstream asked for no requests until its quota resets"""
+        return time.monotonic() < self.paused_until
+    
+    def update(self, headers: Mapping[str, str], status_code: Optional[int] = None) -> None:
+        """Apply the quota an upstream reported in its response headers"""
+        now = time.monotonic()
+        remaining = _header_number(headers, REMAINING_HEADERS)
+        reset = _header_seconds(headers, RESET_HEADERS)
+        if remaining is not None:
+            self._refill(now)
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset:
+                self._pause(now + reset)
+        if status_code == 429:
+            retry_after = _header_seconds(headers, ("retry-after",))
+            if retry_after is None:
+                retry_after = reset if reset is not None else 1.0
+            self._pause(now + retry_after)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue and wait metrics for monitoring"""
+        now = time.monotonic()
+        return {
+            "queued": sum(1 for _, _, future in self._waiters if not future.done()),
+            "paused_seconds": round(max(self.paused_until - now, 0.0), 3),
+            "lanes": {
+                name: {
+                    **lane,
+                    "wait_seconds": round(lane["wait_seconds"], 3),
+                    "max_wait_seconds": round(lane["max_wait_seconds"], 3)
+                }
+                for name, lane in self.metrics.items()
+            }
+        }
+    
+    def _pause(self, until: float) -> None:
+        if until > self.paused_until:
+            self.paused_until = until
+            logger.info("Pausing %s requests for %.1fs", self.name, until - time.monotonic())
+    
+    def _refill(self, now: float) -> None:
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def _take(self) -> bool:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        if not self.rate:
+            return True
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def _dispatch(self) -> None:
+        """Release queued callers in lane order while tokens last, then wait for the next token"""
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():  # Cancelled or timed out
+                heapq.heappop(self._waiters)
+                continue
+            if not self._take():
+                break
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+        
+        if self._waiters and self._timer is None:
+            now = time.monotonic()
+            delay = max(self.paused_until - now, (1 - self.tokens) / self.rate if self.rate else 0.0, 0.001)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+    
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+
+def _header_number(headers: Mapping[str, str], names: Tuple[str, ...]) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                continue
+    return None
+
+
+def _header_seconds(headers: Mapping[str, str], names: Tuple[str, ...]) -> Optional[float]:
+    """Durations such as "12", "1.5s", "250ms" or "2m59.56s"; epoch timestamps become offsets"""
+    for name in names:
+        value = headers.get(name)
+        if not isinstance(value, str):
+            continue
+        value = value.strip()
+        try:
+            seconds = float(value)
+        except ValueError:
+            parts = _DURATION_PART.findall(value)
+            if not parts:
+                continue
+            units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+            seconds = sum(float(number) * units[unit] for number, unit in parts)
+        if seconds > 1e9:
+            seconds -= time.time()
+        return max(seconds, 0.0)
+    return None
+
+
+# Governors by upstream name (one per process)
+governors: Dict[str, RateGovernor] = {}
+
+
+def get_governor(name: str, rate_per_minute: float = 0, burst: Optional[int] = None) -> RateGovernor:
+    """Process-wide governor for an upstream, created on first use"""
+    governor = governors.get(name)
+    if governor is None:
+        governor = RateGovernor(name, rate_per_minute, burst)
+        governors[name] = governor
+    return governor
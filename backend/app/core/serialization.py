@@ -0,0 +1,94 @@
+"""
+JSON serialization and compression helpers
+"""
+
+from typing import Any, Optional, Tuple
+import hashlib
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zlib fallback
+    zstandard = None
+
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+CODEC_NONE = "none"
+
+# Payloads smaller than this are stored as-is; compression overhead outweighs the gain
+COMPRESSION_MIN_BYTES = 256
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize an object to canonical (sorted-key, compact) JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+            default=str
+        )
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+def loads(data: Any) -> Any:
+    """Deserialize JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_serializer(obj: Any) -> str:
+    """JSON serializer for SQLAlchemy JSON columns"""
+    return dumps(obj).decode()
+
+
+def json_deserializer(data: str) -> Any:
+    """JSON deserializer for SQLAlchemy JSON columns"""
+    return loads(data)
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest used as a content address"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def best_codec() -> str:
+    """Best compression codec available in this environment"""
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def compress(data: bytes, codec: Optional[str] = None) -> Tuple[str, bytes]:
+    """Compress bytes, returning (codec, payload)
+    
+    Without an explicit codec, small inputs are left uncompressed and larger
+    ones use the best available codec.
+    """
+    if codec is None:
+        codec = CODEC_NONE if len(data) < COMPRESSION_MIN_BYTES else best_codec()
+    if codec == CODEC_NONE:
+        return CODEC_NONE, data
+    if codec == CODEC_ZSTD:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=10).compress(data)
+    if codec == CODEC_ZLIB:
+        return CODEC_ZLIB, zlib.compress(data, 9)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """Decompress bytes produced by `compress`"""
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed data")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
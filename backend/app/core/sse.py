@@ -0,0 +1,51 @@
+"""
+Server-sent events responses
+"""
+
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+import logging
+
+from fastapi.responses import StreamingResponse
+
+from app.core import serialization
+from app.core.exceptions import SatoshiSenseiException
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One SSE message with a JSON payload"""
+    return f"event: {event}\ndata: {serialization.dumps(data).decode()}\n\n"
+
+
+async def _encode(
+    events: AsyncIterator[Tuple[str, Any]],
+    transform: Optional[Callable[[str, Any], Tuple[str, Any]]]
+) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            if transform is not None:
+                event, data = transform(event, data)
+            yield sse_event(event, data)
+    except SatoshiSenseiException as e:
+        # Headers are already sent, so errors travel as an event
+        yield sse_event("error", {"detail": e.detail, "status_code": e.status_code})
+    except Exception:
+        logger.exception("Event stream failed")
+        yield sse_event("error", {"detail": "Internal server error", "status_code": 500})
+
+
+def sse_response(
+    events: AsyncIterator[Tuple[str, Any]],
+    transform: Optional[Callable[[str, Any], Tuple[str, Any]]] = None
+) -> StreamingResponse:
+    """Stream `(event, data)` pairs as server-sent events
+    
+    `transform` can rename an event or convert its data (e.g. a model row
+    into its response schema) before it is encoded.
+    """
+    return StreamingResponse(
+        _encode(events, transform),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,426 @@
+"""
+Failover pools of equivalent upstream API endpoints with latency-based selection
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+import asyncio
+import logging
+import random
+import time
+import httpx
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.exceptions import CircuitOpenError, DeadlineExceededError
+from app.core.rate_governor import RateGovernor, get_governor
+
+logger = logging.getLogger(__name__)
+
+# Besides 5xx, statuses that fault the endpoint rather than the request
+ENDPOINT_FAILURE_STATUS = {408, 429}
+
+# Recent response times kept per pool, and the number needed before hedging
+HEDGE_LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+class CircuitBreaker:
+    """Stops traffic to an upstream after repeated consecutive failures
+    
+    After `failure_threshold` failures in a row the circuit opens and
+    requests are refused without being sent. Once `reset_timeout` seconds
+    have passed it is half-open: a single trial request is let through,
+    and its outcome closes the circuit or opens it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+    
+    def allow(self) -> bool:
+        """Whether a request may be sent now (claims the trial slot when half-open)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+    
+    def release(self) -> None:
+        """Give back a trial slot whose request was abandoned without an outcome"""
+        self._trial_in_flight = False
+    
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+    
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit opened after %d failures", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class Endpoint:
+    """One upstream base URL, its observed health and its rate-limit quota"""
+    
+    def __init__(self, url: str, breaker: Optional[CircuitBreaker] = None, governor: Optional[RateGovernor] = None):
+        self.url = url.rstrip("/")
+        self.breaker = breaker or CircuitBreaker()
+        self.governor = governor or RateGovernor(self.url)
+        self.latency: Optional[float] = None  # EWMA of successful response times, in seconds
+        self.error_rate = 0.0  # EWMA of failed requests (0 = none, 1 = all)
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+    
+    @property
+    def score(self) -> float:
+        """Expected cost of a request, lower is better; unmeasured endpoints are tried first"""
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(1.0 - self.error_rate, 0.01)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Health summary for monitoring"""
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "paused": self.governor.paused,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+class EndpointPool:
+    """Equivalent endpoints for one upstream API
+    
+    Requests go to the healthy endpoint with the lowest score and fail
+    over to the next one on connection errors, timeouts and 5xx/429
+    responses. Each endpoint keeps an EWMA of its latency and error rate;
+    one whose error rate passes `max_error_rate` is demoted and receives
+    no traffic (unless every endpoint is demoted) until a background
+    probe of `probe_path` succeeds. Each endpoint also has a circuit
+    breaker, so an upstream that keeps failing is skipped outright.
+    
+    Rate limits are per endpoint host: each has its own governor (shared
+    by every pool on that host), so a 429 from one provider pauses only
+    that provider. Paused endpoints rank after the others, and requests
+    that do go to one wait in its priority queue.
+    
+    With hedging on, a GET still unanswered after the pool's observed p95
+    latency is sent again (to the next endpoint, or the same one if there
+    is no other) and the first answer wins, so one slow response does not
+    set the request's latency.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        urls: List[str],
+        probe_path: str,
+        alpha: float = 0.2,
+        max_error_rate: float = 0.5,
+        breaker_failures: int = 5,
+        breaker_reset: float = 30.0,
+        hedge: bool = False,
+        timeout: Optional[float] = None,
+        rate_per_minute: float = 0
+    ):
+        if not urls:
+            raise ValueError(f"Upstream pool {name} needs at least one endpoint")
+        self.name = name
+        self.endpoints = [
+            Endpoint(
+                url,
+                CircuitBreaker(breaker_failures, breaker_reset),
+                get_governor(httpx.URL(url).host, rate_per_minute)
+            )
+            for url in dict.fromkeys(urls)
+        ]
+        self.probe_path = probe_path
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.hedge = hedge
+        self.timeout = timeout
+        self.hedges = 0
+        self._latencies: "deque[float]" = deque(maxlen=HEDGE_LATENCY_WINDOW)
+    
+    @property
+    def base_url(self) -> str:
+        """URL of the endpoint requests currently go to first"""
+        return self.ranked()[0].url
+    
+    def ranked(self) -> List[Endpoint]:
+        """Endpoints in the order they are tried: healthy by score, then demoted by score
+        
+        Within each group, endpoints paused by their rate limit come last.
+        """
+        return sorted(
+            self.endpoints,
+            key=lambda endpoint: (not endpoint.healthy, endpoint.governor.paused, endpoint.score)
+        )
+    
+    def hedge_delay(self) -> Optional[float]:
+        """p95 of recent successful response times, or None until enough are observed"""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return max(p95, settings.UPSTREAM_HEDGE_MIN_DELAY)
+    
+    def record(self, endpoint: Endpoint, ok: bool, latency: Optional[float] = None) -> None:
+        """Update an endpoint's EWMAs and circuit breaker with the outcome of one request"""
+        endpoint.requests += 1
+        endpoint.error_rate += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+        if ok:
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.record_failure()
+        if ok and latency is not None:
+            self._latencies.append(latency)
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += self.alpha * (latency - endpoint.latency)
+        if not ok:
+            endpoint.failures += 1
+            if endpoint.healthy and endpoint.error_rate > self.max_error_rate:
+                endpoint.healthy = False
+                logger.warning("Demoted %s endpoint %s", self.name, endpoint.url)
+    
+    async def get(self, client: httpx.AsyncClient, path: str, **kwargs: Any) -> httpx.Response:
+        """GET `path` from the best endpoint, failing over to the others"""
+        return await self.request(client, "GET", path, **kwargs)
+    
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        path: str,
+        hedge: Optional[bool] = None,
+        **kwargs: Any
+    ) -> httpx.Response:
+        """Send a request to the best endpoint, failing over to the others
+        
+        Returns the first response that is not an endpoint failure (it may
+        still be a 4xx, for the caller to handle). GETs that fail on every
+        endpoint are retried after an exponential backoff with full jitter,
+        as long as the request's deadline budget leaves time for it. Raises
+        the last error once retries run out, CircuitOpenError if no endpoint
+        could be tried, or DeadlineExceededError if the budget is spent.
+        Only GETs are hedged unless `hedge` says otherwise.
+        """
+        hedge = self.hedge and method == "GET" if hedge is None else hedge
+        retries = settings.UPSTREAM_RETRIES if method == "GET" else 0
+        
+        for retry in range(retries + 1):
+            try:
+                return await self._request_once(client, method, path, hedge, kwargs)
+            except CircuitOpenError:
+                if retry == 0:
+                    raise
+                break  # Earlier passes opened every circuit; report their error
+            except (httpx.HTTPError, asyncio.TimeoutError) as e:
+                error = e
+            
+            left = deadline.remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceededError(f"Request deadline exceeded calling {self.name}: {error}")
+            if retry == retries:
+                break
+            backoff = random.uniform(0, settings.UPSTREAM_RETRY_BACKOFF * 2 ** retry)
+            if left is not None and backoff >= left:
+                break
+            logger.info("Retrying %s request in %.2fs: %s", self.name, backoff, error)
+            await asyncio.sleep(backoff)
+        raise error
+    
+    async def _request_once(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        path: str,
+        hedge: bool,
+        kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        """One pass over the endpoints in rank order, hedging if asked"""
+        candidates = iter(self.ranked())
+        attempts: Dict[asyncio.Task, Endpoint] = {}
+        error: Optional[Exception] = None
+        hedged = False
+        
+        def start(fallback: Optional[Endpoint] = None) -> bool:
+            endpoint = next((e for e in candidates if e.breaker.allow()), None)
+            if endpoint is None and fallback is not None and fallback.breaker.allow():
+                endpoint = fallback
+            if endpoint is None:
+                return False
+            try:
+                attempt_kwargs = self._attempt_kwargs(kwargs)
+            except DeadlineExceededError:
+                endpoint.breaker.release()
+                raise
+            task = asyncio.ensure_future(self._attempt(endpoint, client, method, path, attempt_kwargs))
+            attempts[task] = endpoint
+            return True
+        
+        try:
+            start()
+            while attempts:
+                delay = self.hedge_delay() if hedge and not hedged else None
+                done, _ = await asyncio.wait(attempts, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Still waiting after the p95: race a second attempt
+                    hedged = True
+                    if start(fallback=next(iter(attempts.values()))):
+                        self.hedges += 1
+                    continue
+                for task in done:
+                    endpoint = attempts.pop(task)
+                    response, error = task.result()
+                    if response is not None:
+                        return response
+                    logger.info("%s endpoint %s failed: %s", self.name, endpoint.url, error)
+                if not attempts:
+                    start()
+        finally:
+            for task in attempts:
+                task.cancel()
+        
+        if error is None:
+            raise CircuitOpenError(f"All {self.name} endpoints are unavailable")
+        raise error
+    
+    def _attempt_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Request arguments with the timeout capped by the pool's and the deadline's"""
+        default = kwargs.get("timeout", self.timeout)
+        if default is None and deadline.remaining() is None:
+            return kwargs
+        return dict(kwargs, timeout=deadline.timeout(default if default is not None else float("inf")))
+    
+    async def probe(self, client: httpx.AsyncClient) -> None:
+        """Check demoted endpoints, restoring those that respond"""
+        for endpoint in self.endpoints:
+            if endpoint.healthy:
+                continue
+            started = time.monotonic()
+            try:
+                response = await client.get(f"{endpoint.url}{self.probe_path}")
+                response.raise_for_status()
+            except Exception as e:
+                logger.debug("Probe of %s endpoint %s failed: %s", self.name, endpoint.url, e)
+                continue
+            endpoint.latency = time.monotonic() - started
+            endpoint.error_rate = 0.0
+            endpoint.healthy = True
+            logger.info("Restored %s endpoint %s", self.name, endpoint.url)
+    
+    async def _attempt(
+        self,
+        endpoint: Endpoint,
+        client: httpx.AsyncClient,
+        method: str,
+        path: str,
+        kwargs: Dict[str, Any]
+    ) -> Tuple[Optional[httpx.Response], Optional[Exception]]:
+        """Send one request and record its outcome, returning (response, None) or (None, error)"""
+        try:
+            await endpoint.governor.acquire()
+            started = time.monotonic()
+            response = await self._send(client, method, f"{endpoint.url}{path}", **kwargs)
+            endpoint.governor.update(response.headers, response.status_code)
+            response.raise_for_status()
+        except (asyncio.CancelledError, DeadlineExceededError):
+            endpoint.breaker.release()
+            raise
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status < 500 and status not in ENDPOINT_FAILURE_STATUS:
+                self.record(endpoint, True, time.monotonic() - started)
+                return e.response, None
+            self.record(endpoint, False)
+            return None, e
+        except (httpx.TransportError, asyncio.TimeoutError) as e:
+            self.record(endpoint, False)
+            return None, e
+        self.record(endpoint, True, time.monotonic() - started)
+        return response, None
+    
+    async def _send(self, client: httpx.AsyncClient, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        if method == "GET":
+            return await client.get(url, **kwargs)
+        return await client.request(method, url, **kwargs)
+
+
+async def run_upstream_probe_loop() -> None:
+    """Probe demoted endpoints of every pool until cancelled"""
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        while True:
+            await asyncio.sleep(settings.UPSTREAM_PROBE_SECONDS)
+            for pool in upstream_pools.values():
+                try:
+                    await pool.probe(client)
+                except Exception as e:
+                    logger.warning("Probing %s endpoints failed: %s", pool.name, e)
+
+
+def _create_pool(
+    name: str,
+    urls: List[str],
+    default_url: str,
+    probe_path: str,
+    rate_per_minute: float = 0
+) -> EndpointPool:
+    return EndpointPool(
+        name,
+        urls or [default_url],
+        probe_path,
+        alpha=settings.UPSTREAM_EWMA_ALPHA,
+        max_error_rate=settings.UPSTREAM_MAX_ERROR_RATE,
+        breaker_failures=settings.UPSTREAM_BREAKER_FAILURES,
+        breaker_reset=settings.UPSTREAM_BREAKER_RESET_SECONDS,
+        hedge=settings.UPSTREAM_HEDGE_ENABLED,
+        timeout=settings.UPSTREAM_TIMEOUT,
+        rate_per_minute=rate_per_minute
+    )
+
+
+# Global pools (STACKS_API_URL/BITCOIN_API_URL alone unless the *_URLS lists are set)
+stacks_pool = _create_pool(
+    "stacks", settings.STACKS_API_URLS, settings.STACKS_API_URL, "/extended", settings.STACKS_API_RATE_PER_MINUTE
+)
+bitcoin_pool = _create_pool(
+    "bitcoin", settings.BITCOIN_API_URLS, settings.BITCOIN_API_URL, "/blocks/tip/height", settings.BITCOIN_API_RATE_PER_MINUTE
+)
+alex_pool = _create_pool("alex", [], settings.ALEX_API_URL, "/pools")
+arkadiko_pool = _create_pool("arkadiko", [], settings.ARKADIKO_API_URL, "/pools")
+velar_pool = _create_pool("velar", [], settings.VELAR_API_URL, "/pools")
+upstream_pools = {
+    "stacks": stacks_pool,
+    "bitcoin": bitcoin_pool,
+    "alex": alex_pool,
+    "arkadiko": arkadiko_pool,
+    "velar": velar_pool,
+}
@@ -0,0 +1,219 @@
+"""
+Group-commit write coalescing for high-rate inserts
+"""
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescerStopped(RuntimeError):
+    """The flusher task ended before a submission was committed"""
+
+
+class WriteCoalescer:
+    """Commit inserts from concurrent requests in shared transactions
+    
+    Each `submit` call queues its objects and waits. A single flusher task
+    collects queued objects for up to `max_delay` seconds or `max_rows`
+    objects, commits them in one transaction, and then wakes every waiting
+    caller. If the shared commit fails, each submission is retried on its own
+    so one bad row only fails its own request.
+    """
+    
+    def __init__(self, session_factory=SessionLocal, max_rows: int = 100, max_delay: float = 0.01):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def running(self) -> bool:
+        """Whether the flusher task is accepting submissions"""
+        return self._task is not None and not self._task.done()
+    
+    async def start(self) -> None:
+        """Start the flusher task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Flush queued submissions and stop the flusher task"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+    
+    async def submit(self, *objects: Any) -> None:
+        """Queue new ORM objects for insertion and wait until they are committed
+        
+        Raises CoalescerStopped if the flusher task ends without committing them.
+        """
+        if not self.running:
+            raise CoalescerStopped("Write coalescer is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(objects), future))
+        await future
+    
+    async def _run(self) -> None:
+        """Collect submissions into batches and flush them"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        batch = []
+        try:
+            while not stopping:
+                item = await self._queue.get()
+                if item is None:
+                    break
+                
+                batch = [item]
+                rows = len(item[0])
+                deadline = loop.time() + self.max_delay
+                while rows < self.max_rows:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    rows += len(item[0])
+                
+                await self._flush(batch)
+        finally:
+            # Nothing will commit submissions still collected or queued (e.g. when cancelled)
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None:
+                    batch.append(item)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(CoalescerStopped("Write coalescer stopped before committing"))
+    
+    async def _flush(self, batch: List[Tuple[List[Any], asyncio.Future]]) -> None:
+        """Commit a batch in one transaction, falling back to one per submission
+        
+        Every submission's future is resolved before this returns, even when
+        the flush itself fails, so no caller waits forever.
+        """
+        error: Optional[BaseException] = None
+        try:
+            # A failed transaction expires and detaches what it flushed, so the
+            # retries need each submission's objects as they were submitted
+            snapshots = [_snapshot(objects) for objects, _ in batch]
+            try:
+                async with self.session_factory() as session:
+                    for objects, _ in batch:
+                        session.add_all(objects)
+                    await session.commit()
+            except Exception:
+                logger.warning("Coalesced commit of %d submissions failed, retrying individually", len(batch))
+                for (objects, future), snapshot in zip(batch, snapshots):
+                    await self._flush_one(objects, future, snapshot)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+        except Exception as e:
+            logger.exception("Coalesced flush of %d submissions failed", len(batch))
+            error = e
+        finally:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error or CoalescerStopped("Write coalescer stopped before committing"))
+    
+    async def _flush_one(
+        self,
+        objects: List[Any],
+        future: asyncio.Future,
+        snapshot: List[Tuple[Any, Dict[str, Any]]]
+    ) -> None:
+        """Commit a single submission in its own transaction"""
+        try:
+            _restore(snapshot)
+            async with self.session_factory() as session:
+                session.add_all(objects)
+                await session.commit()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(None)
+
+
+def _snapshot(objects: List[Any]) -> List[Tuple[Any, Dict[str, Any]]]:
+    """Attribute values of the new ORM objects in a submission, including cascaded ones"""
+    snapshot = []
+    seen = set()
+    for obj in objects:
+        state = inspect(obj, raiseerr=False)
+        if state is None:
+            continue
+        related = [(obj, state)] + [(o, s) for o, _, s, _ in state.mapper.cascade_iterator("save-update", state)]
+        for item, item_state in related:
+            if id(item) in seen or item_state.key is not None:
+                continue
+            seen.add(id(item))
+            values = {
+                key: list(value) if isinstance(value, list) else value
+                for key, value in item_state.dict.items()
+                if key in item_state.mapper.attrs
+            }
+            snapshot.append((item, values))
+    return snapshot
+
+
+def _restore(snapshot: List[Tuple[Any, Dict[str, Any]]]) -> None:
+    """Return snapshotted objects to new, unsaved objects with their submitted values
+    
+    Also undoes the blob dedup, which points referrers at stored rows the
+    failed transaction may not have kept; the retry session dedups again.
+    """
+    for obj, values in snapshot:
+        if inspect(obj).key is not None:
+            make_transient(obj)
+    for obj, values in snapshot:
+        for key, value in values.items():
+            setattr(obj, key, value)
+
+
+async def persist(db: AsyncSession, *objects: Any) -> None:
+    """Insert new objects, through the write coalescer when it is running
+    
+    If the flusher task has ended, the objects are committed on `db` instead.
+    """
+    if write_coalescer.running:
+        try:
+            await write_coalescer.submit(*objects)
+            return
+        except CoalescerStopped:
+            logger.warning("Write coalescer stopped, committing directly")
+    
+    db.add_all(objects)
+    await db.commit()
+    for obj in objects:
+        await db.refresh(obj)
+
+
+# Global write coalescer (started from the app lifespan when enabled)
+write_coalescer = WriteCoalescer(
+    max_rows=settings.WRITE_COALESCE_MAX_ROWS,
+    max_delay=settings.WRITE_COALESCE_MAX_DELAY_MS / 1000
+)
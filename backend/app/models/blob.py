@@ -0,0 +1,94 @@
+"""
+Content-addressed blob storage for large JSON payloads
+"""
+
+from sqlalchemy import Column, String, DateTime, Integer, LargeBinary, event, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from typing import Any
+
+from app.core import serialization
+from app.core.database import Base
+
+
+class Blob(Base):
+    """Compressed JSON payload keyed by the SHA-256 of its canonical encoding"""
+
+    __tablename__ = "blobs"
+
+    hash = Column(String(64), primary_key=True)
+    codec = Column(String(16), nullable=False)  # zstd, zlib or none
+    size = Column(Integer, nullable=False)  # Uncompressed size in bytes
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    @classmethod
+    def from_payload(cls, payload: Any) -> "Blob":
+        """Build a blob for a JSON-serializable payload"""
+        raw = serialization.dumps(payload)
+        codec, data = serialization.compress(raw)
+        blob = cls(hash=serialization.content_hash(raw), codec=codec, size=len(raw), data=data)
+        blob._payload = payload
+        return blob
+
+    @property
+    def payload(self) -> Any:
+        """Decoded payload (decoded once per instance)"""
+        payload = getattr(self, "_payload", None)
+        if payload is None:
+            payload = serialization.loads(serialization.decompress(self.codec, self.data))
+            self._payload = payload
+        return payload
+
+    def __repr__(self):
+        return f"<Blob(hash={self.hash}, codec={self.codec}, size={self.size})>"
+
+
+def _insert_ignore(session: Session, blobs: list) -> None:
+    """Insert blobs, skipping any whose hash is already stored"""
+    rows = [
+        {"hash": b.hash, "codec": b.codec, "size": b.size, "data": b.data}
+        for b in blobs
+    ]
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        session.execute(sqlite.insert(Blob).values(rows).on_conflict_do_nothing())
+    elif dialect == "postgresql":
+        session.execute(postgresql.insert(Blob).values(rows).on_conflict_do_nothing())
+    else:
+        existing = set(session.scalars(
+            select(Blob.hash).where(Blob.hash.in_([r["hash"] for r in rows]))
+        ))
+        missing = [r for r in rows if r["hash"] not in existing]
+        if missing:
+            session.execute(Blob.__table__.insert(), missing)
+
+
+@event.listens_for(Session, "before_flush")
+def _deduplicate_blobs(session: Session, flush_context, instances) -> None:
+    """Store each pending blob once and point its referrers at the stored row"""
+    pending = {}
+    for obj in session.new:
+        if isinstance(obj, Blob):
+            pending.setdefault(obj.hash, obj)
+    if not pending:
+        return
+
+    with session.no_autoflush:
+        _insert_ignore(session, list(pending.values()))
+        for obj in list(session.new):
+            if isinstance(obj, Blob):
+                session.expunge(obj)
+
+        stored = {h: session.get(Blob, h) for h in pending}
+        for h, blob in stored.items():
+            blob._payload = getattr(pending[h], "_payload", None)
+
+        for obj in list(session.new) + list(session.dirty):
+            for rel in inspect(obj).mapper.relationships:
+                if rel.mapper.class_ is not Blob or rel.uselist:
+                    continue
+                target = obj.__dict__.get(rel.key)
+                if target is not None and target.hash in stored and target is not stored[target.hash]:
+                    setattr(obj, rel.key, stored[target.hash])
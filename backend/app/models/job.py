@@ -0,0 +1,90 @@
+"""
+Recommendation job models for queued and nightly batch generation
+"""
+
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, Index, Integer, Text
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import uuid
+
+from app.core.database import Base
+from app.models.blob import Blob
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class RecommendationJob(Base):
+    """Queued `generate_recommendation` call, claimed and run by a worker pool"""
+    
+    __tablename__ = "recommendation_jobs"
+    __table_args__ = (
+        # Workers claim the oldest queued jobs; stale running jobs are found by start time
+        Index("ix_recommendation_jobs_status_created", "status", "created_at"),
+        Index("ix_recommendation_jobs_user_created", "user_id", "created_at"),
+    )
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    params = Column(JSON, nullable=False)  # Keyword arguments for generate_recommendation
+    
+    status = Column(String(20), nullable=False, default=JOB_QUEUED)  # queued, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    recommendation_id = Column(String(36), ForeignKey("recommendations.id", ondelete="SET NULL"), nullable=True)
+    error = Column(Text, nullable=True)
+    
+    # Metadata
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    recommendation = relationship("Recommendation")
+    
+    @property
+    def finished(self) -> bool:
+        """Whether the job has succeeded or failed for good"""
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+    
+    def __repr__(self):
+        return f"<RecommendationJob(id={self.id}, status={self.status}, attempts={self.attempts})>"
+
+
+class RecommendationBatchRun(Base):
+    """Batch generation of recommendations for every active user, checkpointed per chunk of users"""
+    
+    __tablename__ = "recommendation_batch_runs"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    run_key = Column(String(32), unique=True, nullable=False)  # One run per key, e.g. the UTC date of a nightly run
+    status = Column(String(20), nullable=False, default=JOB_RUNNING)  # running, succeeded, failed
+    cursor = Column(String(36), nullable=True)  # Last user ID whose recommendation is committed
+    
+    # Market data shared by every recommendation of the run (kept for resumes)
+    market_data_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    
+    # Counters, token usage and elapsed time, accumulated across resumes
+    stats = Column(JSON, nullable=False, default=dict)
+    
+    # Metadata
+    started_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    checkpoint_at = Column(DateTime(timezone=True), nullable=True)  # Heartbeat of the process running it
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    market_data_blob = relationship("Blob", lazy="joined")
+    
+    @property
+    def market_data(self):
+        """Decoded market data"""
+        return self.market_data_blob.payload if self.market_data_blob is not None else None
+    
+    @market_data.setter
+    def market_data(self, value) -> None:
+        self.market_data_blob = Blob.from_payload(value)
+    
+    def __repr__(self):
+        return f"<RecommendationBatchRun(run_key={self.run_key}, status={self.status}, cursor={self.cursor})>"
@@ -2,24 +2,39 @@
 Recommendation model for AI-generated DeFi strategies
 """
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, Float, Text, JSON
+from sqlalchemy import Column, String, DateTime, ForeignKey, Float, Text, JSON, Index, Integer, BigInteger
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from typing import Any, Dict, List, Optional
+from datetime import datetime
 import uuid
 
-from app.core.database import Base
+from app.core.database import Base, utcnow
+from app.models.blob import Blob
 
 
 class Recommendation(Base):
     """AI-generated DeFi strategy recommendations"""
     
     __tablename__ = "recommendations"
+    __table_args__ = (
+        # Keyset pagination of a user's history, optionally filtered
+        Index("ix_recommendations_user_created", "user_id", "created_at", "id"),
+        Index("ix_recommendations_user_strategy_created", "user_id", "strategy_type", "created_at", "id"),
+        Index("ix_recommendations_user_status_created", "user_id", "status", "created_at", "id"),
+        Index("ix_recommendations_user_risk", "user_id", "risk_score"),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
     
-    # Input data
-    raw_input = Column(JSON, nullable=False)  # Wallet balances, market data, etc.
+    # Input data, stored once per distinct payload: the per-user part (profile,
+    # wallet balances) and the market data every row from one snapshot shares
+    raw_input_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True, index=True)
+    market_data_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True, index=True)
+    
+    # Profile, holdings and pool metrics compared by the change-detection gate
+    input_fingerprint = Column(JSON, nullable=True)
     
     # AI output
     ai_output = Column(JSON, nullable=False)  # Structured AI response
@@ -30,16 +45,112 @@ class Recommendation(Base):
     # Human-readable explanation
     explanation = Column(Text, nullable=True)  # Natural language explanation
     
+    # Denormalized from ai_output["recommendations"]
+    action_count = Column(Integer, nullable=False, default=0)
+    
     # Status tracking
     status = Column(String(50), default="pending")  # pending, executed, cancelled, failed
     executed_at = Column(DateTime(timezone=True), nullable=True)
     
+    # Archival: large payloads of old rows live in compressed segment files
+    archived_at = Column(DateTime(timezone=True), nullable=True)
+    archive_segment = Column(String(255), nullable=True)  # Segment file name
+    archive_offset = Column(BigInteger, nullable=True)  # Byte offset of the compressed frame
+    archive_length = Column(Integer, nullable=True)  # Byte length of the compressed frame
+    
     # Metadata
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=utcnow())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     user = relationship("User", back_populates="recommendations")
+    raw_input_blob = relationship("Blob", lazy="joined", foreign_keys=[raw_input_hash])
+    market_data_blob = relationship("Blob", lazy="joined", foreign_keys=[market_data_hash])
+    actions = relationship(
+        "RecommendationAction",
+        back_populates="recommendation",
+        cascade="all, delete-orphan",
+        order_by="RecommendationAction.position"
+    )
+    
+    # Set (not stored) when the change-detection gate returns this row again
+    reused = False
+    
+    @property
+    def raw_input(self) -> Optional[Any]:
+        """Decoded input payload, with its market data put back"""
+        if self.raw_input_blob is None:
+            return None
+        payload = self.raw_input_blob.payload
+        if self.market_data_blob is not None and isinstance(payload, dict):
+            payload = {**payload, "market_data": self.market_data_blob.payload}
+        return payload
+    
+    @raw_input.setter
+    def raw_input(self, value: Any) -> None:
+        market_data = value.get("market_data") if isinstance(value, dict) else None
+        if market_data is not None:
+            value = {key: item for key, item in value.items() if key != "market_data"}
+        self.raw_input_blob = Blob.from_payload(value)
+        self.market_data_blob = Blob.from_payload(market_data) if market_data is not None else None
     
     def __repr__(self):
         return f"<Recommendation(id={self.id}, strategy_type={self.strategy_type}, risk_score={self.risk_score})>"
+    
+    def set_actions_from_output(self, ai_output: Dict[str, Any]) -> None:
+        """Populate actions and their denormalized count from AI output"""
+        self.actions = RecommendationAction.from_ai_output(ai_output)
+        self.action_count = len(self.actions)
+
+
+class RecommendationAction(Base):
+    """Individual protocol action extracted from a recommendation's AI output"""
+    
+    __tablename__ = "recommendation_actions"
+    __table_args__ = (
+        Index("ix_recommendation_actions_protocol_action", "protocol", "action", "recommendation_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    recommendation_id = Column(
+        String(36),
+        ForeignKey("recommendations.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    position = Column(Integer, nullable=False)  # Order within ai_output["recommendations"]
+    protocol = Column(String(100), nullable=False)  # Lowercased, e.g. "alex"
+    action = Column(String(100), nullable=True)  # Lowercased, e.g. "add_liquidity"
+    amount = Column(String(100), nullable=True)
+    
+    # Relationships
+    recommendation = relationship("Recommendation", back_populates="actions")
+    
+    @classmethod
+    def from_ai_output(cls, ai_output: Dict[str, Any]) -> List["RecommendationAction"]:
+        """Extract actions from ai_output["recommendations"], skipping malformed entries"""
+        items = ai_output.get("recommendations") if isinstance(ai_output, dict) else None
+        if not isinstance(items, list):
+            return []
+        
+        actions = []
+        for item in items:
+            if not isinstance(item, dict) or not item.get("protocol"):
+                continue
+            action = item.get("action")
+            amount = item.get("amount")
+            actions.append(cls(
+                position=len(actions),
+                protocol=_normalize(item["protocol"]),
+                action=_normalize(action) if action else None,
+                amount=str(amount)[:100] if amount is not None else None
+            ))
+        return actions
+    
+    def __repr__(self):
+        return f"<RecommendationAction(protocol={self.protocol}, action={self.action})>"
+
+
+def _normalize(value: Any) -> str:
+    """Normalize a protocol/action label for indexed equality lookups"""
+    return str(value).strip().lower()[:100]
@@ -0,0 +1,70 @@
+"""
+Transaction model for locally stored wallet transaction history
+"""
+
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, Index, Integer, BigInteger, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from typing import Any, Dict, Optional
+from datetime import datetime
+import uuid
+
+from app.core.database import Base
+from app.models.wallet import NetworkType
+
+# Transactions per block are far below this, so (height, index) packs into one sortable integer
+BLOCK_SEQUENCE_SPAN = 1_000_000
+
+
+class WalletTransaction(Base):
+    """Confirmed on-chain transaction involving a wallet, synced from Hiro or Blockstream"""
+    
+    __tablename__ = "transactions"
+    __table_args__ = (
+        UniqueConstraint("wallet_id", "txid", name="uq_transactions_wallet_txid"),
+        # Keyset pagination of a wallet's history, newest first
+        Index("ix_transactions_wallet_sequence", "wallet_id", "sequence", "txid"),
+    )
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    wallet_id = Column(String(36), ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False)
+    txid = Column(String(80), nullable=False)
+    block_height = Column(Integer, nullable=False)
+    sequence = Column(BigInteger, nullable=False)  # block_height * BLOCK_SEQUENCE_SPAN + index in block
+    block_time = Column(DateTime(timezone=True), nullable=True)
+    data = Column(JSON, nullable=False)  # Transaction as returned by the upstream API
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    
+    # Relationships
+    wallet = relationship("Wallet")
+    
+    @staticmethod
+    def row_from_api(wallet_id: str, network: NetworkType, tx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Column values for an upstream transaction, or None if it is unconfirmed or malformed"""
+        if network == NetworkType.STACKS:
+            txid = tx.get("tx_id")
+            height = tx.get("block_height")
+            index = tx.get("tx_index") or 0
+            timestamp = tx.get("block_time") or tx.get("burn_block_time")
+        else:
+            status = tx.get("status") or {}
+            txid = tx.get("txid")
+            height = status.get("block_height") if status.get("confirmed") else None
+            index = 0
+            timestamp = status.get("block_time")
+        
+        if not txid or height is None:
+            return None
+        return {
+            "id": str(uuid.uuid4()),
+            "wallet_id": wallet_id,
+            "txid": txid,
+            "block_height": int(height),
+            "sequence": int(height) * BLOCK_SEQUENCE_SPAN + int(index),
+            "block_time": datetime.utcfromtimestamp(timestamp) if timestamp else None,
+            "data": tx,
+            "created_at": datetime.utcnow(),
+        }
+    
+    def __repr__(self):
+        return f"<WalletTransaction(txid={self.txid}, block_height={self.block_height})>"
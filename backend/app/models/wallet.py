@@ -2,9 +2,10 @@
 Wallet model for managing connected wallets
 """
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Boolean, Text, Integer, BigInteger, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from datetime import datetime
 import uuid
 import enum
 
@@ -27,12 +28,55 @@ class Wallet(Base):
     address = Column(String(255), nullable=False, index=True)
     network = Column(Enum(NetworkType), nullable=False)
     label = Column(String(100), nullable=True)  # User-defined wallet label
+    
+    # HD wallets: output descriptor the addresses are derived from (`address` is the first receive address)
+    descriptor = Column(Text, nullable=True)
+    gap_limit = Column(Integer, nullable=True)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Local transaction history sync state
+    tx_history_cursor = Column(String(100), nullable=True)  # Upstream cursor for the next older page
+    tx_history_complete = Column(Boolean, default=False)  # All history back to the first tx is stored
+    tx_synced_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     user = relationship("User", back_populates="wallets")
+    derived_addresses = relationship(
+        "WalletAddress",
+        back_populates="wallet",
+        cascade="all, delete-orphan",
+        lazy="noload"
+    )
     
     def __repr__(self):
         return f"<Wallet(id={self.id}, address={self.address}, network={self.network})>"
+
+
+class WalletAddress(Base):
+    """Address derived from an HD wallet's descriptor, with its last probed state"""
+    
+    __tablename__ = "wallet_addresses"
+    __table_args__ = (
+        UniqueConstraint("wallet_id", "branch", "derivation_index", name="uq_wallet_addresses_path"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    wallet_id = Column(String(36), ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False, index=True)
+    branch = Column(Integer, nullable=False)  # 0 = receive, 1 = change
+    derivation_index = Column(Integer, nullable=False)
+    address = Column(String(100), nullable=False, index=True)
+    
+    # Last probe of the address
+    used = Column(Boolean, nullable=False, default=False)
+    tx_count = Column(Integer, nullable=False, default=0)
+    balance = Column(BigInteger, nullable=False, default=0)  # Confirmed, in satoshis
+    unconfirmed_balance = Column(BigInteger, nullable=False, default=0)  # Mempool delta, in satoshis
+    checked_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    wallet = relationship("Wallet", back_populates="derived_addresses")
+    
+    def __repr__(self):
+        return f"<WalletAddress(address={self.address}, branch={self.branch}, index={self.derivation_index})>"
@@ -0,0 +1,185 @@
+"""
+Archive service for recommendation retention
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, exists
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+from collections import defaultdict
+import asyncio
+import fcntl
+import logging
+import os
+
+from app.core import serialization
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.exceptions import NotFoundError
+from app.models.blob import Blob
+from app.models.job import RecommendationBatchRun
+from app.models.recommendation import Recommendation
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_EXTENSIONS = {
+    serialization.CODEC_ZSTD: "zst",
+    serialization.CODEC_ZLIB: "zz",
+}
+EXTENSION_CODECS = {ext: codec for codec, ext in SEGMENT_EXTENSIONS.items()}
+
+
+class ArchiveService:
+    """Service for moving old recommendation payloads into append-only archive segments
+    
+    Each archive run appends one compressed NDJSON frame per month to
+    `recommendations-YYYY-MM.ndjson.<ext>`. The recommendation row keeps its
+    scalar fields plus the segment, offset and length of its frame so a single
+    row can be rehydrated without reading the whole segment.
+    """
+    
+    def __init__(self, db: AsyncSession, archive_dir: Optional[str] = None):
+        self.db = db
+        self.archive_dir = archive_dir or settings.RECOMMENDATION_ARCHIVE_DIR
+    
+    async def archive_older_than(self, days: Optional[int] = None) -> int:
+        """Archive recommendations older than `days`, returning the number archived"""
+        days = settings.RECOMMENDATION_RETENTION_DAYS if days is None else days
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        
+        lock = await asyncio.to_thread(self._try_lock)
+        if lock is None:
+            logger.info("Recommendation archive already running elsewhere, skipping")
+            return 0
+        
+        archived = 0
+        try:
+            while True:
+                result = await self.db.execute(
+                    select(Recommendation)
+                    .where(Recommendation.archived_at.is_(None))
+                    .where(Recommendation.created_at < cutoff)
+                    .order_by(Recommendation.created_at)
+                    .limit(settings.RECOMMENDATION_ARCHIVE_BATCH_SIZE)
+                )
+                batch = result.scalars().all()
+                if not batch:
+                    break
+                await self._archive_batch(batch)
+                archived += len(batch)
+        finally:
+            await asyncio.to_thread(lock.close)
+        
+        return archived
+    
+    async def load_archived(self, recommendation: Recommendation) -> Dict[str, Any]:
+        """Read an archived recommendation's payload back from its segment"""
+        if recommendation.archived_at is None:
+            raise NotFoundError("Recommendation is not archived")
+        
+        path = os.path.join(self.archive_dir, recommendation.archive_segment)
+        try:
+            frame = await asyncio.to_thread(
+                self._read_frame, path, recommendation.archive_offset, recommendation.archive_length
+            )
+        except FileNotFoundError:
+            raise NotFoundError("Archive segment not found")
+        
+        codec = EXTENSION_CODECS[path.rsplit(".", 1)[-1]]
+        for line in serialization.decompress(codec, frame).splitlines():
+            record = serialization.loads(line)
+            if record["id"] == recommendation.id:
+                return record
+        raise NotFoundError("Archived recommendation not found")
+    
+    async def _archive_batch(self, batch: List[Recommendation]) -> None:
+        """Write one frame per month for a batch, then shrink the rows to stubs"""
+        by_month = defaultdict(list)
+        for recommendation in batch:
+            by_month[recommendation.created_at.strftime("%Y-%m")].append(recommendation)
+        
+        codec = serialization.best_codec()
+        blob_hashes = set()
+        archived_at = datetime.utcnow()
+        
+        for month, recommendations in by_month.items():
+            lines = b"".join(
+                serialization.dumps({
+                    "id": rec.id,
+                    "raw_input": rec.raw_input,
+                    "ai_output": rec.ai_output,
+                    "explanation": rec.explanation
+                }) + b"\n"
+                for rec in recommendations
+            )
+            _, frame = serialization.compress(lines, codec)
+            segment = f"recommendations-{month}.ndjson.{SEGMENT_EXTENSIONS[codec]}"
+            offset = await asyncio.to_thread(
+                self._append_frame, os.path.join(self.archive_dir, segment), frame
+            )
+            
+            # The frame is durable before any row stops carrying its payload
+            for rec in recommendations:
+                blob_hashes.update(h for h in (rec.raw_input_hash, rec.market_data_hash) if h)
+                rec.raw_input_blob = None
+                rec.market_data_blob = None
+                rec.ai_output = {}
+                rec.explanation = None
+                rec.archived_at = archived_at
+                rec.archive_segment = segment
+                rec.archive_offset = offset
+                rec.archive_length = len(frame)
+        
+        await self.db.flush()
+        if blob_hashes:
+            await self.db.execute(
+                delete(Blob)
+                .where(Blob.hash.in_(blob_hashes))
+                .where(~exists().where(Recommendation.raw_input_hash == Blob.hash))
+                .where(~exists().where(Recommendation.market_data_hash == Blob.hash))
+                .where(~exists().where(RecommendationBatchRun.market_data_hash == Blob.hash))
+                .execution_options(synchronize_session=False)
+            )
+        await self.db.commit()
+    
+    def _try_lock(self):
+        """Take the archive directory lock without blocking, or return None"""
+        handle = open(os.path.join(self.archive_dir, ".lock"), "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+        return handle
+    
+    @staticmethod
+    def _append_frame(path: str, frame: bytes) -> int:
+        """Append a frame to a segment file and fsync it, returning its offset"""
+        with open(path, "ab") as segment:
+            offset = segment.tell()
+            segment.write(frame)
+            segment.flush()
+            os.fsync(segment.fileno())
+        return offset
+    
+    @staticmethod
+    def _read_frame(path: str, offset: int, length: int) -> bytes:
+        """Read one frame from a segment file"""
+        with open(path, "rb") as segment:
+            segment.seek(offset)
+            return segment.read(length)
+
+
+async def run_archive_loop() -> None:
+    """Archive old recommendations periodically (started from the app lifespan)"""
+    interval = settings.RECOMMENDATION_ARCHIVE_INTERVAL_HOURS * 3600
+    while True:
+        try:
+            async with SessionLocal() as db:
+                archived = await ArchiveService(db).archive_older_than()
+            if archived:
+                logger.info("Archived %d recommendations", archived)
+        except Exception:
+            logger.exception("Recommendation archive run failed")
+        await asyncio.sleep(interval)
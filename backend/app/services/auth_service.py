@@ -3,14 +3,16 @@ Authentication service for user management and JWT handling
 """
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, event
+from sqlalchemy.orm import Session, selectinload
 from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta
 from typing import Optional
+import asyncio
 import uuid
 
+from app.core.cache import get_cache
 from app.core.config import settings
 from app.core.exceptions import AuthenticationError
 from app.models.user import User
@@ -18,6 +20,50 @@ from app.models.user import User
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Profile fields of authenticated users, keyed by user ID (never the password hash)
+user_cache = get_cache("auth:users", ttl=settings.AUTH_USER_CACHE_TTL)
+
+
+class CurrentUser:
+    """Authenticated user's profile, as cached (not attached to any session)"""
+    
+    __slots__ = ("id", "email", "is_active", "is_verified", "created_at")
+    
+    def __init__(
+        self,
+        id: str,
+        email: str,
+        is_active: bool,
+        is_verified: bool,
+        created_at: Optional[datetime] = None
+    ):
+        self.id = id
+        self.email = email
+        self.is_active = is_active
+        self.is_verified = is_verified
+        self.created_at = created_at
+    
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(user.id, user.email, user.is_active, user.is_verified, user.created_at)
+    
+    @classmethod
+    def from_cache(cls, data: dict) -> "CurrentUser":
+        created_at = datetime.fromisoformat(data["created_at"]) if data["created_at"] else None
+        return cls(data["id"], data["email"], data["is_active"], data["is_verified"], created_at)
+    
+    def to_cache(self) -> dict:
+        return {
+            "id": self.id,
+            "email": self.email,
+            "is_active": self.is_active,
+            "is_verified": self.is_verified,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f"<CurrentUser(id={self.id}, email={self.email})>"
+
 
 class AuthService:
     """Authentication service for user management"""
@@ -99,16 +145,61 @@ class AuthService:
         except jwt.JWTError:
             return None
     
-    async def get_current_user(self, token: str) -> User:
+    async def get_current_user(self, token: str) -> CurrentUser:
         """Get current user from JWT token"""
         user_id = self.verify_token(token)
         
         if user_id is None:
             raise AuthenticationError("Invalid token")
         
+        cached = await user_cache.get(user_id)
+        if cached is not None:
+            return CurrentUser.from_cache(cached)
+        
         user = await self.get_user_by_id(user_id)
         
         if user is None:
             raise AuthenticationError("User not found")
         
-        return user
+        current_user = CurrentUser.from_user(user)
+        await user_cache.set(user_id, current_user.to_cache())
+        
+        return current_user
+
+
+async def invalidate_user(user_id: str) -> None:
+    """Drop a user's cached profile (call after changing users with bulk UPDATE/DELETE)"""
+    await user_cache.delete(user_id)
+
+
+# ORM updates and deletes of users invalidate their cached profile on commit.
+# The shared tier is cleared here; other processes' local tiers expire within
+# AUTH_USER_CACHE_TTL.
+_pending_invalidations: set = set()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _mark_user_changed(mapper, connection, target: User) -> None:
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    for user_id in session.info.pop("changed_user_ids", ()):
+        user_cache.local.delete(user_id)
+        if user_cache.remote is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:  # synchronous session: the shared tier expires on its own
+                continue
+            task = loop.create_task(invalidate_user(user_id))
+            _pending_invalidations.add(task)
+            task.add_done_callback(_pending_invalidations.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session) -> None:
+    session.info.pop("changed_user_ids", None)
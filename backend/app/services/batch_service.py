@@ -0,0 +1,429 @@
+"""
+Nightly batch generation of recommendations for every active user
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import lazyload
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from collections import defaultdict
+import asyncio
+import logging
+import time
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.exceptions import BlockchainError
+from app.core.rate_governor import Priority, set_priority
+from app.models.job import RecommendationBatchRun, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+from app.models.recommendation import Recommendation
+from app.models.user import User
+from app.models.wallet import Wallet
+from app.services.llm_gateway import llm_gateway
+from app.services.strategy_service import (
+    StrategyService, cached_ai_output, input_fingerprint, strategy_input
+)
+from app.services.wallet_service import WalletService
+
+logger = logging.getLogger(__name__)
+
+# Most recent per-user failures kept in a run's stats
+MAX_RECORDED_ERRORS = 20
+
+COUNTERS = (
+    "users", "generated", "unchanged", "failed", "balance_errors",
+    "llm_calls", "prompt_tokens", "completion_tokens"
+)
+
+
+def batch_report(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Throughput, cost and failure summary of a run's stats"""
+    elapsed = stats.get("elapsed_seconds") or 0.0
+    cost = (
+        stats.get("prompt_tokens", 0) * settings.LLM_PROMPT_COST_PER_MILLION
+        + stats.get("completion_tokens", 0) * settings.LLM_COMPLETION_COST_PER_MILLION
+    ) / 1_000_000
+    return {
+        **{key: stats.get(key, 0) for key in COUNTERS},
+        "elapsed_seconds": round(elapsed, 3),
+        "users_per_minute": round(stats.get("users", 0) * 60 / elapsed, 1) if elapsed else None,
+        "cache_hits": stats.get("generated", 0) - stats.get("llm_calls", 0),
+        "cost_usd": round(cost, 6),
+        "errors": stats.get("errors", [])
+    }
+
+
+class BatchRecommendationService:
+    """Generates a fresh recommendation for every active user in one run
+    
+    Users are read in ID order, `BATCH_CHUNK_SIZE` at a time. The market
+    data is fetched once and stored with the run, so every recommendation
+    (including those made after a resume) sees the same snapshot. For each
+    chunk, wallet balances are fetched with bounded concurrency, users with
+    a wallet whose balances could not be fetched are counted as failed (a
+    partial portfolio would give a wrong strategy), users whose inputs
+    have not changed since their last recommendation are skipped,
+    and LLM calls run at background priority under the shared LLM rate
+    limit (identical inputs share one answer through the strategy cache).
+    The chunk's rows are inserted in one transaction together with the
+    run's cursor, so a run that stops resumes after the last committed
+    user without duplicating or losing any. The cursor only advances from
+    the value this process read, so if another process has taken the run
+    over, the chunk is discarded. While a chunk is processed, the run's
+    checkpoint_at is refreshed so the run is not taken over meanwhile.
+    """
+    
+    def __init__(self, db: AsyncSession, session_factory=SessionLocal):
+        self.db = db
+        self.session_factory = session_factory
+        self.strategy_service = StrategyService(db)
+        self.stats: Dict[str, Any] = {}
+        self._llm_slots: Optional[asyncio.Semaphore] = None
+        self._run_id: Optional[str] = None
+        self._cursor: Optional[str] = None
+    
+    async def run(self, run_key: Optional[str] = None, create: bool = True) -> Optional[RecommendationBatchRun]:
+        """Run (or resume) the batch for `run_key`, today's UTC date by default
+        
+        Returns the finished run, or None when the run already succeeded
+        or another process is running (or took over) it. With
+        `create=False`, only an unfinished run is resumed.
+        """
+        run_key = run_key or datetime.utcnow().date().isoformat()
+        set_priority(Priority.BACKGROUND)
+        
+        run = await self._claim_run(run_key, create)
+        if run is None:
+            return None
+        if run.cursor is not None:
+            logger.info("Resuming batch recommendations %s after user %s", run_key, run.cursor)
+        
+        self.stats = {**{key: 0 for key in COUNTERS}, "elapsed_seconds": 0.0, "errors": [], **(run.stats or {})}
+        self._llm_slots = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+        self._run_id, self._cursor = run.id, run.cursor
+        stopped = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(stopped))
+        try:
+            if run.market_data_blob is None:
+                run.market_data = await self.strategy_service._get_market_data()
+                await self.db.commit()
+            market_data = run.market_data
+            
+            while True:
+                user_ids = await self._next_users(self._cursor)
+                if not user_ids:
+                    break
+                started = time.monotonic()
+                rows = await self._process_chunk(user_ids, market_data)
+                self.stats["elapsed_seconds"] += time.monotonic() - started
+                
+                # The chunk's rows and the checkpoint commit together
+                self.db.add_all(rows)
+                if not await self._checkpoint(cursor=user_ids[-1], stats=dict(self.stats)):
+                    await self.db.rollback()
+                    logger.warning("Batch recommendations %s taken over by another process", run_key)
+                    return None
+                await self.db.commit()
+                self._cursor = user_ids[-1]
+        except Exception:
+            logger.exception("Batch recommendations %s failed after user %s", run_key, self._cursor)
+            # Stats stay as of the last checkpoint; the resume redoes the rest
+            await self.db.rollback()
+            await self._finish(JOB_FAILED)
+            raise
+        finally:
+            stopped.set()
+            await heartbeat
+        
+        if not await self._finish(JOB_SUCCEEDED, stats=dict(self.stats)):
+            return None
+        logger.info("Batch recommendations %s finished: %s", run_key, batch_report(self.stats))
+        return run
+    
+    async def _checkpoint(self, **values: Any) -> bool:
+        """Update the run if its cursor is still the one this process last committed
+        
+        Returns False (changing nothing) when another process has taken the
+        run over and moved its cursor.
+        """
+        result = await self.db.execute(
+            update(RecommendationBatchRun)
+            .where(
+                RecommendationBatchRun.id == self._run_id,
+                RecommendationBatchRun.cursor.is_not_distinct_from(self._cursor)
+            )
+            .values(checkpoint_at=datetime.utcnow(), **values)
+            .execution_options(synchronize_session="fetch")
+        )
+        return result.rowcount == 1
+    
+    async def _heartbeat(self, stopped: asyncio.Event) -> None:
+        """Refresh the run's checkpoint_at until `stopped` is set, so long chunks are not taken over"""
+        interval = settings.BATCH_RUN_STALE_SECONDS / 3
+        while True:
+            try:
+                await asyncio.wait_for(stopped.wait(), interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(
+                        update(RecommendationBatchRun)
+                        .where(
+                            RecommendationBatchRun.id == self._run_id,
+                            RecommendationBatchRun.status == JOB_RUNNING,
+                            RecommendationBatchRun.cursor.is_not_distinct_from(self._cursor)
+                        )
+                        .values(checkpoint_at=datetime.utcnow())
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.warning("Batch recommendations heartbeat failed: %s", e)
+    
+    async def _claim_run(self, run_key: str, create: bool) -> Optional[RecommendationBatchRun]:
+        """The run for `run_key` if this process should run it
+        
+        A new run is created (once: the key is unique). An unfinished run
+        is taken over when it failed or its last checkpoint is older than
+        `BATCH_RUN_STALE_SECONDS`, i.e. the process running it stopped.
+        """
+        result = await self.db.execute(
+            select(RecommendationBatchRun).where(RecommendationBatchRun.run_key == run_key)
+        )
+        run = result.scalar_one_or_none()
+        
+        if run is None:
+            if not create:
+                return None
+            run = RecommendationBatchRun(run_key=run_key, status=JOB_RUNNING, stats={}, checkpoint_at=datetime.utcnow())
+            self.db.add(run)
+            try:
+                await self.db.commit()
+            except IntegrityError:
+                await self.db.rollback()
+                logger.info("Batch recommendations %s started by another process", run_key)
+                return None
+            return run
+        
+        if run.status == JOB_SUCCEEDED:
+            return None
+        stale = datetime.utcnow() - timedelta(seconds=settings.BATCH_RUN_STALE_SECONDS)
+        claimed = await self.db.execute(
+            update(RecommendationBatchRun)
+            .where(
+                RecommendationBatchRun.id == run.id,
+                or_(
+                    RecommendationBatchRun.status == JOB_FAILED,
+                    RecommendationBatchRun.checkpoint_at.is_(None),
+                    RecommendationBatchRun.checkpoint_at < stale
+                )
+            )
+            .values(status=JOB_RUNNING, checkpoint_at=datetime.utcnow(), finished_at=None)
+        )
+        await self.db.commit()
+        if claimed.rowcount != 1:
+            logger.info("Batch recommendations %s running in another process", run_key)
+            return None
+        await self.db.refresh(run)
+        return run
+    
+    async def unfinished(self, run_key: str) -> bool:
+        """Whether a run for `run_key` exists and has not succeeded"""
+        result = await self.db.execute(
+            select(RecommendationBatchRun.status).where(RecommendationBatchRun.run_key == run_key)
+        )
+        status = result.scalar_one_or_none()
+        return status is not None and status != JOB_SUCCEEDED
+    
+    async def _finish(self, status: str, **values: Any) -> bool:
+        """Mark the run finished, unless another process has taken it over"""
+        finished = await self._checkpoint(status=status, finished_at=datetime.utcnow(), **values)
+        await self.db.commit()
+        return finished
+    
+    async def _next_users(self, cursor: Optional[str]) -> List[str]:
+        """IDs of the next chunk of active users after `cursor`"""
+        query = select(User.id).where(User.is_active == True)
+        if cursor is not None:
+            query = query.where(User.id > cursor)
+        result = await self.db.execute(query.order_by(User.id).limit(settings.BATCH_CHUNK_SIZE))
+        return list(result.scalars().all())
+    
+    async def _process_chunk(self, user_ids: List[str], market_data: Dict[str, Any]) -> List[Recommendation]:
+        """Build (unsaved) recommendations for a chunk of users"""
+        wallets = await self._active_wallets(user_ids)
+        latest = await self._latest_recommendations(user_ids)
+        balances = await self._fetch_balances([wallet for group in wallets.values() for wallet in group])
+        
+        async def recommend(user_id: str) -> Optional[Recommendation]:
+            try:
+                return await self._recommend(user_id, wallets.get(user_id, []), balances, latest.get(user_id), market_data)
+            except Exception as e:
+                logger.warning("Batch recommendation for user %s failed: %s", user_id, e)
+                self.stats["failed"] += 1
+                self.stats["errors"] = (self.stats["errors"] + [{"user_id": user_id, "error": str(e)}])[-MAX_RECORDED_ERRORS:]
+                return None
+        
+        results = await asyncio.gather(*(recommend(user_id) for user_id in user_ids))
+        self.stats["users"] += len(user_ids)
+        return [row for row in results if row is not None]
+    
+    async def _recommend(
+        self,
+        user_id: str,
+        wallets: List[Wallet],
+        balances: Dict[str, Dict[str, Any]],
+        previous: Optional[Recommendation],
+        market_data: Dict[str, Any]
+    ) -> Optional[Recommendation]:
+        """A new recommendation for one user, or None when the last one still applies"""
+        missing = [wallet.address for wallet in wallets if wallet.id not in balances]
+        if missing:
+            raise BlockchainError(f"Balances unavailable for wallets {', '.join(missing)}")
+        wallet_data = {
+            "wallets": [
+                {"address": wallet.address, "network": wallet.network.value, "balances": balances[wallet.id]}
+                for wallet in wallets
+            ],
+            "total_wallets": len(wallets)
+        }
+        
+        # Users keep the profile of their last request; others get the defaults
+        last_input = (previous.input_fingerprint or {}) if previous is not None else {}
+        profile = last_input.get("profile") or {}
+        ai_input = strategy_input(
+            profile.get("risk_tolerance", "medium"),
+            last_input.get("investment_amount"),
+            profile.get("time_horizon", "medium"),
+            profile.get("preferred_protocols"),
+            wallet_data,
+            market_data
+        )
+        fingerprint = input_fingerprint(ai_input)
+        
+        if previous is not None and self.strategy_service._is_reusable(previous, fingerprint):
+            self.stats["unchanged"] += 1
+            return None
+        
+        ai_output = await cached_ai_output(ai_input, lambda: self._complete(ai_input))
+        
+        self.stats["generated"] += 1
+        return self.strategy_service._build_recommendation(user_id, ai_input, fingerprint, ai_output)
+    
+    async def _complete(self, ai_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Get a strategy from the LLM, counting its token usage"""
+        prompt = self.strategy_service._assemble_strategy_prompt(ai_input)
+        async with self._llm_slots:
+            completion = await llm_gateway.chat(prompt.messages, temperature=0.7, max_tokens=prompt.max_tokens)
+        usage = completion.get("usage") or {}
+        self.stats["llm_calls"] += 1
+        self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+        return self.strategy_service._parse_ai_response(completion["content"])
+    
+    async def _active_wallets(self, user_ids: List[str]) -> Dict[str, List[Wallet]]:
+        """Active wallets of a chunk of users, in one query"""
+        result = await self.db.execute(
+            select(Wallet)
+            .where(Wallet.user_id.in_(user_ids), Wallet.is_active == True)
+            .order_by(Wallet.created_at.desc())
+        )
+        wallets = defaultdict(list)
+        for wallet in result.scalars().all():
+            wallets[wallet.user_id].append(wallet)
+        return wallets
+    
+    async def _latest_recommendations(self, user_ids: List[str]) -> Dict[str, Recommendation]:
+        """Each user's most recent recommendation, in one query (payload blobs not loaded)"""
+        latest = (
+            select(Recommendation.user_id, func.max(Recommendation.created_at).label("created_at"))
+            .where(Recommendation.user_id.in_(user_ids))
+            .group_by(Recommendation.user_id)
+            .subquery()
+        )
+        result = await self.db.execute(
+            select(Recommendation)
+            .options(lazyload(Recommendation.raw_input_blob))
+            .join(latest, and_(
+                Recommendation.user_id == latest.c.user_id,
+                Recommendation.created_at == latest.c.created_at
+            ))
+        )
+        return {recommendation.user_id: recommendation for recommendation in result.scalars().all()}
+    
+    async def _fetch_balances(self, wallets: List[Wallet]) -> Dict[str, Dict[str, Any]]:
+        """Balances by wallet ID, `BATCH_BALANCE_CONCURRENCY` at a time (failed wallets are left out)"""
+        slots = asyncio.Semaphore(settings.BATCH_BALANCE_CONCURRENCY)
+        balances: Dict[str, Dict[str, Any]] = {}
+        
+        async def fetch(wallet: Wallet) -> None:
+            async with slots:
+                try:
+                    if wallet.descriptor:
+                        # HD scans write address state, so each needs its own session
+                        async with self.session_factory() as session:
+                            owned = await session.get(Wallet, wallet.id)
+                            balances[wallet.id] = await WalletService(session).get_wallet_balances(owned)
+                    else:
+                        balances[wallet.id] = await self.strategy_service.wallet_service.get_wallet_balances(wallet)
+                except Exception as e:
+                    logger.warning("Batch balance fetch for wallet %s failed: %s", wallet.address, e)
+                    self.stats["balance_errors"] += 1
+        
+        await asyncio.gather(*(fetch(wallet) for wallet in wallets))
+        return balances
+
+
+def seconds_until_hour(hour: int, now: Optional[datetime] = None) -> float:
+    """Seconds from `now` (UTC) until the next time the clock reaches `hour`:00"""
+    now = now or datetime.utcnow()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+async def run_until_finished(run_key: str, create: bool = True, session_factory=SessionLocal) -> None:
+    """Run (or resume) the batch for `run_key`, retrying until it succeeds
+    
+    Failed attempts, and runs another process holds, are retried after
+    `BATCH_RETRY_SECONDS`, doubling up to `BATCH_RETRY_MAX_SECONDS`. Gives
+    up once the next nightly run is due, which covers the same users.
+    """
+    delay = settings.BATCH_RETRY_SECONDS
+    give_up_at = time.monotonic() + seconds_until_hour(settings.BATCH_RECOMMENDATION_HOUR)
+    while True:
+        try:
+            async with session_factory() as db:
+                service = BatchRecommendationService(db, session_factory)
+                await service.run(run_key, create=create)
+                if not await service.unfinished(run_key):
+                    return
+            logger.info("Batch recommendations %s unfinished, checking again in %ds", run_key, delay)
+        except Exception:
+            logger.exception("Batch recommendations %s failed, retrying in %ds", run_key, delay)
+        # Any later attempt resumes the run this one created
+        create = False
+        if time.monotonic() + delay >= give_up_at:
+            logger.warning("Batch recommendations %s left unfinished for the next nightly run", run_key)
+            return
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.BATCH_RETRY_MAX_SECONDS)
+
+
+async def run_batch_recommendation_loop() -> None:
+    """Run the batch every night (started from the app lifespan)
+    
+    At startup, an unfinished run for yesterday, left by a restart, is
+    resumed, and today's run is resumed, or created if this process was
+    down at BATCH_RECOMMENDATION_HOUR.
+    """
+    now = datetime.utcnow()
+    await run_until_finished((now.date() - timedelta(days=1)).isoformat(), create=False)
+    await run_until_finished(now.date().isoformat(), create=now.hour >= settings.BATCH_RECOMMENDATION_HOUR)
+    while True:
+        await asyncio.sleep(seconds_until_hour(settings.BATCH_RECOMMENDATION_HOUR))
+        await run_until_finished(datetime.utcnow().date().isoformat())
@@ -0,0 +1,316 @@
+"""
+Chain-tip watcher for block-height-aware caching of on-chain data
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import time
+import httpx
+
+from app.core.config import settings
+from app.core.rate_governor import Priority, set_priority
+from app.core.upstream import EndpointPool, bitcoin_pool, stacks_pool
+from app.models.wallet import NetworkType
+
+logger = logging.getLogger(__name__)
+
+# Tip advances larger than this invalidate the whole network instead of scanning blocks
+MAX_SCANNED_BLOCKS = 10
+
+# Block transaction pages scanned per Stacks block before giving up
+MAX_BLOCK_PAGES = 20
+
+# Newest mempool transactions scanned per Stacks poll (the API maximum)
+MEMPOOL_PAGE_SIZE = 50
+
+
+class StacksTipSource:
+    """Chain tip, block contents and mempool from the Hiro Stacks API
+    
+    Only the newest page of the mempool (MEMPOOL_PAGE_SIZE transactions) is
+    scanned each poll; when the mempool is larger, `mempool_complete` is
+    False and pending transactions beyond that page go unseen.
+    """
+    
+    network = NetworkType.STACKS.value
+    
+    def __init__(self, pool: EndpointPool):
+        self.pool = pool
+        self.mempool_complete = False
+        self._mempool_seen: Set[str] = set()
+    
+    async def tip(self, client: httpx.AsyncClient) -> Tuple[int, str]:
+        """Height and hash of the latest block"""
+        response = await self.pool.get(client, "/extended/v2/blocks/latest")
+        response.raise_for_status()
+        data = response.json()
+        return int(data["height"]), data["hash"]
+    
+    async def hash_at(self, client: httpx.AsyncClient, height: int) -> Optional[str]:
+        """Hash of the canonical block at a height"""
+        response = await self.pool.get(client, f"/extended/v2/blocks/{height}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()["hash"]
+    
+    async def touched_addresses(self, client: httpx.AsyncClient, heights: Iterable[int]) -> Optional[Set[str]]:
+        """Addresses involved in the blocks at `heights`, or None if unknown"""
+        addresses: Set[str] = set()
+        for height in heights:
+            offset = 0
+            for _ in range(MAX_BLOCK_PAGES):
+                response = await self.pool.get(
+                    client,
+                    f"/extended/v2/blocks/{height}/transactions",
+                    params={"limit": 50, "offset": offset}
+                )
+                response.raise_for_status()
+                data = response.json()
+                results = data.get("results", [])
+                for tx in results:
+                    addresses.update(stacks_tx_addresses(tx))
+                offset += len(results)
+                if not results or offset >= data.get("total", 0):
+                    break
+            else:
+                return None
+        return addresses
+    
+    async def mempool_addresses(self, client: httpx.AsyncClient) -> Set[str]:
+        """Addresses involved in mempool transactions not seen on the previous poll"""
+        response = await self.pool.get(client, "/extended/v1/tx/mempool", params={"limit": MEMPOOL_PAGE_SIZE})
+        response.raise_for_status()
+        data = response.json()
+        results = data.get("results", [])
+        self.mempool_complete = data.get("total", len(results)) <= len(results)
+        seen = {tx.get("tx_id") for tx in results}
+        addresses: Set[str] = set()
+        for tx in results:
+            if tx.get("tx_id") not in self._mempool_seen:
+                addresses.update(stacks_tx_addresses(tx))
+        self._mempool_seen = seen
+        return addresses
+
+
+class BitcoinTipSource:
+    """Chain tip from a Blockstream (Esplora) API
+    
+    Esplora only exposes a block's addresses through one request per
+    transaction, and blocks are ten minutes apart, so every new block
+    invalidates all Bitcoin entries. Its mempool endpoints do not list
+    addresses either, so pending transactions are never seen here
+    (`mempool_complete` is False); with the Electrum backend, subscribed
+    addresses are invalidated by its notifications instead.
+    """
+    
+    network = NetworkType.BITCOIN.value
+    mempool_complete = False
+    
+    def __init__(self, pool: EndpointPool):
+        self.pool = pool
+    
+    async def tip(self, client: httpx.AsyncClient) -> Tuple[int, str]:
+        """Height and hash of the latest block"""
+        height = await self.pool.get(client, "/blocks/tip/height")
+        height.raise_for_status()
+        block_hash = await self.pool.get(client, "/blocks/tip/hash")
+        block_hash.raise_for_status()
+        return int(height.text), block_hash.text.strip()
+    
+    async def hash_at(self, client: httpx.AsyncClient, height: int) -> Optional[str]:
+        """Hash of the canonical block at a height"""
+        response = await self.pool.get(client, f"/block-height/{height}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.text.strip()
+    
+    async def touched_addresses(self, client: httpx.AsyncClient, heights: Iterable[int]) -> Optional[Set[str]]:
+        """Unknown for Esplora; see the class docstring"""
+        return None
+    
+    async def mempool_addresses(self, client: httpx.AsyncClient) -> Set[str]:
+        """Not available from Esplora; see the class docstring"""
+        return set()
+
+
+def stacks_tx_addresses(tx: Dict[str, Any]) -> Set[str]:
+    """Principals whose balances a Stacks transaction may change"""
+    addresses = {tx.get("sender_address"), tx.get("sponsor_address")}
+    token_transfer = tx.get("token_transfer") or {}
+    addresses.add(token_transfer.get("recipient_address"))
+    contract_call = tx.get("contract_call") or {}
+    if contract_call.get("contract_id"):
+        addresses.add(contract_call["contract_id"].split(".", 1)[0])
+    for arg in contract_call.get("function_args") or []:
+        if arg.get("type") == "principal":
+            addresses.add(arg.get("repr", "").lstrip("'").split(".", 1)[0])
+    addresses.discard(None)
+    addresses.discard("")
+    return addresses
+
+
+class ChainTipWatcher:
+    """Tracks chain tips and the epoch at which each watched address last changed
+    
+    An epoch is the tip height and hash at which data was invalidated, plus a
+    counter for invalidations at the same height (mempool activity, reorgs).
+    Cache keys for on-chain data embed the address epoch, so a new block only
+    invalidates entries for the addresses it involves. A reorg, a scan that
+    cannot be completed, or a network without per-block address data moves
+    the whole network's floor epoch instead.
+    
+    Only new-block epochs (counter 0) mean the same chain state in every
+    process, so only their entries may use the shared cache tier; the
+    counters are local to this process. Pending transactions are only seen
+    where the source's mempool view is complete, so otherwise cached entries
+    live for at most CHAIN_TIP_PENDING_TTL.
+    
+    Moving the floor forgets every watched address of the network: keys
+    made before it are unreachable, and an address is watched again by the
+    next key made for it. Past `max_watched` addresses the floor is moved,
+    which keeps the watch list bounded.
+    """
+    
+    def __init__(self, sources: List[Any], interval: float, max_watched: int = 100000):
+        self.sources = {source.network: source for source in sources}
+        self.interval = interval
+        self.max_watched = max_watched
+        self.tips: Dict[str, Tuple[int, str]] = {}
+        self.reorgs = 0
+        self._floors: Dict[str, Tuple[int, int, str]] = {}
+        self._latest: Dict[str, Tuple[int, int, str]] = {}
+        self._epochs: Dict[str, Dict[str, Tuple[int, int, str]]] = {}
+        self._polled_at: Dict[str, float] = {}
+    
+    def epoch(self, network: str, address: str) -> Tuple[int, int, str]:
+        """Epoch (height, counter, tip hash) at which cached data for an address was last invalidated"""
+        epochs = self._epochs.setdefault(network, {})
+        if address not in epochs and len(epochs) >= self.max_watched:
+            self.invalidate(network)
+            epochs = self._epochs.setdefault(network, {})
+        # Watch the address from now on; the floor covers anything earlier
+        own = epochs.setdefault(address, (0, 0, ""))
+        return max(self._floors.get(network, (0, 0, "")), own)
+    
+    def cache_key(self, network: str, address: str, *parts: Any, watch: Iterable[str] = ()) -> str:
+        """Cache key for an address that changes whenever its epoch does
+        
+        Data derived from other addresses too (e.g. an HD wallet's) passes
+        them as `watch`; the key then changes when any of their epochs does.
+        """
+        height, seq, block_hash = self._combined_epoch(network, address, watch)
+        suffix = "".join(f":{part}" for part in parts)
+        return f"{network}:{address}{suffix}@{height}:{block_hash}.{seq}"
+    
+    def is_shared(self, network: str, address: str, watch: Iterable[str] = ()) -> bool:
+        """Whether an address's cache key means the same data in every process"""
+        return self._combined_epoch(network, address, watch)[1] == 0
+    
+    def _combined_epoch(self, network: str, address: str, watch: Iterable[str]) -> Tuple[int, int, str]:
+        """Latest epoch of an address and the addresses it watches"""
+        return max([self.epoch(network, address)] + [self.epoch(network, other) for other in watch])
+    
+    def cache_ttl(self, network: str) -> Optional[float]:
+        """Long TTL while the tip is being tracked, otherwise None (the cache default)
+        
+        The TTL is capped at CHAIN_TIP_PENDING_TTL while the network's
+        mempool cannot be fully scanned.
+        """
+        polled_at = self._polled_at.get(network)
+        if polled_at is None or time.monotonic() - polled_at > 3 * self.interval:
+            return None
+        if not self.sources[network].mempool_complete:
+            return min(settings.CHAIN_TIP_CACHE_TTL, settings.CHAIN_TIP_PENDING_TTL)
+        return settings.CHAIN_TIP_CACHE_TTL
+    
+    def invalidate(self, network: str, addresses: Optional[Iterable[str]] = None, pending: bool = False) -> None:
+        """Invalidate watched addresses, or the whole network when `addresses` is None
+        
+        `pending` invalidations (mempool activity, notifications) are not tied
+        to a block, so their epochs stay local to this process.
+        """
+        if addresses is None:
+            self._floors[network] = self._next_epoch(network, pending)
+            # Every watched epoch is now below the floor
+            self._epochs.pop(network, None)
+            return
+        epochs = self._epochs.get(network, {})
+        watched = [address for address in addresses if address in epochs]
+        if watched:
+            epoch = self._next_epoch(network, pending)
+            for address in watched:
+                epochs[address] = epoch
+    
+    def _next_epoch(self, network: str, pending: bool = False) -> Tuple[int, int, str]:
+        """A new epoch for the network, later than every one handed out so far"""
+        height, block_hash = self.tips.get(network, (0, ""))
+        latest = self._latest.get(network, (0, 0, ""))
+        candidate = (height, 1 if pending else 0)
+        if candidate > latest[:2]:
+            epoch = (*candidate, block_hash)
+        else:
+            epoch = (latest[0], latest[1] + 1, block_hash)
+        self._latest[network] = epoch
+        return epoch
+    
+    async def poll(self, client: httpx.AsyncClient) -> None:
+        """Check every network's tip once"""
+        for network, source in self.sources.items():
+            try:
+                await self._poll_source(client, source)
+            except Exception as e:
+                logger.warning("Chain tip poll failed for %s: %s", network, e)
+            else:
+                self._polled_at[network] = time.monotonic()
+    
+    async def _poll_source(self, client: httpx.AsyncClient, source: Any) -> None:
+        network = source.network
+        height, block_hash = await source.tip(client)
+        previous = self.tips.get(network)
+        
+        mempool = await source.mempool_addresses(client)
+        
+        if previous is None:
+            self.tips[network] = (height, block_hash)
+            self.invalidate(network)
+            return
+        
+        previous_height, previous_hash = previous
+        if (height, block_hash) == previous:
+            self.invalidate(network, mempool, pending=True)
+            return
+        
+        self.tips[network] = (height, block_hash)
+        if height <= previous_height or await source.hash_at(client, previous_height) != previous_hash:
+            self.reorgs += 1
+            logger.warning(
+                "Reorg on %s: tip %d %s replaced by %d %s",
+                network, previous_height, previous_hash, height, block_hash
+            )
+            self.invalidate(network)
+        else:
+            touched = None
+            if height - previous_height <= MAX_SCANNED_BLOCKS:
+                touched = await source.touched_addresses(client, range(previous_height + 1, height + 1))
+            self.invalidate(network, touched)
+        self.invalidate(network, mempool, pending=True)
+
+
+async def run_chain_tip_loop() -> None:
+    """Poll the chain tips for this process until cancelled"""
+    set_priority(Priority.BACKGROUND)
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        while True:
+            await chain_tip_watcher.poll(client)
+            await asyncio.sleep(chain_tip_watcher.interval)
+
+
+# Global watcher (polled from the app lifespan when enabled)
+chain_tip_watcher = ChainTipWatcher(
+    [StacksTipSource(stacks_pool), BitcoinTipSource(bitcoin_pool)],
+    interval=settings.CHAIN_TIP_POLL_SECONDS,
+    max_watched=settings.CHAIN_TIP_MAX_WATCHED
+)
@@ -3,12 +3,20 @@ Education service for DeFi learning and explanations
 """
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Dict, Any, List
-import httpx
+from typing import Any, AsyncIterator, Dict, List, Tuple
+import hashlib
 import json
 
+from app.core.cache import get_cache
 from app.core.config import settings
-from app.core.exceptions import AIError
+from app.core.exceptions import AIError, DeadlineExceededError
+from app.services.json_stream import JSONFieldStream
+from app.services.llm_gateway import llm_gateway
+from app.services.prompt_assembler import AssembledPrompt, PromptAssembler
+
+EDUCATION_SYSTEM_PROMPT = "You are Satoshi Sensei, an expert DeFi educator specializing in Bitcoin and Stacks ecosystems. Provide clear, accurate, and engaging educational content."
+
+content_cache = get_cache("education:content", ttl=settings.EDUCATION_CACHE_TTL)
 
 
 class EducationService:
@@ -25,13 +33,51 @@ class EducationService:
     ) -> Dict[str, Any]:
         """Get educational content about a DeFi topic"""
         try:
-            # Call Groq AI for educational content
-            content = await self._call_groq_education_api(topic, level, context)
+            # Call Groq AI for educational content (only AI answers are cached)
+            content = await content_cache.get_or_compute(
+                self._content_key(topic, level, context),
+                lambda: self._call_groq_education_api(topic, level, context)
+            )
             return content
         except Exception as e:
             # Fallback to static content
             return self._get_static_education_content(topic, level)
     
+    async def stream_education_content(
+        self,
+        topic: str,
+        level: str = "beginner",
+        context: str = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Get educational content, yielding events while the completion streams
+        
+        Yields ("token", text) for each chunk of model output, ("field",
+        {"name", "value"}) as each top-level field of the JSON answer
+        completes, and finally ("content", content). Cached answers and the
+        static fallback yield their fields straight away.
+        """
+        cache_key = self._content_key(topic, level, context)
+        content = await content_cache.get(cache_key)
+        if content is None:
+            prompt = self._assemble_education_prompt(topic, level, context)
+            parser = JSONFieldStream()
+            try:
+                async for text in llm_gateway.stream_chat(prompt.messages, temperature=0.7, max_tokens=prompt.max_tokens):
+                    yield "token", text
+                    for name, value in parser.feed(text):
+                        yield "field", {"name": name, "value": value}
+                content = dict(parser.fields) if parser.done else self._parse_education_response(topic, level, parser.text)
+                await content_cache.set(cache_key, content)
+            except Exception:
+                # Fallback to static content
+                content = self._get_static_education_content(topic, level)
+                for name, value in content.items():
+                    yield "field", {"name": name, "value": value}
+        else:
+            for name, value in content.items():
+                yield "field", {"name": name, "value": value}
+        yield "content", content
+    
     async def explain_concept(
         self,
         topic: str,
@@ -47,88 +93,77 @@ class EducationService:
         level: str,
         context: str = None
     ) -> Dict[str, Any]:
-        """Call Groq AI API for educational content"""
+        """Get educational content from the LLM gateway"""
         try:
-            prompt = self._create_education_prompt(topic, level, context)
+            prompt = self._assemble_education_prompt(topic, level, context)
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"https://api.groq.com/openai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": settings.GROQ_MODEL,
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "You are Satoshi Sensei, an expert DeFi educator specializing in Bitcoin and Stacks ecosystems. Provide clear, accurate, and engaging educational content."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": 2000
-                    }
-                )
-                
-                if response.status_code != 200:
-                    raise AIError(f"Groq API error: {response.status_code}")
-                
-                result = response.json()
-                ai_response = result["choices"][0]["message"]["content"]
-                
-                # Parse AI response
-                try:
-                    return json.loads(ai_response)
-                except json.JSONDecodeError:
-                    # If not JSON, create structured response
-                    return {
-                        "topic": topic,
-                        "level": level,
-                        "explanation": ai_response,
-                        "key_concepts": [],
-                        "examples": [],
-                        "related_topics": [],
-                        "resources": []
-                    }
+            completion = await llm_gateway.chat(
+                prompt.messages,
+                temperature=0.7,
+                max_tokens=prompt.max_tokens
+            )
+            return self._parse_education_response(topic, level, completion["content"])
+        except DeadlineExceededError:
+            raise
         except Exception as e:
             raise AIError(f"Failed to get educational content: {str(e)}")
     
+    def _content_key(self, topic: str, level: str, context: str = None) -> str:
+        """Cache key for a topic, level and context"""
+        context_key = hashlib.sha256(context.encode()).hexdigest()[:16] if context else ""
+        return f"{topic.lower()}:{level}:{context_key}"
+    
+    def _parse_education_response(self, topic: str, level: str, ai_response: str) -> Dict[str, Any]:
+        """Parse AI response"""
+        try:
+            return json.loads(ai_response)
+        except json.JSONDecodeError:
+            # If not JSON, create structured response
+            return {
+                "topic": topic,
+                "level": level,
+                "explanation": ai_response,
+                "key_concepts": [],
+                "examples": [],
+                "related_topics": [],
+                "resources": []
+            }
+    
     def _create_education_prompt(self, topic: str, level: str, context: str = None) -> str:
         """Create prompt for Groq AI education"""
-        context_text = f"\nContext: {context}" if context else ""
-        
-        return f"""
-        Create educational content about "{topic}" for a {level} level audience.{context_text}
-        
-        Please provide a JSON response with the following structure:
+        return self._assemble_education_prompt(topic, level, context).user
+    
+    def _assemble_education_prompt(self, topic: str, level: str, context: str = None) -> AssembledPrompt:
+        """Build the education messages within the token budget (long user context is cut)"""
+        return (
+            PromptAssembler(EDUCATION_SYSTEM_PROMPT)
+            .add("topic", f'Create educational content about "{topic}" for a {level} level audience.', required=True)
+            .add("context", f"Context: {context}" if context else None)
+            .add("format", f"""Please provide a JSON response with the following structure:
+{{
+    "topic": "{topic}",
+    "level": "{level}",
+    "explanation": "Clear, comprehensive explanation of the topic",
+    "key_concepts": ["concept1", "concept2", "concept3"],
+    "examples": [
         {{
-            "topic": "{topic}",
-            "level": "{level}",
-            "explanation": "Clear, comprehensive explanation of the topic",
-            "key_concepts": ["concept1", "concept2", "concept3"],
-            "examples": [
-                {{
-                    "title": "Example title",
-                    "description": "Detailed example explanation"
-                }}
-            ],
-            "related_topics": ["related_topic1", "related_topic2"],
-            "resources": [
-                {{
-                    "title": "Resource title",
-                    "url": "resource_url",
-                    "type": "article|video|documentation"
-                }}
-            ]
+            "title": "Example title",
+            "description": "Detailed example explanation"
         }}
-        
-        Focus on practical, actionable information relevant to Bitcoin and Stacks DeFi ecosystems.
-        """
+    ],
+    "related_topics": ["related_topic1", "related_topic2"],
+    "resources": [
+        {{
+            "title": "Resource title",
+            "url": "resource_url",
+            "type": "article|video|documentation"
+        }}
+    ]
+}}
+
+Focus on practical, actionable information relevant to Bitcoin and Stacks DeFi ecosystems.""", required=True)
+            .build()
+        )
     
     def _get_static_education_content(self, topic: str, level: str) -> Dict[str, Any]:
         """Fallback static educational content"""
@@ -0,0 +1,311 @@
+"""
+Electrum-protocol Bitcoin backend over one persistent connection
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import ssl
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.exceptions import ExternalAPIError, ValidationError
+from app.models.wallet import NetworkType
+from app.services.chain_tip import chain_tip_watcher
+
+try:
+    from embit.script import address_to_scriptpubkey
+except ImportError:  # pragma: no cover - needed only for the Electrum backend
+    address_to_scriptpubkey = None
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = "1.4"
+
+
+def address_to_scripthash(address: str) -> str:
+    """Electrum script hash: reversed SHA-256 of the address's output script, in hex"""
+    if address_to_scriptpubkey is None:
+        raise ValidationError("The Electrum backend requires the embit package")
+    try:
+        script = address_to_scriptpubkey(address).data
+    except Exception as e:
+        raise ValidationError(f"Invalid Bitcoin address: {str(e)}")
+    return hashlib.sha256(script).digest()[::-1].hex()
+
+
+class ElectrumClient:
+    """Newline-delimited JSON-RPC client for an Electrum server
+    
+    One connection is opened lazily and shared by all callers. Requests are
+    matched to responses by id, so concurrent callers can pipeline, and
+    `batch` sends many calls in a single write. Server notifications are
+    passed to `on_notification`. The connection is re-established on the
+    next call after it drops; the `max_subscriptions` most recently used
+    subscriptions are replayed on reconnect.
+    """
+    
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        use_ssl: bool = True,
+        timeout: float = 10.0,
+        on_notification: Optional[Callable[[str, List[Any]], None]] = None,
+        max_message_size: int = 16 * 1024 * 1024,
+        max_subscriptions: int = 10000
+    ):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.on_notification = on_notification
+        self.max_message_size = max_message_size
+        self.max_subscriptions = max_subscriptions
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._subscriptions: "OrderedDict[Tuple[str, str], List[Any]]" = OrderedDict()
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+    
+    @property
+    def connected(self) -> bool:
+        """Whether the connection is open"""
+        return self._writer is not None and not self._writer.is_closing()
+    
+    async def call(self, method: str, *params: Any) -> Any:
+        """Make one JSON-RPC call"""
+        return (await self.batch([(method, list(params))]))[0]
+    
+    async def batch(self, calls: List[Tuple[str, List[Any]]]) -> List[Any]:
+        """Make several JSON-RPC calls in one round trip, returning results in order"""
+        if not calls:
+            return []
+        await self._ensure_connected()
+        return await self._send(calls)
+    
+    def is_subscribed(self, method: str, params: List[Any]) -> bool:
+        """Whether a subscription is active (or will be replayed) on this client; marks it as recently used"""
+        key = (method, json.dumps(params))
+        if key not in self._subscriptions:
+            return False
+        self._subscriptions.move_to_end(key)
+        return True
+    
+    async def close(self) -> None:
+        """Close the connection, failing any calls still waiting"""
+        writer, self._writer = self._writer, None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ExternalAPIError("Electrum connection closed"))
+        self._pending.clear()
+    
+    async def _ensure_connected(self) -> None:
+        async with self._connect_lock:
+            if self.connected:
+                return
+            context = ssl.create_default_context() if self.use_ssl else None
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    # One response per line, and a busy address's history exceeds the 64 KiB default
+                    asyncio.open_connection(self.host, self.port, ssl=context, limit=self.max_message_size),
+                    self.timeout
+                )
+            except Exception as e:
+                raise ExternalAPIError(f"Failed to connect to Electrum server: {str(e)}")
+            self._reader_task = asyncio.create_task(self._read_loop(self._reader))
+            
+            # The version handshake must be the first message on the connection
+            calls = [("server.version", ["satoshi-sensei", PROTOCOL_VERSION])]
+            calls += [(method, params) for (method, _), params in self._subscriptions.items()]
+            await self._send(calls)
+    
+    async def _send(self, calls: List[Tuple[str, List[Any]]]) -> List[Any]:
+        """Write calls as one message and wait for their responses"""
+        loop = asyncio.get_running_loop()
+        requests = []
+        futures = []
+        for method, params in calls:
+            self._next_id += 1
+            future = loop.create_future()
+            self._pending[self._next_id] = future
+            futures.append(future)
+            requests.append({"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params})
+            if method.endswith(".subscribe"):
+                self._remember_subscription(method, params)
+        
+        try:
+            payload = requests[0] if len(requests) == 1 else requests
+            self._writer.write(json.dumps(payload).encode() + b"\n")
+            await self._writer.drain()
+            return await asyncio.wait_for(asyncio.gather(*futures), deadline.timeout(self.timeout))
+        except ExternalAPIError:
+            raise
+        except Exception as e:
+            await self.close()
+            raise ExternalAPIError(f"Electrum request failed: {str(e)}")
+        finally:
+            for request in requests:
+                self._pending.pop(request["id"], None)
+    
+    def _remember_subscription(self, method: str, params: List[Any]) -> None:
+        """Record a subscription for replay, dropping the least recently used past the cap
+        
+        A dropped subscription stays active on the current connection; it is
+        only not replayed, and is made again the next time it is looked up.
+        """
+        key = (method, json.dumps(params))
+        self._subscriptions[key] = params
+        self._subscriptions.move_to_end(key)
+        while len(self._subscriptions) > self.max_subscriptions:
+            self._subscriptions.popitem(last=False)
+    
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                for item in message if isinstance(message, list) else [message]:
+                    self._dispatch(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Electrum connection lost: %s", e)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ExternalAPIError("Electrum connection closed"))
+    
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        if "id" not in message or message["id"] is None:
+            if self.on_notification is not None:
+                self.on_notification(message.get("method"), message.get("params") or [])
+            return
+        future = self._pending.get(message["id"])
+        if future is None or future.done():
+            return
+        if message.get("error"):
+            error = message["error"]
+            detail = error.get("message") if isinstance(error, dict) else error
+            future.set_exception(ExternalAPIError(f"Electrum error: {detail}"))
+        else:
+            future.set_result(message.get("result"))
+
+
+class ElectrumBackend:
+    """Bitcoin address lookups through an Electrum server
+    
+    Multi-address lookups are sent as one batch, so they cost a single
+    round trip. Looked-up addresses are subscribed to; when the server
+    reports a change, the address's chain epoch is bumped so cached
+    balances and history for it are invalidated.
+    """
+    
+    def __init__(self, client: ElectrumClient):
+        self.client = client
+        client.on_notification = self._on_notification
+        self._addresses: Dict[str, str] = {}  # scripthash -> address
+    
+    async def get_balances(self, addresses: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Balances and transaction counts for addresses, keyed by address"""
+        addresses = list(dict.fromkeys(addresses))
+        scripthashes = [self._watch(address) for address in addresses]
+        calls = []
+        for scripthash in scripthashes:
+            calls.append(("blockchain.scripthash.get_balance", [scripthash]))
+            calls.append(("blockchain.scripthash.get_history", [scripthash]))
+        calls += self._subscribe_calls(scripthashes)
+        results = await self.client.batch(calls)
+        
+        balances = {}
+        for i, address in enumerate(addresses):
+            balance, history = results[2 * i], results[2 * i + 1] or []
+            balances[address] = {
+                "confirmed": balance.get("confirmed", 0),
+                "unconfirmed": balance.get("unconfirmed", 0),
+                "tx_count": len(history)
+            }
+        return balances
+    
+    async def list_unspent(self, addresses: Iterable[str]) -> List[Dict[str, Any]]:
+        """Unspent outputs of addresses, in the UTXO index's shape"""
+        addresses = list(dict.fromkeys(addresses))
+        scripthashes = [self._watch(address) for address in addresses]
+        calls = [("blockchain.scripthash.listunspent", [scripthash]) for scripthash in scripthashes]
+        calls += self._subscribe_calls(scripthashes)
+        results = await self.client.batch(calls)
+        
+        utxos = []
+        for address, unspent in zip(addresses, results):
+            for utxo in unspent or []:
+                utxos.append({
+                    "txid": utxo["tx_hash"],
+                    "vout": utxo["tx_pos"],
+                    "value": utxo["value"],
+                    "height": utxo["height"] if utxo.get("height", 0) > 0 else None,
+                    "address": address
+                })
+        return utxos
+    
+    async def close(self) -> None:
+        """Close the server connection"""
+        await self.client.close()
+    
+    def _watch(self, address: str) -> str:
+        scripthash = address_to_scripthash(address)
+        self._addresses[scripthash] = address
+        if len(self._addresses) > 2 * self.client.max_subscriptions:
+            # Forget addresses whose subscriptions the client no longer replays
+            self._addresses = {
+                key: value for key, value in self._addresses.items()
+                if key == scripthash or self.client.is_subscribed("blockchain.scripthash.subscribe", [key])
+            }
+        return scripthash
+    
+    def _subscribe_calls(self, scripthashes: List[str]) -> List[Tuple[str, List[Any]]]:
+        """Subscriptions for script hashes not yet subscribed on this connection"""
+        return [
+            ("blockchain.scripthash.subscribe", [scripthash])
+            for scripthash in scripthashes
+            if not self.client.is_subscribed("blockchain.scripthash.subscribe", [scripthash])
+        ]
+    
+    def _on_notification(self, method: str, params: List[Any]) -> None:
+        if method == "blockchain.scripthash.subscribe" and params:
+            address = self._addresses.get(params[0])
+            if address is not None:
+                chain_tip_watcher.invalidate(NetworkType.BITCOIN.value, [address], pending=True)
+
+
+def _create_backend() -> Optional[ElectrumBackend]:
+    """Electrum backend when BITCOIN_BACKEND is "electrum\""""
+    if settings.BITCOIN_BACKEND != "electrum":
+        return None
+    return ElectrumBackend(ElectrumClient(
+        settings.ELECTRUM_HOST,
+        settings.ELECTRUM_PORT,
+        use_ssl=settings.ELECTRUM_SSL,
+        timeout=settings.ELECTRUM_TIMEOUT,
+        max_message_size=settings.ELECTRUM_MAX_MESSAGE_BYTES,
+        max_subscriptions=settings.ELECTRUM_MAX_SUBSCRIPTIONS
+    ))
+
+
+# Global Electrum backend (None unless configured)
+electrum_backend = _create_backend()
@@ -0,0 +1,249 @@
+"""
+HD wallet service for xpub/descriptor wallets with gap-limit address discovery
+"""
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Dict, Any, Tuple
+import asyncio
+import httpx
+import weakref
+from datetime import datetime
+
+from app.core.config import settings
+from app.core.exceptions import ExternalAPIError, ValidationError
+from app.core.upstream import bitcoin_pool
+from app.models.wallet import Wallet, WalletAddress
+from app.services.electrum import electrum_backend
+
+try:
+    from embit import bip32
+    from embit.descriptor import Descriptor
+    from embit.networks import NETWORKS
+except ImportError:  # pragma: no cover - descriptor wallets are optional
+    bip32 = None
+
+# Descriptor script template for each SLIP-132 extended key prefix
+KEY_PREFIX_TEMPLATES = {
+    "xpub": "pkh({})", "tpub": "pkh({})",
+    "ypub": "sh(wpkh({}))", "upub": "sh(wpkh({}))",
+    "zpub": "wpkh({})", "vpub": "wpkh({})",
+}
+
+# Scans in progress in this process, per wallet ID
+_scan_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# embit network names for settings.BITCOIN_NETWORK
+EMBIT_NETWORKS = {"mainnet": "main", "testnet": "test", "signet": "signet", "regtest": "regtest"}
+
+
+def parse_descriptor(value: str) -> Tuple[Any, str]:
+    """Parse an output descriptor or bare extended public key
+    
+    Bare keys become single-key descriptors based on their SLIP-132 prefix
+    (xpub: legacy, ypub: nested segwit, zpub: native segwit). Keys without a
+    derivation path get receive and change branches. Keys for a network other
+    than settings.BITCOIN_NETWORK are rejected. Returns the parsed descriptor
+    and its canonical string.
+    """
+    if bip32 is None:
+        raise ValidationError("Descriptor wallets require the embit package")
+    value = value.strip()
+    template = KEY_PREFIX_TEMPLATES.get(value[:4])
+    try:
+        if template is not None:
+            key = bip32.HDKey.from_string(value)
+            # Scripts come from the template, so keep the key in plain xpub/tpub form
+            version = NETWORKS["main" if value[0] in "xyz" else "test"]["xpub"]
+            value = template.format(f"{key.to_string(version=version)}/<0;1>/*")
+        descriptor = Descriptor.from_string(value.split("#", 1)[0])
+    except ValidationError:
+        raise
+    except Exception as e:
+        raise ValidationError(f"Invalid xpub or descriptor: {str(e)}")
+    
+    network = bitcoin_network()
+    if any(key.is_extended and key.key.version != network["xpub"] for key in descriptor.keys):
+        raise ValidationError(f"Extended key is not for the configured Bitcoin network ({settings.BITCOIN_NETWORK})")
+    if not descriptor.is_wildcard:
+        raise ValidationError("Descriptor must contain a wildcard (/*) derivation")
+    if descriptor.num_branches > 2:
+        raise ValidationError("Descriptor may have at most receive and change branches")
+    return descriptor, str(descriptor)
+
+
+def bitcoin_network() -> Dict[str, Any]:
+    """embit network parameters for settings.BITCOIN_NETWORK"""
+    return NETWORKS[EMBIT_NETWORKS.get(settings.BITCOIN_NETWORK, "test")]
+
+
+def derive_address(descriptor: Any, branch: int, index: int) -> str:
+    """Address at `index` on a descriptor branch (0 = receive, 1 = change)"""
+    branch = branch if descriptor.num_branches > 1 else None
+    return descriptor.derive(index, branch_index=branch).address(bitcoin_network())
+
+
+class HDWalletService:
+    """Service for discovering and refreshing the addresses of descriptor wallets
+    
+    Derived addresses and their used/unused state are stored in
+    `wallet_addresses`. Discovery probes the frontier (the `gap_limit`
+    addresses after the last used one on each branch) in concurrent batches
+    and stops once a full gap of unused addresses is found. Refreshes
+    re-probe that frontier plus used addresses that still hold funds;
+    emptied addresses are only re-probed by a full rescan.
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_balances(self, wallet: Wallet, full: bool = False) -> Dict[str, Any]:
+        """Scan a descriptor wallet and return its aggregated balances"""
+        addresses = await self.scan(wallet, full=full)
+        used = [address for address in addresses if address.used]
+        next_receive = next(
+            (address.address for address in addresses if address.branch == 0 and not address.used),
+            None
+        )
+        return {
+            "btc": {
+                "balance": sum(address.balance for address in used),
+                "unconfirmed_balance": sum(address.unconfirmed_balance for address in used),
+                "tx_count": sum(address.tx_count for address in used),
+                "used_addresses": len(used)
+            },
+            "addresses": [
+                {
+                    "address": address.address,
+                    "branch": address.branch,
+                    "index": address.derivation_index,
+                    "balance": address.balance,
+                    "unconfirmed_balance": address.unconfirmed_balance
+                }
+                for address in used
+            ],
+            "next_receive_address": next_receive,
+            "network": "bitcoin"
+        }
+    
+    async def get_addresses(self, wallet: Wallet) -> List[WalletAddress]:
+        """Stored derived addresses, ordered by branch and index"""
+        result = await self.db.execute(
+            select(WalletAddress)
+            .where(WalletAddress.wallet_id == wallet.id)
+            .order_by(WalletAddress.branch, WalletAddress.derivation_index)
+        )
+        return list(result.scalars().all())
+    
+    async def scan(self, wallet: Wallet, full: bool = False) -> List[WalletAddress]:
+        """Discover used addresses and refresh their state, returning every stored address
+        
+        Scans of one wallet run one at a time, since concurrent ones would
+        insert the same new addresses. If another process stores them first,
+        the scan is repeated on top of its rows.
+        """
+        lock = _scan_locks.setdefault(wallet.id, asyncio.Lock())
+        async with lock:
+            try:
+                return await self._scan(wallet, full)
+            except IntegrityError:
+                await self.db.rollback()
+                await self.db.refresh(wallet)
+                return await self._scan(wallet, full)
+    
+    async def _scan(self, wallet: Wallet, full: bool) -> List[WalletAddress]:
+        descriptor, _ = parse_descriptor(wallet.descriptor)
+        gap_limit = wallet.gap_limit or settings.HD_WALLET_GAP_LIMIT
+        branches = range(descriptor.num_branches if descriptor.num_branches > 1 else 1)
+        
+        stored = await self.get_addresses(wallet)
+        by_path = {(address.branch, address.derivation_index): address for address in stored}
+        probed = set()
+        
+        async with httpx.AsyncClient() as client:
+            semaphore = asyncio.Semaphore(settings.HD_WALLET_SCAN_CONCURRENCY)
+            
+            # Known addresses worth re-probing: everything on a full rescan, else those holding funds
+            refresh = [
+                address for address in stored
+                if full or (address.used and (address.balance or address.unconfirmed_balance))
+            ]
+            await self._probe(client, semaphore, refresh)
+            probed.update((address.branch, address.derivation_index) for address in refresh)
+            
+            for branch in branches:
+                while True:
+                    last_used = max(
+                        (index for (b, index), address in by_path.items() if b == branch and address.used),
+                        default=-1
+                    )
+                    frontier = range(last_used + 1, last_used + 1 + gap_limit)
+                    if frontier.stop > settings.HD_WALLET_MAX_ADDRESSES:
+                        break
+                    
+                    batch = []
+                    for index in frontier:
+                        address = by_path.get((branch, index))
+                        if address is None:
+                            address = WalletAddress(
+                                wallet_id=wallet.id,
+                                branch=branch,
+                                derivation_index=index,
+                                address=derive_address(descriptor, branch, index),
+                                used=False,
+                                tx_count=0,
+                                balance=0,
+                                unconfirmed_balance=0
+                            )
+                            self.db.add(address)
+                            by_path[(branch, index)] = address
+                        if (branch, index) not in probed:
+                            batch.append(address)
+                    if not batch:
+                        break
+                    
+                    await self._probe(client, semaphore, batch)
+                    probed.update((address.branch, address.derivation_index) for address in batch)
+                    if not any(address.used for address in batch):
+                        break
+        
+        await self.db.commit()
+        return sorted(by_path.values(), key=lambda address: (address.branch, address.derivation_index))
+    
+    async def _probe(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, addresses: List[WalletAddress]) -> None:
+        """Fetch address summaries concurrently and record them"""
+        if electrum_backend is not None:
+            # One batched round trip for the whole set
+            balances = await electrum_backend.get_balances([address.address for address in addresses])
+            now = datetime.utcnow()
+            for address in addresses:
+                balance = balances[address.address]
+                address.tx_count = balance["tx_count"]
+                address.used = address.used or address.tx_count > 0
+                address.balance = balance["confirmed"]
+                address.unconfirmed_balance = balance["unconfirmed"]
+                address.checked_at = now
+            return
+        
+        async def fetch(address: WalletAddress) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    response = await bitcoin_pool.get(client, f"/address/{address.address}")
+                    response.raise_for_status()
+                    return response.json()
+                except ExternalAPIError:
+                    raise
+                except Exception as e:
+                    raise ExternalAPIError(f"Failed to scan Bitcoin address: {str(e)}")
+        
+        summaries = await asyncio.gather(*[fetch(address) for address in addresses])
+        now = datetime.utcnow()
+        for address, summary in zip(addresses, summaries):
+            chain = summary.get("chain_stats") or {}
+            mempool = summary.get("mempool_stats") or {}
+            address.tx_count = chain.get("tx_count", 0) + mempool.get("tx_count", 0)
+            address.used = address.used or address.tx_count > 0
+            address.balance = chain.get("funded_txo_sum", 0) - chain.get("spent_txo_sum", 0)
+            address.unconfirmed_balance = mempool.get("funded_txo_sum", 0) - mempool.get("spent_txo_sum", 0)
+            address.checked_at = now
@@ -0,0 +1,261 @@
+"""
+Recommendation job queue: persisted jobs run by a bounded worker pool
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+from typing import Any, Dict, Optional, Set
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import time
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.exceptions import SatoshiSenseiException, ValidationError, NotFoundError
+from app.models.job import RecommendationJob, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+from app.services.strategy_service import StrategyService
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the request itself; retrying cannot help
+PERMANENT_ERRORS = (ValidationError, NotFoundError)
+
+
+class JobService:
+    """Service for queueing recommendation jobs and reading their status"""
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def enqueue(self, user_id: str, **params: Any) -> RecommendationJob:
+        """Persist a job for `generate_recommendation(user_id, **params)` and wake the workers"""
+        job = RecommendationJob(user_id=user_id, params=params, status=JOB_QUEUED, attempts=0)
+        self.db.add(job)
+        await self.db.commit()
+        recommendation_workers.notify()
+        return job
+    
+    async def get_job(self, job_id: str, user_id: Optional[str] = None) -> Optional[RecommendationJob]:
+        """Get a job by ID (only if it belongs to `user_id`, when given)"""
+        query = select(RecommendationJob).where(RecommendationJob.id == job_id)
+        if user_id is not None:
+            query = query.where(RecommendationJob.user_id == user_id)
+        result = await self.db.execute(query)
+        return result.scalar_one_or_none()
+    
+    async def wait_for_job(self, job: RecommendationJob, timeout: float) -> RecommendationJob:
+        """Long-poll: return the job once it finishes or `timeout` seconds pass
+        
+        Jobs run in this process wake the caller directly; jobs run by other
+        processes are noticed when the status is re-read every poll interval.
+        """
+        deadline = time.monotonic() + timeout
+        while not job.finished:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            await recommendation_workers.wait(job.id, min(left, settings.RECOMMENDATION_JOB_POLL_SECONDS))
+            await self.db.refresh(job)
+        return job
+
+
+class RecommendationWorkerPool:
+    """Runs queued recommendation jobs, at most `workers` at a time per process
+    
+    Jobs are claimed from the database with a conditional update, so
+    several processes can share one queue. A dispatcher claims jobs when a
+    worker slot is free, on `notify` (a job was queued here) or every
+    `poll_interval` (one may have been queued elsewhere). Failed jobs are
+    retried up to `max_attempts`; jobs interrupted by shutdown go back to
+    the queue, and jobs left running by a crashed process are requeued
+    once they are `stale_after` seconds old.
+    """
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        workers: int = 4,
+        poll_interval: float = 2.0,
+        max_attempts: int = 2,
+        stale_after: float = 600
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self.stats = {"claimed": 0, "succeeded": 0, "failed": 0, "retried": 0}
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._active: Set[asyncio.Task] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._waiters: Dict[str, asyncio.Event] = {}
+    
+    @property
+    def running(self) -> bool:
+        """Whether the dispatcher is claiming jobs"""
+        return self._dispatcher is not None and not self._dispatcher.done()
+    
+    async def start(self) -> None:
+        """Requeue stale jobs and start the dispatcher on the running event loop"""
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        await self._requeue_stale()
+        self._dispatcher = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop claiming jobs and return the ones in progress to the queue"""
+        if not self.running:
+            return
+        self._dispatcher.cancel()
+        for task in list(self._active):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._active, return_exceptions=True)
+        self._dispatcher = None
+    
+    def notify(self) -> None:
+        """Tell the dispatcher a job was queued"""
+        if self._wake is not None:
+            self._wake.set()
+    
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a job run by this process to finish"""
+        event = self._waiters.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if self._waiters.get(job_id) is event and not event.is_set():
+                del self._waiters[job_id]
+            return False
+    
+    async def _run(self) -> None:
+        """Claim jobs into free worker slots until cancelled"""
+        while True:
+            self._wake.clear()
+            free = self.workers - len(self._active)
+            if free > 0:
+                try:
+                    claimed = await self._claim(free)
+                except Exception:
+                    logger.exception("Claiming recommendation jobs failed")
+                    claimed = []
+                for job_id in claimed:
+                    task = asyncio.create_task(self._execute(job_id))
+                    self._active.add(task)
+                    task.add_done_callback(self._on_done)
+            
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                try:
+                    await self._requeue_stale()
+                except Exception:
+                    logger.exception("Requeueing stale recommendation jobs failed")
+    
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._active.discard(task)
+        self.notify()
+    
+    async def _claim(self, limit: int) -> list:
+        """Mark up to `limit` of the oldest queued jobs as running here, returning their IDs"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(RecommendationJob.id)
+                .where(RecommendationJob.status == JOB_QUEUED)
+                .order_by(RecommendationJob.created_at)
+                .limit(limit)
+            )
+            claimed = []
+            for job_id in result.scalars().all():
+                # Another process may claim the same job first; only one update matches
+                updated = await db.execute(
+                    update(RecommendationJob)
+                    .where(RecommendationJob.id == job_id, RecommendationJob.status == JOB_QUEUED)
+                    .values(
+                        status=JOB_RUNNING,
+                        started_at=datetime.utcnow(),
+                        attempts=RecommendationJob.attempts + 1
+                    )
+                )
+                if updated.rowcount == 1:
+                    claimed.append(job_id)
+            await db.commit()
+        self.stats["claimed"] += len(claimed)
+        return claimed
+    
+    async def _execute(self, job_id: str) -> None:
+        """Run one claimed job and record its outcome"""
+        try:
+            async with self.session_factory() as db:
+                job = await db.get(RecommendationJob, job_id)
+                user_id, params, attempts = job.user_id, dict(job.params), job.attempts
+                try:
+                    recommendation = await StrategyService(db).generate_recommendation(user_id, **params)
+                except asyncio.CancelledError:
+                    # Shutting down: leave the job for the next worker
+                    await self._finish(db, job_id, status=JOB_QUEUED, attempts=attempts - 1)
+                    raise
+                except Exception as e:
+                    detail = e.detail if isinstance(e, SatoshiSenseiException) else str(e)
+                    if attempts < self.max_attempts and not isinstance(e, PERMANENT_ERRORS):
+                        logger.warning("Recommendation job %s failed (attempt %d), retrying: %s", job_id, attempts, detail)
+                        self.stats["retried"] += 1
+                        await self._finish(db, job_id, status=JOB_QUEUED, error=detail)
+                    else:
+                        logger.warning("Recommendation job %s failed: %s", job_id, detail)
+                        self.stats["failed"] += 1
+                        await self._finish(db, job_id, status=JOB_FAILED, error=detail, finished_at=datetime.utcnow())
+                else:
+                    self.stats["succeeded"] += 1
+                    await self._finish(
+                        db,
+                        job_id,
+                        status=JOB_SUCCEEDED,
+                        recommendation_id=recommendation.id,
+                        error=None,
+                        finished_at=datetime.utcnow()
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Recommendation job %s could not be run", job_id)
+        finally:
+            event = self._waiters.pop(job_id, None)
+            if event is not None:
+                event.set()
+    
+    async def _finish(self, db: AsyncSession, job_id: str, **values: Any) -> None:
+        """Write a job's outcome (in a fresh transaction, whatever the job left behind)"""
+        await db.rollback()
+        await db.execute(update(RecommendationJob).where(RecommendationJob.id == job_id).values(**values))
+        await db.commit()
+    
+    async def _requeue_stale(self) -> None:
+        """Requeue jobs whose worker stopped without finishing them (or fail them, if out of attempts)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        stale = (RecommendationJob.status == JOB_RUNNING, RecommendationJob.started_at < cutoff)
+        async with self.session_factory() as db:
+            await db.execute(
+                update(RecommendationJob)
+                .where(*stale, RecommendationJob.attempts >= self.max_attempts)
+                .values(status=JOB_FAILED, error="Worker stopped before the job finished", finished_at=datetime.utcnow())
+            )
+            requeued = await db.execute(
+                update(RecommendationJob)
+                .where(*stale)
+                .values(status=JOB_QUEUED)
+            )
+            await db.commit()
+        if requeued.rowcount:
+            logger.info("Requeued %d stale recommendation jobs", requeued.rowcount)
+
+
+# Global worker pool (started from the app lifespan when workers are configured)
+recommendation_workers = RecommendationWorkerPool(
+    workers=settings.RECOMMENDATION_JOB_WORKERS,
+    poll_interval=settings.RECOMMENDATION_JOB_POLL_SECONDS,
+    max_attempts=settings.RECOMMENDATION_JOB_MAX_ATTEMPTS,
+    stale_after=settings.RECOMMENDATION_JOB_STALE_SECONDS
+)
@@ -0,0 +1,122 @@
+"""
+Incremental parsing of a JSON object streamed in arbitrary chunks
+"""
+
+from typing import Any, List, Optional, Tuple
+import json
+
+# Parser states at the top level of the object
+_BEFORE = "before"  # Waiting for the opening brace (leading prose or code fences are skipped)
+_KEY = "key"  # Expecting a key or the closing brace
+_COLON = "colon"
+_VALUE = "value"  # Expecting or reading a value
+_AFTER = "after"  # Value complete, expecting a comma or the closing brace
+_DONE = "done"
+
+_INVALID = object()
+
+
+class JSONFieldStream:
+    """Emits each top-level field of a streamed JSON object as soon as it completes
+    
+    `feed` takes the next chunk of model output and returns the
+    `(key, value)` pairs completed by it. Strings, arrays and objects are
+    complete at their closing character; numbers, booleans and null when
+    the following comma or brace arrives. Fields whose value is not valid
+    JSON are skipped; the full text is still available as `text`.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.fields: List[Tuple[str, Any]] = []
+        self._pos = 0
+        self._state = _BEFORE
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._key: Optional[str] = None
+        self._token_start: Optional[int] = None
+    
+    @property
+    def done(self) -> bool:
+        """Whether the object's closing brace has been seen"""
+        return self._state == _DONE
+    
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk, returning the fields it completed"""
+        self.text += chunk
+        completed: List[Tuple[str, Any]] = []
+        text = self.text
+        while self._pos < len(text) and self._state != _DONE:
+            index = self._pos
+            char = text[index]
+            self._pos += 1
+            
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._state == _KEY:
+                            self._key = self._decode(self._token_start, index + 1)
+                            self._state = _COLON
+                        elif self._state == _VALUE:
+                            self._complete(index + 1, completed)
+                continue
+            
+            if self._state == _BEFORE:
+                if char == "{":
+                    self._depth = 1
+                    self._state = _KEY
+                continue
+            
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._state in (_KEY, _VALUE):
+                    self._token_start = index
+            elif char in "{[":
+                if self._depth == 1 and self._state == _VALUE and self._token_start is None:
+                    self._token_start = index
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._state == _VALUE:
+                    self._complete(index + 1, completed)
+                elif self._depth == 0:
+                    if self._state == _VALUE and self._token_start is not None:
+                        self._complete(index, completed)
+                    self._state = _DONE
+            elif self._depth == 1:
+                if char == ":" and self._state == _COLON:
+                    self._state = _VALUE
+                    self._token_start = None
+                elif char == ",":
+                    if self._state == _VALUE and self._token_start is not None:
+                        self._complete(index, completed)
+                    self._state = _KEY
+                elif not char.isspace() and self._state == _VALUE and self._token_start is None:
+                    self._token_start = index  # Number, true, false or null
+        return completed
+    
+    def _complete(self, end: int, completed: List[Tuple[str, Any]]) -> None:
+        """Decode the top-level value ending at `end` and record its field"""
+        try:
+            value = json.loads(self.text[self._token_start:end])
+        except ValueError:
+            value = _INVALID
+        if value is not _INVALID and self._key is not None:
+            completed.append((self._key, value))
+            self.fields.append((self._key, value))
+        self._key = None
+        self._token_start = None
+        self._state = _AFTER
+    
+    def _decode(self, start: Optional[int], end: int) -> Optional[str]:
+        try:
+            return json.loads(self.text[start:end])
+        except (TypeError, ValueError):
+            return None
+
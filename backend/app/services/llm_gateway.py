@@ -0,0 +1,278 @@
+"""
+LLM gateway: one pooled client for every OpenAI-compatible chat completion call
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import asyncio
+import json
+import logging
+import random
+import time
+import httpx
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.exceptions import AIError, DeadlineExceededError
+from app.core.rate_governor import RateGovernor, get_governor
+from app.services.prompt_assembler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: rate limiting and server-side failures
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMGateway:
+    """Chat completions against an OpenAI-compatible API (Groq by default)
+    
+    Calls share one pooled HTTP client. Each attempt is bounded by
+    `timeout` and the request's deadline budget; 429 and 5xx responses are
+    retried after their `Retry-After` delay (or a jittered exponential
+    backoff). Token usage is totalled per gateway, and `hooks` are called
+    after every completed call, so caching and metrics attach here rather
+    than in each service.
+    """
+    
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        timeout: float = 30.0,
+        max_retries: int = 2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        governor: Optional[RateGovernor] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.transport = transport
+        self.hooks: List[Callable[[Dict[str, Any], Dict[str, Any]], None]] = []
+        self.usage = {"requests": 0, "errors": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self.governor = governor or get_governor("llm", settings.LLM_RATE_PER_MINUTE)
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, created on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=settings.LLM_MAX_CONNECTIONS),
+                transport=self.transport
+            )
+        return self._client
+    
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        **options: Any
+    ) -> Dict[str, Any]:
+        """Run a chat completion
+        
+        Returns the assistant's `content`, the `model` that answered, the
+        call's token `usage` and its `latency` in seconds. Raises AIError
+        when the API fails after retries.
+        """
+        payload = self._payload(messages, temperature, max_tokens, options)
+        started = time.monotonic()
+        response = await self._send("/chat/completions", payload)
+        result = response.json()
+        
+        try:
+            content = result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            self.usage["errors"] += 1
+            raise AIError("LLM response had no message content")
+        
+        return self._record(payload, {
+            "content": content,
+            "model": result.get("model", payload["model"]),
+            "usage": result.get("usage"),
+            "latency": time.monotonic() - started
+        })
+    
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        **options: Any
+    ) -> AsyncIterator[str]:
+        """Run a chat completion with `stream: true`, yielding content as it arrives
+        
+        Rate limits and server errors are retried as in `chat`, but only
+        before the first chunk. Once the stream ends, usage is recorded
+        (estimated locally if the API did not report it) and hooks run with
+        the assembled completion. Raises AIError if the stream breaks.
+        """
+        payload = self._payload(messages, temperature, max_tokens, {**options, "stream": True})
+        started = time.monotonic()
+        response = await self._send("/chat/completions", payload, stream=True)
+        parts: List[str] = []
+        model = payload["model"]
+        usage = None
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                model = chunk.get("model", model)
+                # OpenAI reports usage on the last chunk; Groq under x_groq
+                usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        parts.append(content)
+                        yield content
+        except httpx.HTTPError as e:
+            self.usage["errors"] += 1
+            raise AIError(f"LLM stream failed: {str(e)}")
+        finally:
+            await response.aclose()
+        
+        content = "".join(parts)
+        if not usage:
+            prompt_tokens = sum(estimate_tokens(message.get("content") or "") for message in messages)
+            completion_tokens = estimate_tokens(content)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        self._record(payload, {
+            "content": content,
+            "model": model,
+            "usage": usage,
+            "latency": time.monotonic() - started
+        })
+    
+    async def close(self) -> None:
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _payload(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return {
+            "model": options.pop("model", self.model),
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **options
+        }
+    
+    def _record(self, payload: Dict[str, Any], completion: Dict[str, Any]) -> Dict[str, Any]:
+        """Total a finished completion's usage and run the hooks"""
+        usage = completion["usage"] or {}
+        completion["usage"] = {key: int(usage.get(key) or 0) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+        self.usage["requests"] += 1
+        for key, value in completion["usage"].items():
+            self.usage[key] += value
+        for hook in self.hooks:
+            try:
+                hook(payload, completion)
+            except Exception as e:
+                logger.warning("LLM gateway hook failed: %s", e)
+        return completion
+    
+    async def _send(self, path: str, payload: Dict[str, Any], stream: bool = False) -> httpx.Response:
+        """POST with retries on 429/5xx, returning the successful response
+        
+        With `stream`, the response body is left unread for the caller to
+        iterate and close.
+        """
+        url = f"{self.base_url}{path}"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                await self.governor.acquire()
+                if stream:
+                    request = self.client.build_request(
+                        "POST", url, timeout=deadline.timeout(self.timeout), headers=headers, json=payload
+                    )
+                    response = await self.client.send(request, stream=True)
+                else:
+                    response = await self.client.post(
+                        url,
+                        timeout=deadline.timeout(self.timeout),
+                        headers=headers,
+                        json=payload
+                    )
+            except DeadlineExceededError:
+                self.usage["errors"] += 1
+                raise
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = f"LLM API request failed: {str(e)}"
+            else:
+                self.governor.update(response.headers, response.status_code)
+                if response.status_code == 200:
+                    return response
+                if stream:
+                    await response.aclose()
+                error = f"LLM API error: {response.status_code}"
+                if response.status_code not in RETRY_STATUS:
+                    break
+            
+            if attempt == self.max_retries:
+                break
+            delay = _retry_after(response)
+            if delay is None:
+                delay = random.uniform(0, settings.LLM_RETRY_BACKOFF * 2 ** attempt)
+            left = deadline.remaining()
+            if delay > self.timeout or (left is not None and delay >= left):
+                break
+            self.usage["retries"] += 1
+            logger.info("Retrying LLM call in %.2fs: %s", delay, error)
+            await asyncio.sleep(delay)
+        
+        self.usage["errors"] += 1
+        raise AIError(error)
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    """Delay requested by a Retry-After header (seconds or HTTP date), if any"""
+    if response is None:
+        return None
+    try:
+        value = response.headers.get("retry-after")
+        if value is None:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        retry_at = parsedate_to_datetime(value)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# Global gateway (Groq unless LLM_BASE_URL points elsewhere, e.g. the local stub)
+llm_gateway = LLMGateway(
+    settings.LLM_BASE_URL,
+    settings.GROQ_API_KEY,
+    settings.GROQ_MODEL,
+    timeout=settings.GROQ_TIMEOUT,
+    max_retries=settings.LLM_MAX_RETRIES
+)
@@ -0,0 +1,147 @@
+"""
+DeFi market data collection and normalization
+"""
+
+from typing import Any, Dict, List, Optional
+import logging
+import httpx
+
+from app.core.exceptions import DeadlineExceededError, ExternalAPIError
+from app.core.upstream import alex_pool, arkadiko_pool, velar_pool
+
+logger = logging.getLogger(__name__)
+
+# Market data keys for each protocol API
+PROTOCOL_SOURCES = {
+    "alex": "alex_pools",
+    "arkadiko": "arkadiko_pools",
+    "velar": "velar_pools",
+}
+
+# Candidate field names used by the protocol APIs for each normalized column
+_PAIR_FIELDS = ("pair", "name", "symbol", "pool_name", "pool_id", "id")
+_TOKEN_X_FIELDS = ("token_x", "token0", "tokenX", "base_token", "token_a")
+_TOKEN_Y_FIELDS = ("token_y", "token1", "tokenY", "quote_token", "token_b")
+_TVL_FIELDS = ("tvl", "tvl_usd", "liquidity", "liquidity_usd", "total_liquidity")
+_APY_FIELDS = ("apy", "apr", "apy_7d", "apr_7d", "yield")
+_VOLUME_FIELDS = ("volume_24h", "volume", "volume_usd", "volume24h")
+_FEE_FIELDS = ("fee", "fee_rate", "swap_fee", "fees")
+
+
+async def fetch_pool_payloads() -> Dict[str, Any]:
+    """Fetch raw pool payloads from ALEX, Arkadiko and Velar"""
+    pools = {
+        "alex_pools": alex_pool,
+        "arkadiko_pools": arkadiko_pool,
+        "velar_pools": velar_pool,
+    }
+    try:
+        async with httpx.AsyncClient() as client:
+            market_data = {}
+            for key, pool in pools.items():
+                try:
+                    response = await pool.get(client, "/pools")
+                    response.raise_for_status()
+                    market_data[key] = response.json()
+                except DeadlineExceededError:
+                    raise
+                except Exception as e:
+                    # One protocol being down should not hide the others
+                    logger.warning("Failed to fetch %s: %s", key, e)
+                    market_data[key] = []
+            return market_data
+    except ExternalAPIError:
+        raise
+    except Exception as e:
+        raise ExternalAPIError(f"Failed to fetch market data: {str(e)}")
+
+
+def normalize_market_data(market_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Normalize every protocol's pool payload into compact rows"""
+    rows = []
+    for protocol, key in PROTOCOL_SOURCES.items():
+        rows.extend(normalize_pools(protocol, market_data.get(key)))
+    return rows
+
+
+def group_market_rows(rows: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Group normalized rows under each protocol's market data key"""
+    market_data = {key: [] for key in PROTOCOL_SOURCES.values()}
+    for row in rows:
+        key = PROTOCOL_SOURCES.get(row["protocol"])
+        if key is not None:
+            market_data[key].append(row)
+    return market_data
+
+
+def normalize_pools(protocol: str, payload: Any) -> List[Dict[str, Any]]:
+    """Normalize one protocol's pool payload into rows of pair, TVL, APY, volume and fee
+    
+    Protocol APIs differ in envelope and field names, so this accepts a list
+    of pools or a dict wrapping one, and skips entries without a usable pair.
+    """
+    pools = _unwrap(payload)
+    rows = []
+    for pool in pools:
+        if not isinstance(pool, dict):
+            continue
+        pair = _pair_name(pool)
+        if not pair:
+            continue
+        rows.append({
+            "protocol": protocol,
+            "pair": pair,
+            "tvl": _number(pool, _TVL_FIELDS),
+            "apy": _number(pool, _APY_FIELDS),
+            "volume": _number(pool, _VOLUME_FIELDS),
+            "fee": _number(pool, _FEE_FIELDS),
+        })
+    return rows
+
+
+def _unwrap(payload: Any) -> List[Any]:
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for key in ("data", "pools", "results", "items"):
+            value = payload.get(key)
+            if isinstance(value, list):
+                return value
+            if isinstance(value, dict):
+                return _unwrap(value)
+    return []
+
+
+def _pair_name(pool: Dict[str, Any]) -> Optional[str]:
+    token_x = _token_symbol(_first(pool, _TOKEN_X_FIELDS))
+    token_y = _token_symbol(_first(pool, _TOKEN_Y_FIELDS))
+    if token_x and token_y:
+        return f"{token_x}/{token_y}"
+    pair = _first(pool, _PAIR_FIELDS)
+    return str(pair) if pair not in (None, "") else None
+
+
+def _token_symbol(token: Any) -> Optional[str]:
+    if isinstance(token, dict):
+        token = token.get("symbol") or token.get("name")
+    if token in (None, ""):
+        return None
+    # Contract identifiers look like SP...address.token-name
+    return str(token).rsplit(".", 1)[-1]
+
+
+def _first(pool: Dict[str, Any], fields) -> Any:
+    for field in fields:
+        if pool.get(field) not in (None, ""):
+            return pool[field]
+    return None
+
+
+def _number(pool: Dict[str, Any], fields) -> Optional[float]:
+    value = _first(pool, fields)
+    if isinstance(value, dict):
+        value = value.get("usd") or value.get("value")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,252 @@
+"""
+Cross-worker shared-memory snapshot of normalized market data
+"""
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import fcntl
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+
+from app.core.config import settings
+from app.core.rate_governor import Priority, set_priority
+from app.services.market_data import fetch_pool_payloads, group_market_rows, normalize_market_data
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - snapshot is optional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SSMKT001"
+
+# magic, sequence, version, active slot, row count, capacity, written_at
+HEADER = struct.Struct("<8sQQIIId")
+HEADER_SIZE = 64
+
+POOL_DTYPE = None if np is None else np.dtype([
+    ("protocol", "S16"),
+    ("pair", "S48"),
+    ("tvl", "<f8"),
+    ("apy", "<f8"),
+    ("volume", "<f8"),
+    ("fee", "<f8"),
+])
+
+
+class MarketSnapshot:
+    """Double-buffered pool table in a memory-mapped file
+    
+    One process (whichever holds the file lock) writes; every worker maps the
+    same file and reads the active slot as a NumPy structured array without
+    copying. The writer fills the inactive slot and then flips the header
+    under a sequence lock: readers retry while the sequence is odd or changes
+    during their read, so they never observe a half-written header.
+    """
+    
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self._mm: Optional[mmap.mmap] = None
+        self._inode: Optional[int] = None
+        self._lock_file = None
+        self._decoded: Optional[tuple] = None
+    
+    @property
+    def available(self) -> bool:
+        """Whether NumPy is installed so the snapshot can be used"""
+        return np is not None
+    
+    def _slot_offset(self, slot: int, capacity: int) -> int:
+        return HEADER_SIZE + slot * capacity * POOL_DTYPE.itemsize
+    
+    def _file_size(self, capacity: int) -> int:
+        return self._slot_offset(2, capacity)
+    
+    # Reader side
+    
+    def read(self) -> Optional[Dict[str, Any]]:
+        """Return {"version", "written_at", "pools"} for the current snapshot, or None
+        
+        `pools` is a zero-copy view into shared memory. It stays valid until
+        the writer has published two more snapshots, so copy it if it needs
+        to live longer than a request.
+        """
+        if not self.available:
+            return None
+        for _ in range(100):
+            mm = self._map()
+            if mm is None:
+                return None
+            magic, seq, version, slot, rows, capacity, written_at = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version == 0:
+                return None
+            if seq % 2:
+                time.sleep(0)
+                continue
+            if len(mm) < self._file_size(capacity):
+                self._unmap()
+                continue
+            pools = np.frombuffer(
+                mm, dtype=POOL_DTYPE, count=rows, offset=self._slot_offset(slot, capacity)
+            )
+            if HEADER.unpack_from(mm, 0)[1] == seq:
+                return {"version": version, "written_at": written_at, "pools": pools}
+        return None
+    
+    def read_market_data(self, max_age: float) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Return the current snapshot grouped by market data key, or None if missing or stale
+        
+        The shared table is decoded into rows once per published version and
+        the same (read-only) dict is returned until the next one, so requests
+        do not each copy the table.
+        """
+        snapshot = self.read()
+        if snapshot is None or time.time() - snapshot["written_at"] > max_age:
+            return None
+        version = (snapshot["version"], snapshot["written_at"])
+        if self._decoded is None or self._decoded[0] != version:
+            self._decoded = (version, group_market_rows(snapshot_to_rows(snapshot["pools"])))
+        return self._decoded[1]
+    
+    def _map(self) -> Optional[mmap.mmap]:
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self._unmap()
+            return None
+        if self._mm is not None and inode != self._inode:
+            # The writer replaced the file (new capacity); the old mapping still reads the old one
+            self._unmap()
+        if self._mm is None:
+            try:
+                with open(self.path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._inode = os.fstat(f.fileno()).st_ino
+            except (FileNotFoundError, ValueError):
+                return None
+        return self._mm
+    
+    def _unmap(self) -> None:
+        # Views handed out by `read` may still export the mapping, so it is
+        # released (not closed) and unmapped once the last of them goes away
+        self._mm = None
+        self._inode = None
+    
+    # Writer side
+    
+    def try_become_writer(self) -> bool:
+        """Take the writer lock without blocking; True if this process is the writer"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+    
+    def write(self, rows: List[Dict[str, Any]]) -> int:
+        """Publish rows as the next snapshot version, returning that version"""
+        rows = rows[:self.capacity]
+        size = self._file_size(self.capacity)
+        try:
+            current_size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            current_size = None
+        if current_size != size:
+            # Resizing a file in place would SIGBUS readers touching pages past
+            # its new end, so a file of the new size replaces it instead
+            staging = f"{self.path}.tmp"
+            with open(staging, "wb") as f:
+                f.truncate(size)
+            os.replace(staging, self.path)
+        with open(self.path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), size)
+        try:
+            magic, seq, version, slot, _, capacity, _ = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or capacity != self.capacity:
+                seq, version, slot = 0, 0, 1
+            target = 1 - slot
+            
+            table = np.frombuffer(
+                mm, dtype=POOL_DTYPE, count=len(rows), offset=self._slot_offset(target, self.capacity)
+            )
+            for i, row in enumerate(rows):
+                table[i] = (
+                    _encode(row["protocol"], 16),
+                    _encode(row["pair"], 48),
+                    _float(row.get("tvl")),
+                    _float(row.get("apy")),
+                    _float(row.get("volume")),
+                    _float(row.get("fee")),
+                )
+            del table
+            
+            version += 1
+            struct.pack_into("<8sQ", mm, 0, MAGIC, seq + 1)
+            HEADER.pack_into(mm, 0, MAGIC, seq + 1, version, target, len(rows), self.capacity, time.time())
+            struct.pack_into("<Q", mm, 8, seq + 2)
+            mm.flush()
+        finally:
+            mm.close()
+        return version
+
+
+def snapshot_to_rows(pools) -> List[Dict[str, Any]]:
+    """Copy a snapshot's pool view into plain dicts"""
+    return [
+        {
+            "protocol": row["protocol"].decode(),
+            "pair": row["pair"].decode(),
+            "tvl": _optional(row["tvl"]),
+            "apy": _optional(row["apy"]),
+            "volume": _optional(row["volume"]),
+            "fee": _optional(row["fee"]),
+        }
+        for row in pools
+    ]
+
+
+def _encode(text: str, size: int) -> bytes:
+    """UTF-8 encode text, truncated to at most `size` bytes on a character boundary"""
+    return text.encode()[:size].decode("utf-8", "ignore").encode()
+
+
+def _float(value: Any) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _optional(value) -> Optional[float]:
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+async def run_market_snapshot_loop() -> None:
+    """Refresh the shared snapshot while this process holds the writer lock
+    
+    Every worker runs this loop; only the lock holder fetches from the DEX
+    APIs, and the others keep retrying the lock in case the writer exits.
+    """
+    set_priority(Priority.BACKGROUND)
+    interval = settings.MARKET_SNAPSHOT_REFRESH_SECONDS
+    while True:
+        try:
+            if await asyncio.to_thread(market_snapshot.try_become_writer):
+                rows = normalize_market_data(await fetch_pool_payloads())
+                version = await asyncio.to_thread(market_snapshot.write, rows)
+                logger.debug("Published market snapshot v%d with %d pools", version, len(rows))
+        except Exception:
+            logger.exception("Market snapshot refresh failed")
+        await asyncio.sleep(interval)
+
+
+# Global snapshot handle (shared across workers through the file system)
+market_snapshot = MarketSnapshot(settings.MARKET_SNAPSHOT_PATH, settings.MARKET_SNAPSHOT_CAPACITY)
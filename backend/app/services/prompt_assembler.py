@@ -0,0 +1,192 @@
+"""
+Token-budgeted prompt assembly with local token estimation
+"""
+
+from typing import Dict, List, Optional
+import logging
+import math
+import re
+
+from app.core.config import settings
+from app.core.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Chat formatting tokens added per message (role header and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Sections left with less than this are dropped rather than cut to a stub
+MIN_SECTION_TOKENS = 32
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|\s+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of text for Llama-style BPE tokenizers
+    
+    Common words are one token and longer ones one per six letters, digits
+    are grouped in threes, and punctuation, symbols and line breaks cost
+    one token each. Estimates run slightly high, which is the safe side.
+    """
+    count = 0
+    for match in _PIECES.finditer(text):
+        piece = match.group()
+        first = piece[0]
+        if first.isalpha():
+            count += math.ceil(len(piece) / 6)
+        elif first.isdigit():
+            count += math.ceil(len(piece) / 3)
+        elif first.isspace():
+            # A single space merges into the following word
+            if piece != " ":
+                count += 1
+        else:
+            count += 1
+    return count
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut text to about `budget` tokens, keeping whole lines from the top
+    
+    Tables and lists are built most relevant first, so the lines kept are
+    the ones that matter most. A note records how many lines were cut.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    
+    lines = text.split("\n")
+    budget -= 12  # Room for the omission note
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    
+    if not kept and budget > 0:
+        # A single oversized line: cut it proportionally
+        line = lines[0]
+        kept.append(line[:int(len(line) * budget / max(estimate_tokens(line), 1))] + "…")
+        return "\n".join(kept + ([f"… ({len(lines) - 1} more lines omitted)"] if len(lines) > 1 else []))
+    kept.append(f"… ({len(lines) - len(kept)} more lines omitted)")
+    return "\n".join(kept)
+
+
+class PromptSection:
+    """Named block of the user message
+    
+    Required sections are always sent whole. The rest are funded in
+    `priority` order (lower first) from what the budget has left.
+    """
+    
+    def __init__(self, name: str, text: str, priority: int = 0, required: bool = False):
+        self.name = name
+        self.text = text.strip()
+        self.priority = priority
+        self.required = required
+
+
+class AssembledPrompt:
+    """Chat messages sized to the context window, and the completion budget left"""
+    
+    def __init__(
+        self,
+        messages: List[Dict[str, str]],
+        prompt_tokens: int,
+        max_tokens: int,
+        truncated: List[str],
+        dropped: List[str]
+    ):
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.truncated = truncated
+        self.dropped = dropped
+    
+    @property
+    def user(self) -> str:
+        """Text of the user message"""
+        return self.messages[-1]["content"]
+
+
+class PromptAssembler:
+    """Builds a system and user message that fit the model's context window
+    
+    The window, less a margin for estimation error and the minimum
+    completion size, is the prompt budget. Required sections are sent
+    whole; optional sections are included by priority, cut line by line
+    when they no longer fit, and dropped when almost nothing is left.
+    `max_tokens` is whatever the window has left after the prompt, capped
+    at the configured maximum completion size. If the required sections
+    alone leave less than the minimum completion size, `build` raises
+    ValidationError.
+    """
+    
+    def __init__(
+        self,
+        system: str,
+        context_window: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        min_completion_tokens: Optional[int] = None,
+        margin: Optional[float] = None
+    ):
+        self.system = system.strip()
+        self.context_window = context_window or settings.LLM_CONTEXT_WINDOW
+        self.max_completion_tokens = max_completion_tokens or settings.LLM_MAX_COMPLETION_TOKENS
+        self.min_completion_tokens = min_completion_tokens or settings.LLM_MIN_COMPLETION_TOKENS
+        self.margin = settings.LLM_TOKEN_ESTIMATE_MARGIN if margin is None else margin
+        self.sections: List[PromptSection] = []
+    
+    def add(self, name: str, text: Optional[str], priority: int = 0, required: bool = False) -> "PromptAssembler":
+        """Append a section to the user message (empty text is skipped)"""
+        if text and text.strip():
+            self.sections.append(PromptSection(name, text, priority, required))
+        return self
+    
+    def build(self) -> AssembledPrompt:
+        """Fit the sections to the budget and size the completion"""
+        window = int(self.context_window / (1 + self.margin))
+        overhead = 2 * MESSAGE_OVERHEAD_TOKENS
+        budget = window - self.min_completion_tokens - overhead - estimate_tokens(self.system)
+        
+        texts: Dict[str, str] = {}
+        for section in self.sections:
+            if section.required:
+                texts[section.name] = section.text
+                budget -= estimate_tokens(section.text) + 2
+        if budget < 0:
+            raise ValidationError(
+                f"Prompt too long: required sections leave {self.min_completion_tokens + budget} "
+                f"of the {self.min_completion_tokens} completion tokens needed"
+            )
+        
+        truncated, dropped = [], []
+        for section in sorted((s for s in self.sections if not s.required), key=lambda s: s.priority):
+            cost = estimate_tokens(section.text) + 2
+            if cost <= budget:
+                texts[section.name] = section.text
+                budget -= cost
+            elif budget >= MIN_SECTION_TOKENS:
+                texts[section.name] = truncate_to_tokens(section.text, budget - 2)
+                budget -= estimate_tokens(texts[section.name]) + 2
+                truncated.append(section.name)
+            else:
+                dropped.append(section.name)
+        if truncated or dropped:
+            logger.info("Prompt over budget: truncated %s, dropped %s", truncated, dropped)
+        
+        user = "\n\n".join(texts[section.name] for section in self.sections if section.name in texts)
+        prompt_tokens = estimate_tokens(self.system) + estimate_tokens(user) + overhead
+        max_tokens = min(self.max_completion_tokens, window - prompt_tokens)
+        return AssembledPrompt(
+            [
+                {"role": "system", "content": self.system},
+                {"role": "user", "content": user}
+            ],
+            prompt_tokens,
+            max_tokens,
+            truncated,
+            dropped
+        )
@@ -0,0 +1,148 @@
+"""
+Feature extraction for strategy prompts: compact holdings and market tables
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import math
+
+from app.services.market_data import normalize_market_data
+
+# Normalized pool columns, in table order
+POOL_COLUMNS = ("protocol", "pair", "tvl", "apy", "volume", "fee")
+
+# Wrapped and bridged tokens count as holdings of the underlying asset
+_SYMBOL_ALIASES = {"WSTX": "STX", "ABTC": "BTC", "XBTC": "BTC", "SBTC": "BTC"}
+
+
+def portfolio_holdings(wallet_data: Dict[str, Any]) -> Dict[str, float]:
+    """Total holdings per asset across a user's wallets (token entries are counted)"""
+    holdings: Dict[str, float] = {}
+    for wallet in wallet_data.get("wallets", []):
+        balances = wallet.get("balances") or {}
+        for asset, balance in balances.items():
+            if isinstance(balance, dict) and "balance" in balance:
+                try:
+                    holdings[asset] = holdings.get(asset, 0.0) + float(balance["balance"])
+                except (TypeError, ValueError):
+                    continue
+        for token in balances.get("tokens") or []:
+            if isinstance(token, dict) and token.get("asset_identifier"):
+                asset = token["asset_identifier"]
+                holdings[asset] = holdings.get(asset, 0.0) + 1
+    return holdings
+
+
+def held_symbols(holdings: Dict[str, float]) -> List[str]:
+    """Token symbols of held assets ("SP...token-alex::alex" -> "ALEX", "stx" -> "STX")"""
+    symbols = set()
+    for asset, amount in holdings.items():
+        if amount > 0:
+            symbols.add(_symbol(asset.rsplit("::", 1)[-1]))
+    return sorted(symbols)
+
+
+def pair_symbols(pair: str) -> List[str]:
+    """Token symbols of a pool pair ("token-wstx/token-abtc" -> ["STX", "BTC"])"""
+    separator = "/" if "/" in pair else "-"
+    return [_symbol(token) for token in pair.split(separator)]
+
+
+def select_pools(
+    market_data: Dict[str, Any],
+    symbols: Iterable[str] = (),
+    preferred_protocols: Iterable[str] = (),
+    limit: int = 15
+) -> List[Dict[str, Any]]:
+    """Normalize every protocol's pools and keep the `limit` most relevant
+    
+    Pools on a preferred protocol or trading a held token rank first, then
+    deeper (by TVL) and higher-yielding pools.
+    """
+    symbols = {_symbol(symbol) for symbol in symbols}
+    protocols = {protocol.strip().lower() for protocol in preferred_protocols}
+    
+    def relevance(row: Dict[str, Any]) -> float:
+        tokens = set(pair_symbols(row["pair"]))
+        score = 0.0
+        if row["protocol"] in protocols:
+            score += 100.0
+        score += 50.0 * len(tokens & symbols)
+        score += math.log10(row["tvl"]) if row["tvl"] and row["tvl"] > 1 else 0.0
+        score += min(row["apy"], 100.0) / 10.0 if row["apy"] and row["apy"] > 0 else 0.0
+        return score
+    
+    rows = normalize_market_data(market_data)
+    rows.sort(key=relevance, reverse=True)
+    return rows[:limit]
+
+
+def wallet_rows(wallet_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One row per wallet asset: network, shortened address, asset and balance"""
+    rows = []
+    for wallet in wallet_data.get("wallets", []):
+        address = str(wallet.get("address", ""))
+        if len(address) > 14:
+            address = f"{address[:6]}…{address[-6:]}"
+        balances = wallet.get("balances") or {}
+        for asset, balance in balances.items():
+            if isinstance(balance, dict) and "balance" in balance:
+                rows.append({
+                    "network": wallet.get("network"),
+                    "address": address,
+                    "asset": asset.upper(),
+                    "balance": balance["balance"]
+                })
+        tokens = [token for token in balances.get("tokens") or [] if isinstance(token, dict)]
+        if tokens:
+            rows.append({"network": wallet.get("network"), "address": address, "asset": "tokens", "balance": len(tokens)})
+    return rows
+
+
+def pool_table(rows: List[Dict[str, Any]]) -> str:
+    """Dense market section of a strategy prompt"""
+    return format_table(POOL_COLUMNS, rows)
+
+
+def wallet_table(wallet_data: Dict[str, Any]) -> Optional[str]:
+    """Dense holdings section of a strategy prompt (None without wallets)"""
+    rows = wallet_rows(wallet_data)
+    return format_table(("network", "address", "asset", "balance"), rows) if rows else None
+
+
+def format_table(columns: Sequence[str], rows: Iterable[Dict[str, Any]]) -> str:
+    """Pipe-separated table with a header line; missing values are "-" """
+    lines = ["|".join(columns)]
+    for row in rows:
+        lines.append("|".join(_cell(row.get(column)) for column in columns))
+    return "\n".join(lines)
+
+
+def _symbol(token: str) -> str:
+    symbol = token.rsplit(".", 1)[-1].strip().upper()
+    if symbol.startswith("TOKEN-"):
+        symbol = symbol[len("TOKEN-"):]
+    return _SYMBOL_ALIASES.get(symbol, symbol)
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return value.replace("|", "/")
+    if isinstance(value, float) and math.isnan(value):
+        return "-"
+    return _number(value)
+
+
+def _number(value: float) -> str:
+    """Short number: 3 significant digits with a K/M/B suffix for large values"""
+    magnitude = abs(value)
+    for divisor, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if magnitude >= divisor:
+            return f"{value / divisor:.3g}{suffix}"
+    if value == int(value):
+        return str(int(value))
+    return f"{value:.3g}"
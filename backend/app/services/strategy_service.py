@@ -3,18 +3,208 @@ Strategy service for AI-powered DeFi recommendations
 """
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
-from typing import List, Optional, Dict, Any
+from sqlalchemy import select, desc, and_, or_
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Dict, Any, Tuple
 import uuid
-import httpx
 import json
-from datetime import datetime
+import math
+from datetime import datetime, timezone
 
+from app.core.cache import get_cache
 from app.core.config import settings
-from app.core.exceptions import AIError, ExternalAPIError
-from app.models.recommendation import Recommendation
+from app.core.exceptions import AIError, DeadlineExceededError, ValidationError
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.serialization import content_hash, dumps
+from app.core.write_coalescer import persist
+from app.models.recommendation import Recommendation, RecommendationAction
 from app.models.user import User
 from app.services.wallet_service import WalletService
+from app.services.market_data import fetch_pool_payloads, group_market_rows, normalize_market_data
+from app.services.market_snapshot import market_snapshot
+from app.services.strategy_features import held_symbols, pool_table, portfolio_holdings, select_pools, wallet_table
+from app.services.json_stream import JSONFieldStream
+from app.services.llm_gateway import llm_gateway
+from app.services.prompt_assembler import AssembledPrompt, PromptAssembler
+
+STRATEGY_SYSTEM_PROMPT = "You are Satoshi Sensei, an expert DeFi advisor for Bitcoin and Stacks ecosystems. Provide actionable, safe, and profitable DeFi strategies based on user data and market conditions."
+
+STRATEGY_RESPONSE_FORMAT = """Please provide a JSON response with the following structure:
+{
+    "strategy_type": "liquidity_provision|yield_farming|staking|arbitrage|other",
+    "risk_score": 0.0-1.0,
+    "expected_apy": percentage or null,
+    "explanation": "Clear explanation of the strategy",
+    "recommendations": [
+        {
+            "protocol": "protocol_name",
+            "action": "specific_action",
+            "amount": "suggested_amount",
+            "reasoning": "why this is recommended"
+        }
+    ],
+    "warnings": ["any risks or warnings"],
+    "next_steps": ["actionable steps for the user"]
+}"""
+
+market_cache = get_cache("strategy:market", ttl=settings.MARKET_DATA_CACHE_TTL)
+ai_output_cache = get_cache(
+    "strategy:ai_output",
+    ttl=settings.STRATEGY_CACHE_TTL,
+    max_entries=settings.STRATEGY_CACHE_MAX_ENTRIES
+)
+
+
+def quantize_amount(amount: Any) -> Optional[int]:
+    """Log-scale bucket of an amount (None when empty), so small moves share a bucket"""
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return None
+    if not amount > 0:
+        return None
+    return math.floor(math.log(amount) / math.log1p(settings.STRATEGY_CACHE_AMOUNT_STEP))
+
+
+def _normalized_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "risk_tolerance": str(profile.get("risk_tolerance") or "medium").strip().lower(),
+        "time_horizon": str(profile.get("time_horizon") or "medium").strip().lower(),
+        "preferred_protocols": sorted({str(name).strip().lower() for name in profile.get("preferred_protocols") or []})
+    }
+
+
+def input_fingerprint(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary of a recommendation's inputs stored for the change-detection gate"""
+    profile = input_data.get("user_profile", {})
+    holdings = portfolio_holdings(input_data.get("wallet_data", {}))
+    return {
+        "profile": _normalized_profile(profile),
+        "investment_amount": profile.get("investment_amount"),
+        "holdings": {asset: amount for asset, amount in holdings.items() if amount > 0},
+        "pools": {
+            f"{row['protocol']}:{row['pair']}": {"apy": row["apy"], "tvl": row["tvl"]}
+            for row in normalize_market_data(input_data.get("market_data", {}))
+        }
+    }
+
+
+def inputs_changed(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> bool:
+    """Whether inputs moved past the reuse thresholds since a previous fingerprint"""
+    if not previous or previous.get("profile") != current["profile"]:
+        return True
+    
+    portfolio_threshold = settings.STRATEGY_REUSE_PORTFOLIO_THRESHOLD
+    if _relative_change(previous.get("investment_amount"), current["investment_amount"]) > portfolio_threshold:
+        return True
+    previous_holdings = previous.get("holdings") or {}
+    if previous_holdings.keys() != current["holdings"].keys():
+        return True
+    if any(
+        _relative_change(previous_holdings[asset], amount) > portfolio_threshold
+        for asset, amount in current["holdings"].items()
+    ):
+        return True
+    
+    previous_pools = previous.get("pools") or {}
+    if previous_pools.keys() != current["pools"].keys():
+        return True
+    for pool, metrics in current["pools"].items():
+        before = previous_pools[pool]
+        if (before.get("apy") is None) != (metrics["apy"] is None):
+            return True
+        if metrics["apy"] is not None and abs(metrics["apy"] - before["apy"]) > settings.STRATEGY_REUSE_APY_THRESHOLD:
+            return True
+        if _relative_change(before.get("tvl"), metrics["tvl"]) > settings.STRATEGY_REUSE_TVL_THRESHOLD:
+            return True
+    return False
+
+
+def _relative_change(before: Optional[float], after: Optional[float]) -> float:
+    if before is None or after is None:
+        return 0.0 if before == after else math.inf
+    if before == after:
+        return 0.0
+    return abs(after - before) / max(abs(before), abs(after))
+
+
+def strategy_input(
+    risk_tolerance: str,
+    investment_amount: Optional[float],
+    time_horizon: str,
+    preferred_protocols: Optional[List[str]],
+    wallet_data: Dict[str, Any],
+    market_data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """AI input for a strategy recommendation (also stored as its raw input)
+    
+    Holds nothing that changes from call to call, so the stored input is
+    shared by identical requests; the row's `created_at` dates it.
+    """
+    return {
+        "user_profile": {
+            "risk_tolerance": risk_tolerance,
+            "investment_amount": investment_amount,
+            "time_horizon": time_horizon,
+            "preferred_protocols": preferred_protocols or []
+        },
+        "wallet_data": wallet_data,
+        "market_data": market_data
+    }
+
+
+def strategy_fingerprint(input_data: Dict[str, Any]) -> str:
+    """Cache key for a strategy prompt's inputs
+    
+    Covers the normalized risk tolerance, horizon and preferred protocols,
+    the bucketed investment amount and holdings, and the version (content
+    digest) of the market data, so users with near-identical profiles
+    share one LLM answer until the market moves.
+    """
+    profile = input_data.get("user_profile", {})
+    holdings = portfolio_holdings(input_data.get("wallet_data", {}))
+    fields = {
+        **_normalized_profile(profile),
+        "investment_amount": quantize_amount(profile.get("investment_amount")),
+        "portfolio": {asset: quantize_amount(amount) for asset, amount in holdings.items() if amount > 0},
+        "market_version": content_hash(dumps(input_data.get("market_data", {})))
+    }
+    return content_hash(dumps(fields))
+
+
+class FallbackOutput(dict):
+    """AI output wrapped around a response that was not a JSON object (never cached)"""
+
+
+class _UncachedOutput(Exception):
+    """Carries a fallback answer out of a cache computation so it is not stored"""
+    
+    def __init__(self, ai_output: Dict[str, Any]):
+        super().__init__("AI response was not JSON")
+        self.ai_output = ai_output
+
+
+async def cached_ai_output(
+    input_data: Dict[str, Any],
+    compute: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """LLM answer for a strategy input, shared by near-identical inputs
+    
+    Concurrent callers share one completion, but only answers that parsed
+    as JSON are cached; a fallback answer is returned to them uncached.
+    """
+    if settings.STRATEGY_CACHE_TTL <= 0:
+        return await compute()
+    
+    async def parsed_only() -> Dict[str, Any]:
+        ai_output = await compute()
+        if isinstance(ai_output, FallbackOutput):
+            raise _UncachedOutput(ai_output)
+        return ai_output
+    
+    try:
+        return await ai_output_cache.get_or_compute(strategy_fingerprint(input_data), parsed_only)
+    except _UncachedOutput as e:
+        return e.ai_output
 
 
 class StrategyService:
@@ -33,6 +223,76 @@ class StrategyService:
         preferred_protocols: Optional[List[str]] = None
     ) -> Recommendation:
         """Generate AI-powered DeFi strategy recommendation"""
+        ai_input, fingerprint, previous = await self._prepare_recommendation(
+            user_id, risk_tolerance, investment_amount, time_horizon, preferred_protocols
+        )
+        if previous is not None:
+            return previous
+        
+        # Call Groq AI API (near-identical inputs share a cached answer)
+        ai_output = await cached_ai_output(ai_input, lambda: self._call_groq_api(ai_input))
+        
+        return await self._save_recommendation(user_id, ai_input, fingerprint, ai_output)
+    
+    async def stream_recommendation(
+        self,
+        user_id: str,
+        risk_tolerance: str = "medium",
+        investment_amount: Optional[float] = None,
+        time_horizon: str = "medium",
+        preferred_protocols: Optional[List[str]] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Generate a recommendation, yielding events while the completion streams
+        
+        Yields ("token", text) for each chunk of model output, ("field",
+        {"name", "value"}) as each top-level field of the JSON answer
+        completes, and finally ("recommendation", row) once it is persisted.
+        Reused recommendations and cached answers skip the LLM and yield
+        their fields straight away.
+        """
+        ai_input, fingerprint, previous = await self._prepare_recommendation(
+            user_id, risk_tolerance, investment_amount, time_horizon, preferred_protocols
+        )
+        if previous is not None:
+            for name, value in previous.ai_output.items():
+                yield "field", {"name": name, "value": value}
+            yield "recommendation", previous
+            return
+        
+        cache_key = strategy_fingerprint(ai_input)
+        ai_output = await ai_output_cache.get(cache_key) if settings.STRATEGY_CACHE_TTL > 0 else None
+        if ai_output is not None:
+            for name, value in ai_output.items():
+                yield "field", {"name": name, "value": value}
+        else:
+            prompt = self._assemble_strategy_prompt(ai_input)
+            parser = JSONFieldStream()
+            try:
+                async for text in llm_gateway.stream_chat(prompt.messages, temperature=0.7, max_tokens=prompt.max_tokens):
+                    yield "token", text
+                    for name, value in parser.feed(text):
+                        yield "field", {"name": name, "value": value}
+            except (AIError, DeadlineExceededError):
+                raise
+            except Exception as e:
+                raise AIError(f"Failed to get AI recommendation: {str(e)}")
+            
+            # The parser also accepts an object wrapped in prose or a code fence
+            ai_output = dict(parser.fields) if parser.done else self._parse_ai_response(parser.text)
+            if settings.STRATEGY_CACHE_TTL > 0 and not isinstance(ai_output, FallbackOutput):
+                await ai_output_cache.set(cache_key, ai_output)
+        
+        yield "recommendation", await self._save_recommendation(user_id, ai_input, fingerprint, ai_output)
+    
+    async def _prepare_recommendation(
+        self,
+        user_id: str,
+        risk_tolerance: str,
+        investment_amount: Optional[float],
+        time_horizon: str,
+        preferred_protocols: Optional[List[str]]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[Recommendation]]:
+        """Collect the AI input and its fingerprint, and the previous recommendation if it still applies"""
         
         # Collect user data
         user_data = await self._collect_user_data(user_id)
@@ -41,25 +301,43 @@ class StrategyService:
         market_data = await self._get_market_data()
         
         # Prepare input for AI
-        ai_input = {
-            "user_profile": {
-                "risk_tolerance": risk_tolerance,
-                "investment_amount": investment_amount,
-                "time_horizon": time_horizon,
-                "preferred_protocols": preferred_protocols or []
-            },
-            "wallet_data": user_data,
-            "market_data": market_data,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        # Call Groq AI API
-        ai_output = await self._call_groq_api(ai_input)
+        ai_input = strategy_input(
+            risk_tolerance, investment_amount, time_horizon, preferred_protocols, user_data, market_data
+        )
+        fingerprint = input_fingerprint(ai_input)
         
-        # Create recommendation record
+        # Nothing material changed since the user's last recommendation: return it again
+        if settings.STRATEGY_REUSE_MAX_AGE > 0:
+            previous = await self._latest_recommendation(user_id)
+            if previous is not None and self._is_reusable(previous, fingerprint):
+                previous.reused = True
+                return ai_input, fingerprint, previous
+        return ai_input, fingerprint, None
+    
+    async def _save_recommendation(
+        self,
+        user_id: str,
+        ai_input: Dict[str, Any],
+        fingerprint: Dict[str, Any],
+        ai_output: Dict[str, Any]
+    ) -> Recommendation:
+        """Create and persist the recommendation record"""
+        recommendation = self._build_recommendation(user_id, ai_input, fingerprint, ai_output)
+        await persist(self.db, recommendation)
+        return recommendation
+    
+    def _build_recommendation(
+        self,
+        user_id: str,
+        ai_input: Dict[str, Any],
+        fingerprint: Dict[str, Any],
+        ai_output: Dict[str, Any]
+    ) -> Recommendation:
+        """Create the (unsaved) recommendation record for an AI answer"""
         recommendation = Recommendation(
             user_id=user_id,
             raw_input=ai_input,
+            input_fingerprint=fingerprint,
             ai_output=ai_output,
             strategy_type=ai_output.get("strategy_type", "unknown"),
             risk_score=ai_output.get("risk_score", 0.5),
@@ -67,13 +345,30 @@ class StrategyService:
             explanation=ai_output.get("explanation"),
             status="pending"
         )
-        
-        self.db.add(recommendation)
-        await self.db.commit()
-        await self.db.refresh(recommendation)
-        
+        recommendation.set_actions_from_output(ai_output)
         return recommendation
     
+    async def _latest_recommendation(self, user_id: str) -> Optional[Recommendation]:
+        """The user's most recent recommendation"""
+        result = await self.db.execute(
+            select(Recommendation)
+            .where(Recommendation.user_id == user_id)
+            .order_by(desc(Recommendation.created_at), desc(Recommendation.id))
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+    
+    def _is_reusable(self, previous: Recommendation, fingerprint: Dict[str, Any]) -> bool:
+        """Whether a pending, recent recommendation still fits the current inputs"""
+        if previous.status != "pending" or previous.archived_at is not None or previous.created_at is None:
+            return False
+        created_at = previous.created_at
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        if (datetime.utcnow() - created_at).total_seconds() > settings.STRATEGY_REUSE_MAX_AGE:
+            return False
+        return not inputs_changed(previous.input_fingerprint, fingerprint)
+    
     async def _collect_user_data(self, user_id: str) -> Dict[str, Any]:
         """Collect user's wallet and portfolio data"""
         # Get user wallets
@@ -98,144 +393,187 @@ class StrategyService:
         }
     
     async def _get_market_data(self) -> Dict[str, Any]:
-        """Get current DeFi market data"""
-        try:
-            async with httpx.AsyncClient() as client:
-                # Get data from multiple sources
-                market_data = {}
-                
-                # ALEX data
-                try:
-                    alex_response = await client.get(f"{settings.ALEX_API_URL}/pools")
-                    market_data["alex_pools"] = alex_response.json()
-                except:
-                    market_data["alex_pools"] = []
-                
-                # Arkadiko data
-                try:
-                    arkadiko_response = await client.get(f"{settings.ARKADIKO_API_URL}/pools")
-                    market_data["arkadiko_pools"] = arkadiko_response.json()
-                except:
-                    market_data["arkadiko_pools"] = []
-                
-                # Velar data
-                try:
-                    velar_response = await client.get(f"{settings.VELAR_API_URL}/pools")
-                    market_data["velar_pools"] = velar_response.json()
-                except:
-                    market_data["velar_pools"] = []
-                
+        """Get current DeFi market data as normalized rows per protocol
+        
+        Reads the cross-worker shared snapshot when it is enabled and fresh,
+        otherwise fetches (shared by all requests for a short TTL). Both
+        return the same shape: {"alex_pools": [row, ...], ...}.
+        """
+        if settings.MARKET_SNAPSHOT_ENABLED:
+            market_data = market_snapshot.read_market_data(settings.MARKET_SNAPSHOT_MAX_AGE)
+            if market_data is not None:
                 return market_data
-        except Exception as e:
-            raise ExternalAPIError(f"Failed to fetch market data: {str(e)}")
+        return await market_cache.get_or_compute("pools", self._fetch_market_data)
+    
+    async def _fetch_market_data(self) -> Dict[str, Any]:
+        """Fetch current DeFi market data from the protocol APIs and normalize it"""
+        return group_market_rows(normalize_market_data(await fetch_pool_payloads()))
     
     async def _call_groq_api(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Call Groq AI API for strategy recommendations"""
+        """Get strategy recommendations from the LLM gateway"""
         try:
-            # Prepare prompt for Groq
-            prompt = self._create_strategy_prompt(input_data)
+            # Prepare prompt for Groq, sized to the model's context window
+            prompt = self._assemble_strategy_prompt(input_data)
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"https://api.groq.com/openai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": settings.GROQ_MODEL,
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "You are Satoshi Sensei, an expert DeFi advisor for Bitcoin and Stacks ecosystems. Provide actionable, safe, and profitable DeFi strategies based on user data and market conditions."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": 2000
-                    }
-                )
-                
-                if response.status_code != 200:
-                    raise AIError(f"Groq API error: {response.status_code}")
-                
-                result = response.json()
-                ai_response = result["choices"][0]["message"]["content"]
-                
-                # Parse AI response (assuming it returns JSON)
-                try:
-                    return json.loads(ai_response)
-                except json.JSONDecodeError:
-                    # If not JSON, create structured response
-                    return {
-                        "strategy_type": "general_advice",
-                        "risk_score": 0.5,
-                        "explanation": ai_response,
-                        "recommendations": [],
-                        "expected_apy": None
-                    }
+            completion = await llm_gateway.chat(
+                prompt.messages,
+                temperature=0.7,
+                max_tokens=prompt.max_tokens
+            )
+            return self._parse_ai_response(completion["content"])
+        except (DeadlineExceededError, ValidationError):
+            raise
         except Exception as e:
             raise AIError(f"Failed to get AI recommendation: {str(e)}")
     
+    def _parse_ai_response(self, ai_response: str) -> Dict[str, Any]:
+        """Parse AI response (assuming it returns JSON)"""
+        try:
+            parsed = json.loads(ai_response)
+            if isinstance(parsed, dict):
+                return parsed
+        except json.JSONDecodeError:
+            pass
+        # If not a JSON object, create structured response
+        return FallbackOutput(
+            strategy_type="general_advice",
+            risk_score=0.5,
+            explanation=ai_response,
+            recommendations=[],
+            expected_apy=None
+        )
+    
     def _create_strategy_prompt(self, input_data: Dict[str, Any]) -> str:
         """Create prompt for Groq AI"""
+        return self._assemble_strategy_prompt(input_data).user
+    
+    def _assemble_strategy_prompt(self, input_data: Dict[str, Any]) -> AssembledPrompt:
+        """Build the strategy messages within the token budget
+        
+        Wallets and market data are reduced to dense tables: pools are
+        normalized and only the most relevant to the user's holdings and
+        preferred protocols are kept. The profile and response format are
+        always sent; wallets, then the market table, are cut (least
+        relevant rows first) if the prompt would not fit.
+        """
         # Safely extract user profile data with defaults
         user_profile = input_data.get('user_profile', {})
         risk_tolerance = user_profile.get('risk_tolerance', 'medium')
         investment_amount = user_profile.get('investment_amount', 'Not specified')
         time_horizon = user_profile.get('time_horizon', 'medium')
-        preferred_protocols = user_profile.get('preferred_protocols', [])
-        
-        return f"""
-        Analyze the following user data and market conditions to provide a DeFi strategy recommendation:
-        
-        User Profile:
-        - Risk Tolerance: {risk_tolerance}
-        - Investment Amount: {investment_amount}
-        - Time Horizon: {time_horizon}
-        - Preferred Protocols: {preferred_protocols}
+        preferred_protocols = user_profile.get('preferred_protocols') or []
         
-        Wallet Data:
-        {json.dumps(input_data.get('wallet_data', {}), indent=2)}
-        
-        Market Data:
-        {json.dumps(input_data.get('market_data', {}), indent=2)}
+        wallet_data = input_data.get('wallet_data', {})
+        market_data = input_data.get('market_data', {})
+        pools = select_pools(
+            market_data,
+            held_symbols(portfolio_holdings(wallet_data)),
+            preferred_protocols,
+            limit=settings.STRATEGY_PROMPT_TOP_POOLS
+        )
         
-        Please provide a JSON response with the following structure:
-        {{
-            "strategy_type": "liquidity_provision|yield_farming|staking|arbitrage|other",
-            "risk_score": 0.0-1.0,
-            "expected_apy": percentage or null,
-            "explanation": "Clear explanation of the strategy",
-            "recommendations": [
-                {{
-                    "protocol": "protocol_name",
-                    "action": "specific_action",
-                    "amount": "suggested_amount",
-                    "reasoning": "why this is recommended"
-                }}
-            ],
-            "warnings": ["any risks or warnings"],
-            "next_steps": ["actionable steps for the user"]
-        }}
-        """
+        return (
+            PromptAssembler(STRATEGY_SYSTEM_PROMPT)
+            .add("profile", f"""Analyze the following user data and market conditions to provide a DeFi strategy recommendation:
+
+User Profile:
+- Risk Tolerance: {risk_tolerance}
+- Investment Amount: {investment_amount}
+- Time Horizon: {time_horizon}
+- Preferred Protocols: {preferred_protocols}""", required=True)
+            .add("wallets", f"""Wallet Holdings (raw units: satoshis, microSTX):
+{wallet_table(wallet_data) or "none"}""", priority=0)
+            .add("market", f"""Market Data (top {len(pools)} pools by relevance; tvl and volume in USD, apy in %):
+{pool_table(pools)}""", priority=1)
+            .add("format", STRATEGY_RESPONSE_FORMAT, required=True)
+            .build()
+        )
     
     async def get_user_recommendations(
         self, 
         user_id: str, 
-        limit: int = 10
+        limit: int = 10,
+        **filters: Any
     ) -> List[Recommendation]:
         """Get user's recommendation history"""
+        recommendations, _ = await self.get_recommendation_page(user_id, limit, **filters)
+        return recommendations
+    
+    async def get_recommendation_page(
+        self,
+        user_id: str,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        strategy_type: Optional[str] = None,
+        status: Optional[str] = None,
+        min_risk_score: Optional[float] = None,
+        max_risk_score: Optional[float] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        protocol: Optional[str] = None,
+        action: Optional[str] = None
+    ) -> Tuple[List[Recommendation], Optional[str]]:
+        """Get one page of a user's recommendation history, newest first
+        
+        Pages are keyed on (created_at, id) so deep pages cost the same as the
+        first one. Returns the page and the cursor for the next page, if any.
+        """
+        query = select(Recommendation).where(Recommendation.user_id == user_id)
+        
+        if strategy_type is not None:
+            query = query.where(Recommendation.strategy_type == strategy_type)
+        if status is not None:
+            query = query.where(Recommendation.status == status)
+        if min_risk_score is not None:
+            query = query.where(Recommendation.risk_score >= min_risk_score)
+        if max_risk_score is not None:
+            query = query.where(Recommendation.risk_score <= max_risk_score)
+        if created_after is not None:
+            query = query.where(Recommendation.created_at >= created_after)
+        if created_before is not None:
+            query = query.where(Recommendation.created_at < created_before)
+        if protocol is not None or action is not None:
+            query = query.where(Recommendation.id.in_(self._action_filter(protocol, action)))
+        
+        if cursor:
+            created_at, recommendation_id = decode_cursor(cursor, 2)
+            try:
+                created_at = datetime.fromisoformat(created_at)
+            except (TypeError, ValueError):
+                raise ValidationError("Invalid cursor")
+            query = query.where(
+                or_(
+                    Recommendation.created_at < created_at,
+                    and_(
+                        Recommendation.created_at == created_at,
+                        Recommendation.id < recommendation_id
+                    )
+                )
+            )
+        
         result = await self.db.execute(
-            select(Recommendation)
-            .where(Recommendation.user_id == user_id)
-            .order_by(desc(Recommendation.created_at))
-            .limit(limit)
+            query
+            .order_by(desc(Recommendation.created_at), desc(Recommendation.id))
+            .limit(limit + 1)
         )
-        return result.scalars().all()
+        recommendations = list(result.scalars().all())
+        
+        next_cursor = None
+        if len(recommendations) > limit:
+            recommendations = recommendations[:limit]
+            last = recommendations[-1]
+            next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+        
+        return recommendations, next_cursor
+    
+    def _action_filter(self, protocol: Optional[str], action: Optional[str]):
+        """Subquery of recommendation IDs with a matching extracted action"""
+        query = select(RecommendationAction.recommendation_id)
+        if protocol is not None:
+            query = query.where(RecommendationAction.protocol == protocol.strip().lower())
+        if action is not None:
+            query = query.where(RecommendationAction.action == action.strip().lower())
+        return query
     
     async def get_recommendation_by_id(self, recommendation_id: str) -> Optional[Recommendation]:
         """Get recommendation by ID"""
@@ -0,0 +1,279 @@
+"""
+Transaction service for the locally stored wallet transaction history
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, and_, or_, desc
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
+import httpx
+from datetime import datetime
+
+from app.core.cache import get_cache
+from app.core.config import settings
+from app.core.exceptions import ExternalAPIError, BlockchainError, ValidationError
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.upstream import bitcoin_pool, stacks_pool
+from app.models.transaction import WalletTransaction
+from app.models.wallet import Wallet, NetworkType
+from app.services.chain_tip import chain_tip_watcher
+
+# Marks wallets synced at their current chain epoch
+sync_cache = get_cache("wallet:transactions", ttl=settings.WALLET_TRANSACTION_CACHE_TTL)
+
+# Page sizes of the upstream history endpoints
+STACKS_PAGE_SIZE = 50
+BITCOIN_PAGE_SIZE = 25
+
+# Stored transactions read per query while streaming
+TRANSACTION_STREAM_PAGE_SIZE = 100
+
+
+class TransactionService:
+    """Service for syncing and reading wallet transaction history
+    
+    History is stored newest-first as a contiguous run of confirmed
+    transactions. A delta sync fetches upstream pages until it reaches a
+    transaction that is already stored, and reads past the oldest stored
+    transaction backfill older pages on demand.
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_transactions(
+        self,
+        wallet: Wallet,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[WalletTransaction], Optional[str]]:
+        """Get one page of a wallet's confirmed transactions, newest first
+        
+        Syncs new transactions at most once per chain epoch, then serves the
+        page locally. Returns the page and the cursor for the next page.
+        """
+        await self.ensure_synced(wallet)
+        
+        transactions = await self._read_with_backfill(wallet, limit, cursor)
+        
+        next_cursor = None
+        if len(transactions) > limit:
+            transactions = transactions[:limit]
+            next_cursor = transaction_cursor(transactions[-1])
+        
+        return transactions, next_cursor
+    
+    async def iter_transactions(
+        self,
+        wallet: Wallet,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[WalletTransaction]:
+        """Yield a wallet's confirmed transactions newest first, up to `limit` (or all)
+        
+        Walks the stored history one page at a time, backfilling older
+        upstream pages only as the consumer reaches them, so memory use does
+        not grow with the length of the history.
+        """
+        await self.ensure_synced(wallet)
+        
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = TRANSACTION_STREAM_PAGE_SIZE if remaining is None else min(remaining, TRANSACTION_STREAM_PAGE_SIZE)
+            transactions = await self._read_with_backfill(wallet, size, cursor)
+            for transaction in transactions[:size]:
+                yield transaction
+            if len(transactions) <= size:
+                return
+            cursor = transaction_cursor(transactions[size - 1])
+            if remaining is not None:
+                remaining -= size
+    
+    async def ensure_synced(self, wallet: Wallet) -> None:
+        """Sync a wallet unless it was already synced at its current chain epoch"""
+        network = wallet.network.value
+        await sync_cache.get_or_compute(
+            chain_tip_watcher.cache_key(network, wallet.address, wallet.id),
+            lambda: self.sync_wallet(wallet),
+            ttl=chain_tip_watcher.cache_ttl(network),
+            shared=chain_tip_watcher.is_shared(network, wallet.address)
+        )
+    
+    async def sync_wallet(self, wallet: Wallet) -> int:
+        """Store transactions newer than the newest stored one, returning how many were added"""
+        newest = (await self.db.execute(
+            select(func.max(WalletTransaction.sequence))
+            .where(WalletTransaction.wallet_id == wallet.id)
+        )).scalar()
+        known = set()
+        if newest is not None:
+            known = set((await self.db.execute(
+                select(WalletTransaction.txid).where(
+                    WalletTransaction.wallet_id == wallet.id,
+                    WalletTransaction.sequence >= newest
+                )
+            )).scalars())
+        
+        rows: List[Dict[str, Any]] = []
+        page_cursor = None
+        overlapped = False
+        # A first sync stores only the newest page; older pages are backfilled on read
+        max_pages = settings.TRANSACTION_SYNC_MAX_PAGES if newest is not None else 1
+        async with httpx.AsyncClient() as client:
+            for _ in range(max_pages):
+                page, page_cursor = await self._fetch_page(client, wallet, page_cursor)
+                for row in page:
+                    if newest is not None and row["sequence"] < newest:
+                        overlapped = True
+                        break
+                    if row["txid"] not in known:
+                        rows.append(row)
+                if overlapped or page_cursor is None:
+                    break
+        
+        if newest is None:
+            wallet.tx_history_cursor = page_cursor
+            wallet.tx_history_complete = page_cursor is None
+        elif not overlapped and page_cursor is not None:
+            # Too many new transactions to bridge the gap; restart from the newest pages
+            await self.db.execute(delete(WalletTransaction).where(WalletTransaction.wallet_id == wallet.id))
+            wallet.tx_history_cursor = page_cursor
+            wallet.tx_history_complete = False
+        
+        await self._insert_ignore(rows)
+        wallet.tx_synced_at = datetime.utcnow()
+        await self.db.commit()
+        return len(rows)
+    
+    async def backfill_wallet(self, wallet: Wallet) -> int:
+        """Store the next page of older transactions, returning how many were added"""
+        if wallet.tx_history_complete:
+            return 0
+        
+        cursor = wallet.tx_history_cursor
+        if wallet.network == NetworkType.STACKS:
+            # Offsets count from the newest transaction, and the stored run is contiguous
+            cursor = str((await self.db.execute(
+                select(func.count()).where(WalletTransaction.wallet_id == wallet.id)
+            )).scalar())
+        
+        async with httpx.AsyncClient() as client:
+            rows, next_cursor = await self._fetch_page(client, wallet, cursor)
+        
+        wallet.tx_history_cursor = next_cursor
+        wallet.tx_history_complete = next_cursor is None
+        await self._insert_ignore(rows)
+        await self.db.commit()
+        return len(rows)
+    
+    async def _read_with_backfill(self, wallet: Wallet, limit: int, cursor: Optional[str]) -> List[WalletTransaction]:
+        """Read up to limit + 1 transactions after the cursor, backfilling older pages if short"""
+        transactions = await self._read_page(wallet, limit, cursor)
+        backfills = 0
+        while (
+            len(transactions) <= limit
+            and not wallet.tx_history_complete
+            and backfills < settings.TRANSACTION_BACKFILL_MAX_PAGES
+        ):
+            if not await self.backfill_wallet(wallet):
+                break
+            backfills += 1
+            transactions = await self._read_page(wallet, limit, cursor)
+        return transactions
+    
+    async def _read_page(self, wallet: Wallet, limit: int, cursor: Optional[str]) -> List[WalletTransaction]:
+        """Read up to limit + 1 stored transactions after the cursor"""
+        query = select(WalletTransaction).where(WalletTransaction.wallet_id == wallet.id)
+        
+        if cursor:
+            sequence, txid = decode_cursor(cursor, 2)
+            if not isinstance(sequence, int) or not isinstance(txid, str):
+                raise ValidationError("Invalid cursor")
+            query = query.where(
+                or_(
+                    WalletTransaction.sequence < sequence,
+                    and_(
+                        WalletTransaction.sequence == sequence,
+                        WalletTransaction.txid < txid
+                    )
+                )
+            )
+        
+        result = await self.db.execute(
+            query
+            .order_by(desc(WalletTransaction.sequence), desc(WalletTransaction.txid))
+            .limit(limit + 1)
+        )
+        return list(result.scalars().all())
+    
+    async def _fetch_page(
+        self,
+        client: httpx.AsyncClient,
+        wallet: Wallet,
+        cursor: Optional[str]
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch one page of confirmed transactions, newest first
+        
+        Returns rows ready for insertion and the cursor for the next older
+        page, or None when the page reached the first transaction.
+        """
+        if wallet.network == NetworkType.STACKS:
+            offset = int(cursor or 0)
+            try:
+                response = await stacks_pool.get(
+                    client,
+                    f"/extended/v1/address/{wallet.address}/transactions",
+                    params={"limit": STACKS_PAGE_SIZE, "offset": offset}
+                )
+                response.raise_for_status()
+                data = response.json()
+            except ExternalAPIError:
+                raise
+            except Exception as e:
+                raise ExternalAPIError(f"Failed to fetch Stacks transactions: {str(e)}")
+            txs = data.get("results", [])
+            more = len(txs) == STACKS_PAGE_SIZE and offset + len(txs) < data.get("total", 0)
+            next_cursor = str(offset + len(txs)) if more else None
+        elif wallet.network == NetworkType.BITCOIN:
+            path = f"/address/{wallet.address}/txs/chain"
+            if cursor:
+                path = f"{path}/{cursor}"
+            try:
+                response = await bitcoin_pool.get(client, path)
+                response.raise_for_status()
+                txs = response.json()
+            except ExternalAPIError:
+                raise
+            except Exception as e:
+                raise ExternalAPIError(f"Failed to fetch Bitcoin transactions: {str(e)}")
+            next_cursor = txs[-1].get("txid") if len(txs) == BITCOIN_PAGE_SIZE else None
+        else:
+            raise BlockchainError(f"Unsupported network: {wallet.network}")
+        
+        rows = [WalletTransaction.row_from_api(wallet.id, wallet.network, tx) for tx in txs]
+        return [row for row in rows if row is not None], next_cursor
+    
+    async def _insert_ignore(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert transaction rows, skipping any already stored for the wallet"""
+        if not rows:
+            return
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "sqlite":
+            await self.db.execute(sqlite.insert(WalletTransaction).values(rows).on_conflict_do_nothing())
+        elif dialect == "postgresql":
+            await self.db.execute(postgresql.insert(WalletTransaction).values(rows).on_conflict_do_nothing())
+        else:
+            existing = set((await self.db.execute(
+                select(WalletTransaction.txid).where(
+                    WalletTransaction.wallet_id == rows[0]["wallet_id"],
+                    WalletTransaction.txid.in_([row["txid"] for row in rows])
+                )
+            )).scalars())
+            missing = [row for row in rows if row["txid"] not in existing]
+            if missing:
+                await self.db.execute(WalletTransaction.__table__.insert(), missing)
+
+
+def transaction_cursor(transaction: WalletTransaction) -> str:
+    """Opaque cursor that resumes history after a transaction"""
+    return encode_cursor(transaction.sequence, transaction.txid)
@@ -0,0 +1,281 @@
+"""
+In-memory Bitcoin UTXO index with mempool-aware balances and coin selection
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+import weakref
+import httpx
+
+from app.core.cache import MemoryBackend
+from app.core.config import settings
+from app.core.exceptions import ExternalAPIError, ValidationError
+from app.core.upstream import EndpointPool, bitcoin_pool
+from app.models.wallet import NetworkType
+from app.services.chain_tip import chain_tip_watcher
+
+logger = logging.getLogger(__name__)
+
+# Virtual sizes used to estimate P2WPKH transaction fees
+TX_OVERHEAD_VBYTES = 11
+INPUT_VBYTES = 68
+OUTPUT_VBYTES = 31
+
+# Change below this is added to the fee instead of creating an output
+DUST_LIMIT = 546
+
+
+class UtxoSet:
+    """Unspent outputs and Esplora-style stats for one address
+    
+    `chain_stats` and `mempool_stats` mirror Esplora's address summary
+    (funded/spent sums and tx counts), so balances come from memory. The
+    set is updated by applying the address's new transactions; anything
+    that cannot be applied incrementally (a gap, a dropped mempool
+    transaction) triggers a full reload.
+    """
+    
+    def __init__(self, address: str):
+        self.address = address
+        self.utxos: Dict[str, Dict[str, Any]] = {}
+        self.chain_stats = _empty_stats()
+        self.mempool_stats = _empty_stats()
+        # Transactions seen on the last update, mapped to their block height (None if unconfirmed)
+        self.seen: Dict[str, Optional[int]] = {}
+        self.epoch_key: Optional[str] = None
+        self.updated_at = 0.0
+    
+    @property
+    def confirmed_balance(self) -> int:
+        """Balance of confirmed transactions, in satoshis"""
+        return self.chain_stats["funded_txo_sum"] - self.chain_stats["spent_txo_sum"]
+    
+    @property
+    def unconfirmed_balance(self) -> int:
+        """Net change from mempool transactions, in satoshis (may be negative)"""
+        return self.mempool_stats["funded_txo_sum"] - self.mempool_stats["spent_txo_sum"]
+    
+    def load(self, summary: Dict[str, Any], utxos: List[Dict[str, Any]], txs: List[Dict[str, Any]]) -> None:
+        """Replace the set from the address summary, UTXO list and latest transactions"""
+        self.chain_stats = _stats_from(summary.get("chain_stats"))
+        self.mempool_stats = _stats_from(summary.get("mempool_stats"))
+        self.utxos = {}
+        for utxo in utxos:
+            status = utxo.get("status") or {}
+            self._add_utxo(utxo["txid"], utxo["vout"], utxo["value"], _height(status))
+        self.seen = {tx["txid"]: _height(tx.get("status") or {}) for tx in txs}
+    
+    def apply(self, txs: List[Dict[str, Any]]) -> bool:
+        """Apply the address's latest transactions (newest first)
+        
+        Returns False when they cannot be applied incrementally: no overlap
+        with the previous update, a mempool transaction that vanished
+        without confirming (replaced or evicted), or a reorged confirmation.
+        """
+        heights = {tx["txid"]: _height(tx.get("status") or {}) for tx in txs}
+        confirmed_seen = [txid for txid, height in self.seen.items() if height is not None]
+        if confirmed_seen and not any(txid in heights for txid in confirmed_seen):
+            return False
+        if any(height is None and txid not in heights for txid, height in self.seen.items()):
+            return False
+        if any(height is not None and txid in heights and heights[txid] is None for txid, height in self.seen.items()):
+            return False
+        
+        # Oldest first so outputs exist before the transactions spending them
+        for tx in reversed(txs):
+            txid = tx["txid"]
+            height = heights[txid]
+            if txid not in self.seen:
+                self._apply_tx(tx, height)
+            elif self.seen[txid] is None and height is not None:
+                self._confirm_tx(tx, height)
+        self.seen = heights
+        return True
+    
+    def spendable(self, include_unconfirmed: bool = False) -> List[Dict[str, Any]]:
+        """UTXOs available for spending"""
+        return [
+            utxo for utxo in self.utxos.values()
+            if include_unconfirmed or utxo["height"] is not None
+        ]
+    
+    def select_coins(
+        self,
+        amount: int,
+        fee_rate: float,
+        include_unconfirmed: bool = False
+    ) -> Dict[str, Any]:
+        """Choose UTXOs paying `amount` satoshis at `fee_rate` sat/vB (see `select_coins`)"""
+        return select_coins(self.spendable(include_unconfirmed), amount, fee_rate)
+    
+    def _apply_tx(self, tx: Dict[str, Any], height: Optional[int]) -> None:
+        stats = self.chain_stats if height is not None else self.mempool_stats
+        funded, spent = self._tx_amounts(tx)
+        stats["funded_txo_count"] += funded[0]
+        stats["funded_txo_sum"] += funded[1]
+        stats["spent_txo_count"] += spent[0]
+        stats["spent_txo_sum"] += spent[1]
+        stats["tx_count"] += 1
+        
+        for vin in tx.get("vin") or []:
+            prevout = vin.get("prevout") or {}
+            if prevout.get("scriptpubkey_address") == self.address:
+                self.utxos.pop(f"{vin['txid']}:{vin['vout']}", None)
+        for index, vout in enumerate(tx.get("vout") or []):
+            if vout.get("scriptpubkey_address") == self.address:
+                self._add_utxo(tx["txid"], index, vout["value"], height)
+    
+    def _confirm_tx(self, tx: Dict[str, Any], height: int) -> None:
+        funded, spent = self._tx_amounts(tx)
+        for stats, sign in ((self.mempool_stats, -1), (self.chain_stats, 1)):
+            stats["funded_txo_count"] += sign * funded[0]
+            stats["funded_txo_sum"] += sign * funded[1]
+            stats["spent_txo_count"] += sign * spent[0]
+            stats["spent_txo_sum"] += sign * spent[1]
+            stats["tx_count"] += sign
+        
+        for index, vout in enumerate(tx.get("vout") or []):
+            utxo = self.utxos.get(f"{tx['txid']}:{index}")
+            if utxo is not None:
+                utxo["height"] = height
+    
+    def _tx_amounts(self, tx: Dict[str, Any]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """(count, sum) of outputs funding and inputs spending this address"""
+        funded = [vout["value"] for vout in tx.get("vout") or [] if vout.get("scriptpubkey_address") == self.address]
+        spent = [
+            (vin.get("prevout") or {}).get("value", 0) for vin in tx.get("vin") or []
+            if (vin.get("prevout") or {}).get("scriptpubkey_address") == self.address
+        ]
+        return (len(funded), sum(funded)), (len(spent), sum(spent))
+    
+    def _add_utxo(self, txid: str, vout: int, value: int, height: Optional[int]) -> None:
+        self.utxos[f"{txid}:{vout}"] = {"txid": txid, "vout": vout, "value": value, "height": height}
+
+
+class UtxoIndex:
+    """Process-wide UTXO sets for Bitcoin addresses
+    
+    A set is loaded once per address and kept in a bounded LRU. It is
+    brought up to date when the address's chain epoch changes or it is
+    older than `max_age` seconds, by applying the address's newest
+    transactions rather than refetching every UTXO.
+    """
+    
+    def __init__(self, pool: EndpointPool, max_entries: int, max_age: float):
+        self.pool = pool
+        self.max_age = max_age
+        self._sets = MemoryBackend(max_entries)
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    async def get(self, address: str) -> UtxoSet:
+        """Current UTXO set for an address"""
+        lock = self._locks.get(address)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[address] = lock
+        async with lock:
+            utxo_set = self._sets.get(address)
+            epoch_key = chain_tip_watcher.cache_key(NetworkType.BITCOIN.value, address, "utxo")
+            if not isinstance(utxo_set, UtxoSet):
+                utxo_set = UtxoSet(address)
+                await self._reload(utxo_set)
+            elif utxo_set.epoch_key != epoch_key or time.monotonic() - utxo_set.updated_at > self.max_age:
+                await self._update(utxo_set)
+            else:
+                return utxo_set
+            utxo_set.epoch_key = epoch_key
+            utxo_set.updated_at = time.monotonic()
+            self._sets.set(address, utxo_set, ttl=settings.UTXO_INDEX_TTL)
+            return utxo_set
+    
+    async def _update(self, utxo_set: UtxoSet) -> None:
+        """Apply new transactions, reloading if they cannot be applied"""
+        async with httpx.AsyncClient() as client:
+            txs = await self._get_json(client, f"/address/{utxo_set.address}/txs")
+        if not utxo_set.apply(txs):
+            logger.info("Reloading UTXO set for %s", utxo_set.address)
+            await self._reload(utxo_set)
+    
+    async def _reload(self, utxo_set: UtxoSet) -> None:
+        """Fetch the address summary, UTXOs and latest transactions"""
+        async with httpx.AsyncClient() as client:
+            summary, utxos, txs = await asyncio.gather(
+                self._get_json(client, f"/address/{utxo_set.address}"),
+                self._get_json(client, f"/address/{utxo_set.address}/utxo"),
+                self._get_json(client, f"/address/{utxo_set.address}/txs"),
+            )
+        utxo_set.load(summary, utxos, txs)
+    
+    async def _get_json(self, client: httpx.AsyncClient, path: str) -> Any:
+        try:
+            response = await self.pool.get(client, path)
+            response.raise_for_status()
+            return response.json()
+        except ExternalAPIError:
+            raise
+        except Exception as e:
+            raise ExternalAPIError(f"Failed to fetch Bitcoin UTXOs: {str(e)}")
+
+
+def select_coins(utxos: List[Dict[str, Any]], amount: int, fee_rate: float) -> Dict[str, Any]:
+    """Choose UTXOs paying `amount` satoshis at `fee_rate` sat/vB
+    
+    Prefers the smallest single UTXO that covers the payment with a change
+    output, and otherwise adds UTXOs largest first. Returns the inputs, the
+    estimated fee and the change amount.
+    """
+    if amount <= 0:
+        raise ValidationError("Amount must be positive")
+    candidates = sorted(utxos, key=lambda utxo: utxo["value"])
+    
+    for utxo in candidates:
+        if utxo["value"] >= amount + _fee(1, 2, fee_rate):
+            return _selection([utxo], amount, fee_rate)
+    
+    selected: List[Dict[str, Any]] = []
+    total = 0
+    for utxo in reversed(candidates):
+        selected.append(utxo)
+        total += utxo["value"]
+        if total >= amount + _fee(len(selected), 1, fee_rate):
+            return _selection(selected, amount, fee_rate)
+    raise ValidationError("Insufficient funds")
+
+
+def _empty_stats() -> Dict[str, int]:
+    return {"funded_txo_count": 0, "funded_txo_sum": 0, "spent_txo_count": 0, "spent_txo_sum": 0, "tx_count": 0}
+
+
+def _stats_from(stats: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    result = _empty_stats()
+    for key in result:
+        result[key] = int((stats or {}).get(key, 0))
+    return result
+
+
+def _height(status: Dict[str, Any]) -> Optional[int]:
+    return status.get("block_height") if status.get("confirmed") else None
+
+
+def _fee(inputs: int, outputs: int, fee_rate: float) -> int:
+    return int((TX_OVERHEAD_VBYTES + inputs * INPUT_VBYTES + outputs * OUTPUT_VBYTES) * fee_rate + 0.5)
+
+
+def _selection(selected: List[Dict[str, Any]], amount: int, fee_rate: float) -> Dict[str, Any]:
+    total = sum(utxo["value"] for utxo in selected)
+    fee = _fee(len(selected), 2, fee_rate)
+    change = total - amount - fee
+    if change < DUST_LIMIT:
+        fee = total - amount
+        change = 0
+    return {"inputs": selected, "fee": fee, "change": change}
+
+
+# Global UTXO index (per process)
+utxo_index = UtxoIndex(
+    bitcoin_pool,
+    max_entries=settings.UTXO_INDEX_MAX_WALLETS,
+    max_age=settings.WALLET_BALANCE_CACHE_TTL
+)
@@ -5,16 +5,26 @@ Wallet service for blockchain wallet management
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 import httpx
 import asyncio
 from datetime import datetime
 
+from app.core.cache import get_cache
 from app.core.config import settings
-from app.core.exceptions import ExternalAPIError, BlockchainError
+from app.core.exceptions import ExternalAPIError, BlockchainError, ValidationError
+from app.core.upstream import stacks_pool
+from app.core.write_coalescer import persist
 from app.models.wallet import Wallet, NetworkType
 from app.models.user import User
+from app.services.chain_tip import chain_tip_watcher
+from app.services.electrum import electrum_backend
+from app.services.transaction_service import TransactionService
+from app.services.utxo_index import utxo_index, select_coins
+from app.services.hd_wallet_service import HDWalletService, parse_descriptor, derive_address
+
+balance_cache = get_cache("wallet:balances", ttl=settings.WALLET_BALANCE_CACHE_TTL)
 
 
 class WalletService:
@@ -26,7 +36,7 @@ class WalletService:
     async def get_wallet_by_id(self, wallet_id: str) -> Optional[Wallet]:
         """Get wallet by ID"""
         result = await self.db.execute(
-            select(Wallet).where(Wallet.id == wallet_id)
+            select(Wallet).where(Wallet.id == str(wallet_id))
         )
         return result.scalar_one_or_none()
     
@@ -53,24 +63,38 @@ class WalletService:
     async def create_wallet(
         self, 
         user_id: str, 
-        address: str, 
+        address: Optional[str], 
         network: NetworkType,
-        label: Optional[str] = None
+        label: Optional[str] = None,
+        descriptor: Optional[str] = None,
+        gap_limit: Optional[int] = None
     ) -> Wallet:
-        """Create a new wallet connection"""
+        """Create a new wallet connection (a single address, or an xpub/descriptor)"""
+        if descriptor is not None:
+            address, descriptor = self.resolve_descriptor(descriptor, network)
+        elif not address:
+            raise ValidationError("An address or descriptor is required")
+        
         wallet = Wallet(
             user_id=user_id,
             address=address,
             network=network,
-            label=label
+            label=label,
+            descriptor=descriptor,
+            gap_limit=gap_limit
         )
         
-        self.db.add(wallet)
-        await self.db.commit()
-        await self.db.refresh(wallet)
+        await persist(self.db, wallet)
         
         return wallet
     
+    def resolve_descriptor(self, descriptor: str, network: NetworkType) -> Tuple[str, str]:
+        """First receive address and canonical form of an xpub or output descriptor"""
+        if network != NetworkType.BITCOIN:
+            raise ValidationError("Descriptors are only supported for Bitcoin wallets")
+        parsed, canonical = parse_descriptor(descriptor)
+        return derive_address(parsed, 0, 0), canonical
+    
     async def disconnect_wallet(self, wallet_id: str) -> None:
         """Disconnect a wallet (soft delete)"""
         wallet = await self.get_wallet_by_id(wallet_id)
@@ -79,7 +103,31 @@ class WalletService:
             await self.db.commit()
     
     async def get_wallet_balances(self, wallet: Wallet) -> Dict[str, Any]:
-        """Get wallet balances from blockchain"""
+        """Get wallet balances from blockchain (cached per address until its chain epoch changes)"""
+        if wallet.descriptor:
+            network = wallet.network.value
+            hd_wallet_service = HDWalletService(self.db)
+            # Keyed on the derived addresses' epochs, so activity on any of them invalidates it
+            derived = [address.address for address in await hd_wallet_service.get_addresses(wallet)]
+            return await balance_cache.get_or_compute(
+                chain_tip_watcher.cache_key(network, wallet.id, "descriptor", watch=derived),
+                lambda: hd_wallet_service.get_balances(wallet),
+                ttl=chain_tip_watcher.cache_ttl(network),
+                shared=chain_tip_watcher.is_shared(network, wallet.id, watch=derived)
+            )
+        if wallet.network == NetworkType.BITCOIN and electrum_backend is None:
+            # The UTXO index keeps its own mempool-aware state
+            return await self._get_bitcoin_balances(wallet.address)
+        network = wallet.network.value
+        return await balance_cache.get_or_compute(
+            chain_tip_watcher.cache_key(network, wallet.address),
+            lambda: self._fetch_wallet_balances(wallet),
+            ttl=chain_tip_watcher.cache_ttl(network),
+            shared=chain_tip_watcher.is_shared(network, wallet.address)
+        )
+    
+    async def _fetch_wallet_balances(self, wallet: Wallet) -> Dict[str, Any]:
+        """Fetch wallet balances from the blockchain APIs"""
         if wallet.network == NetworkType.STACKS:
             return await self._get_stacks_balances(wallet.address)
         elif wallet.network == NetworkType.BITCOIN:
@@ -92,14 +140,14 @@ class WalletService:
         try:
             async with httpx.AsyncClient() as client:
                 # Get STX balance
-                stx_response = await client.get(
-                    f"{settings.STACKS_API_URL}/extended/v1/address/{address}/stx"
+                stx_response = await stacks_pool.get(
+                    client, f"/extended/v1/address/{address}/stx"
                 )
                 stx_data = stx_response.json()
                 
                 # Get token balances
-                tokens_response = await client.get(
-                    f"{settings.STACKS_API_URL}/extended/v1/tokens/nft-holders"
+                tokens_response = await stacks_pool.get(
+                    client, "/extended/v1/tokens/nft-holders"
                 )
                 tokens_data = tokens_response.json()
                 
@@ -113,62 +161,62 @@ class WalletService:
                     "tokens": tokens_data.get("results", []),
                     "network": "stacks"
                 }
+        except ExternalAPIError:
+            raise
         except Exception as e:
             raise ExternalAPIError(f"Failed to fetch Stacks balances: {str(e)}")
     
     async def _get_bitcoin_balances(self, address: str) -> Dict[str, Any]:
-        """Get Bitcoin wallet balances"""
-        try:
-            async with httpx.AsyncClient() as client:
-                # Get address info
-                response = await client.get(
-                    f"{settings.BITCOIN_API_URL}/address/{address}"
-                )
-                data = response.json()
-                
-                return {
-                    "btc": {
-                        "balance": data.get("chain_stats", {}).get("funded_txo_sum", 0) - 
-                                 data.get("chain_stats", {}).get("spent_txo_sum", 0),
-                        "total_received": data.get("chain_stats", {}).get("funded_txo_sum", 0),
-                        "total_sent": data.get("chain_stats", {}).get("spent_txo_sum", 0),
-                        "tx_count": data.get("chain_stats", {}).get("tx_count", 0)
-                    },
-                    "network": "bitcoin"
-                }
-        except Exception as e:
-            raise ExternalAPIError(f"Failed to fetch Bitcoin balances: {str(e)}")
+        """Get Bitcoin wallet balances from the Electrum server or the address's UTXO set"""
+        if electrum_backend is not None:
+            balance = (await electrum_backend.get_balances([address]))[address]
+            return {
+                "btc": {
+                    "balance": balance["confirmed"],
+                    "unconfirmed_balance": balance["unconfirmed"],
+                    "tx_count": balance["tx_count"]
+                },
+                "network": "bitcoin"
+            }
+        utxo_set = await utxo_index.get(address)
+        return {
+            "btc": {
+                "balance": utxo_set.confirmed_balance,
+                "unconfirmed_balance": utxo_set.unconfirmed_balance,
+                "total_received": utxo_set.chain_stats["funded_txo_sum"],
+                "total_sent": utxo_set.chain_stats["spent_txo_sum"],
+                "tx_count": utxo_set.chain_stats["tx_count"],
+                "utxo_count": len(utxo_set.utxos)
+            },
+            "network": "bitcoin"
+        }
     
-    async def get_transaction_history(self, wallet: Wallet, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get transaction history for a wallet"""
-        if wallet.network == NetworkType.STACKS:
-            return await self._get_stacks_transactions(wallet.address, limit)
-        elif wallet.network == NetworkType.BITCOIN:
-            return await self._get_bitcoin_transactions(wallet.address, limit)
+    async def select_coins(
+        self,
+        wallet: Wallet,
+        amount: int,
+        fee_rate: float,
+        include_unconfirmed: bool = False
+    ) -> Dict[str, Any]:
+        """Select UTXOs from a Bitcoin wallet to pay `amount` satoshis at `fee_rate` sat/vB"""
+        if wallet.network != NetworkType.BITCOIN:
+            raise BlockchainError(f"Coin selection is not supported on {wallet.network.value}")
+        if not wallet.descriptor:
+            funded = [wallet.address]
         else:
-            raise BlockchainError(f"Unsupported network: {wallet.network}")
-    
-    async def _get_stacks_transactions(self, address: str, limit: int) -> List[Dict[str, Any]]:
-        """Get Stacks transaction history"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{settings.STACKS_API_URL}/extended/v1/address/{address}/transactions",
-                    params={"limit": limit}
-                )
-                data = response.json()
-                return data.get("results", [])
-        except Exception as e:
-            raise ExternalAPIError(f"Failed to fetch Stacks transactions: {str(e)}")
+            # Pool the UTXOs of every funded derived address
+            addresses = await HDWalletService(self.db).get_addresses(wallet)
+            funded = [address.address for address in addresses if address.balance or address.unconfirmed_balance]
+        
+        if electrum_backend is not None:
+            utxos = await electrum_backend.list_unspent(funded)
+            utxos = [utxo for utxo in utxos if include_unconfirmed or utxo["height"] is not None]
+            return select_coins(utxos, amount, fee_rate)
+        utxo_sets = await asyncio.gather(*[utxo_index.get(address) for address in funded])
+        utxos = [utxo for utxo_set in utxo_sets for utxo in utxo_set.spendable(include_unconfirmed)]
+        return select_coins(utxos, amount, fee_rate)
     
-    async def _get_bitcoin_transactions(self, address: str, limit: int) -> List[Dict[str, Any]]:
-        """Get Bitcoin transaction history"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{settings.BITCOIN_API_URL}/address/{address}/txs",
-                    params={"limit": limit}
-                )
-                return response.json()
-        except Exception as e:
-            raise ExternalAPIError(f"Failed to fetch Bitcoin transactions: {str(e)}")
+    async def get_transaction_history(self, wallet: Wallet, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get recent confirmed transactions for a wallet from the local history store"""
+        transactions, _ = await TransactionService(self.db).get_transactions(wallet, limit=limit)
+        return [tx.data for tx in transactions]
@@ -0,0 +1,113 @@
+"""
+OpenAI-compatible LLM stub for local development and tests
+
+Run with `uvicorn llm_stub:app --port 8001` and point LLM_BASE_URL at
+http://localhost:8001/v1. Answers are deterministic: prompts asking for a
+JSON strategy or lesson get a well-formed one, anything else is echoed.
+"""
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+import json
+import time
+import uuid
+
+app = FastAPI(title="Satoshi Sensei LLM stub")
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str
+    messages: List[ChatMessage]
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    stream: bool = False
+
+
+def _count_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _answer(messages: List[ChatMessage]) -> str:
+    prompt = messages[-1].content if messages else ""
+    system = " ".join(message.content for message in messages if message.role == "system")
+    if "strateg" in system.lower():
+        return json.dumps({
+            "strategy_type": "yield_farming",
+            "risk_score": 0.4,
+            "expected_apy": 8.5,
+            "explanation": "Stub strategy: provide liquidity to a stable STX pool.",
+            "recommendations": [
+                {"protocol": "alex", "action": "provide_liquidity", "amount": 100, "reason": "Stub recommendation"}
+            ],
+            "warnings": ["Stub response, not financial advice"],
+            "next_steps": ["Review the pool before depositing"]
+        })
+    if "educat" in system.lower():
+        return json.dumps({
+            "topic": "stub",
+            "level": "beginner",
+            "explanation": "Stub lesson.",
+            "key_concepts": [],
+            "examples": [],
+            "related_topics": [],
+            "resources": []
+        })
+    return f"Stub reply to: {prompt[:200]}"
+
+
+@app.get("/v1/models")
+async def list_models() -> Dict[str, Any]:
+    return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "satoshi-sensei"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest) -> Any:
+    content = _answer(request.messages)
+    prompt_tokens = sum(_count_tokens(message.content) for message in request.messages)
+    completion_tokens = _count_tokens(content)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+    if request.stream:
+        return StreamingResponse(_stream(request.model, content, usage), media_type="text/event-stream")
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": usage
+    }
+
+
+async def _stream(model: str, content: str, usage: Dict[str, int]):
+    """Chunks of a few characters in OpenAI's streaming format, usage on the last one"""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+    for index, piece in enumerate(pieces):
+        last = index == len(pieces) - 1
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": "stop" if last else None}]
+        }
+        if last:
+            chunk["usage"] = usage
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
@@ -6,14 +6,26 @@ from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import os
 from typing import Optional
 
 from app.core.config import settings
 from app.core.database import init_db
+from app.core.deadline import DeadlineMiddleware
 from app.api.v1.api import api_router
 from app.core.exceptions import SatoshiSenseiException
+from app.core.rate_governor import governors
+from app.core.upstream import upstream_pools, run_upstream_probe_loop
+from app.core.write_coalescer import write_coalescer
+from app.services.archive_service import run_archive_loop
+from app.services.batch_service import run_batch_recommendation_loop
+from app.services.chain_tip import run_chain_tip_loop
+from app.services.electrum import electrum_backend
+from app.services.job_service import recommendation_workers
+from app.services.llm_gateway import llm_gateway
+from app.services.market_snapshot import market_snapshot, run_market_snapshot_loop
 
 
 @asynccontextmanager
@@ -21,9 +33,31 @@ async def lifespan(app: FastAPI):
     """Application lifespan events"""
     # Startup
     await init_db()
+    if settings.WRITE_COALESCE_ENABLED:
+        await write_coalescer.start()
+    background_tasks = []
+    if settings.RECOMMENDATION_ARCHIVE_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(run_archive_loop()))
+    if any(len(pool.endpoints) > 1 for pool in upstream_pools.values()):
+        background_tasks.append(asyncio.create_task(run_upstream_probe_loop()))
+    if settings.CHAIN_TIP_WATCH_ENABLED:
+        background_tasks.append(asyncio.create_task(run_chain_tip_loop()))
+    if settings.MARKET_SNAPSHOT_ENABLED and market_snapshot.available:
+        background_tasks.append(asyncio.create_task(run_market_snapshot_loop()))
+    if settings.BATCH_RECOMMENDATIONS_ENABLED:
+        background_tasks.append(asyncio.create_task(run_batch_recommendation_loop()))
+    if settings.RECOMMENDATION_JOB_WORKERS > 0:
+        await recommendation_workers.start()
     yield
     # Shutdown
-    pass
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await recommendation_workers.stop()
+    await write_coalescer.stop()
+    if electrum_backend is not None:
+        await electrum_backend.close()
+    await llm_gateway.close()
 
 
 # Initialize FastAPI app
@@ -43,8 +77,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Request deadline budgets (X-Request-Timeout)
+app.add_middleware(DeadlineMiddleware, maximum=settings.REQUEST_TIMEOUT_MAX_SECONDS)
+
 # Include API routes
 app.include_router(api_router, prefix="/api/v1")
 
@@ -63,7 +101,13 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "satoshi-sensei-backend",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "upstreams": {
+            name: [endpoint.stats() for endpoint in pool.ranked()]
+            for name, pool in upstream_pools.items()
+        },
+        "rate_limits": {name: governor.stats() for name, governor in governors.items()},
+        "recommendation_jobs": {"running": recommendation_workers.running, **recommendation_workers.stats}
     }
 
 
@@ -0,0 +1,65 @@
+"""
+Alembic environment: runs migrations on the connection `init_db` passes in,
+or on a connection to DATABASE_URL when invoked from the command line
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models import user, wallet, recommendation, blob, transaction, job  # noqa: F401
+
+config = context.config
+connection = config.attributes.get("connection")
+
+if connection is None and config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def sync_database_url() -> str:
+    """DATABASE_URL with any async driver swapped for its sync counterpart"""
+    return settings.DATABASE_URL.replace("+aiosqlite", "").replace("+asyncpg", "")
+
+
+def run_migrations_offline() -> None:
+    """Emit the migration SQL without connecting"""
+    context.configure(
+        url=sync_database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Run the migrations on a live connection"""
+    if connection is not None:
+        _run(connection)
+        return
+    
+    engine = create_engine(sync_database_url())
+    try:
+        with engine.connect() as conn:
+            _run(conn)
+    finally:
+        engine.dispose()
+
+
+def _run(conn) -> None:
+    # SQLite cannot alter or drop most columns in place; batch mode recreates the table
+    context.configure(connection=conn, target_metadata=target_metadata, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,67 @@
+"""
+Initial schema: users, wallets and recommendations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("email", sa.String(255), nullable=False),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("is_verified", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True))
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    
+    op.create_table(
+        "wallets",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.String(36), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("address", sa.String(255), nullable=False),
+        sa.Column("network", sa.Enum("STACKS", "BITCOIN", name="networktype"), nullable=False),
+        sa.Column("label", sa.String(100)),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True))
+    )
+    op.create_index("ix_wallets_address", "wallets", ["address"])
+    
+    op.create_table(
+        "recommendations",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.String(36), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("raw_input", sa.JSON(), nullable=False),
+        sa.Column("ai_output", sa.JSON(), nullable=False),
+        sa.Column("strategy_type", sa.String(100), nullable=False),
+        sa.Column("risk_score", sa.Float(), nullable=False),
+        sa.Column("expected_apy", sa.Float()),
+        sa.Column("explanation", sa.Text()),
+        sa.Column("status", sa.String(50)),
+        sa.Column("executed_at", sa.DateTime(timezone=True)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True))
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("recommendations")
+    op.drop_index("ix_wallets_address", table_name="wallets")
+    op.drop_table("wallets")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_table("users")
@@ -0,0 +1,331 @@
+"""
+Move recommendation inputs into content-addressed blobs and add the tables and
+columns for actions, archival, jobs, batch runs, HD wallets and tx history
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core import serialization
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Rows backfilled per round trip
+CHUNK_SIZE = 500
+
+recommendations = sa.table(
+    "recommendations",
+    sa.column("id", sa.String),
+    sa.column("raw_input", sa.JSON),
+    sa.column("raw_input_hash", sa.String),
+    sa.column("market_data_hash", sa.String),
+    sa.column("ai_output", sa.JSON),
+    sa.column("primary_protocol", sa.String),
+    sa.column("action_count", sa.Integer)
+)
+blobs = sa.table(
+    "blobs",
+    sa.column("hash", sa.String),
+    sa.column("codec", sa.String),
+    sa.column("size", sa.Integer),
+    sa.column("data", sa.LargeBinary)
+)
+actions = sa.table(
+    "recommendation_actions",
+    sa.column("recommendation_id", sa.String),
+    sa.column("position", sa.Integer),
+    sa.column("protocol", sa.String),
+    sa.column("action", sa.String),
+    sa.column("amount", sa.String)
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("hash", sa.String(64), primary_key=True),
+        sa.Column("codec", sa.String(16), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now())
+    )
+    
+    with op.batch_alter_table("recommendations") as batch_op:
+        batch_op.add_column(sa.Column("raw_input_hash", sa.String(64)))
+        batch_op.add_column(sa.Column("market_data_hash", sa.String(64)))
+        batch_op.add_column(sa.Column("input_fingerprint", sa.JSON()))
+        batch_op.add_column(sa.Column("primary_protocol", sa.String(100)))
+        batch_op.add_column(sa.Column("action_count", sa.Integer(), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column("archived_at", sa.DateTime(timezone=True)))
+        batch_op.add_column(sa.Column("archive_segment", sa.String(255)))
+        batch_op.add_column(sa.Column("archive_offset", sa.BigInteger()))
+        batch_op.add_column(sa.Column("archive_length", sa.Integer()))
+    
+    op.create_table(
+        "recommendation_actions",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column(
+            "recommendation_id",
+            sa.String(36),
+            sa.ForeignKey("recommendations.id", ondelete="CASCADE"),
+            nullable=False
+        ),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column("protocol", sa.String(100), nullable=False),
+        sa.Column("action", sa.String(100)),
+        sa.Column("amount", sa.String(100))
+    )
+    op.create_index("ix_recommendation_actions_recommendation_id", "recommendation_actions", ["recommendation_id"])
+    op.create_index(
+        "ix_recommendation_actions_protocol_action",
+        "recommendation_actions",
+        ["protocol", "action", "recommendation_id"]
+    )
+    
+    _backfill_recommendations(op.get_bind())
+    
+    # input_fingerprint stays NULL, so the change-detection gate regenerates once per user
+    with op.batch_alter_table("recommendations") as batch_op:
+        batch_op.drop_column("raw_input")
+        batch_op.alter_column("action_count", server_default=None)
+        batch_op.create_foreign_key("fk_recommendations_raw_input_hash", "blobs", ["raw_input_hash"], ["hash"])
+        batch_op.create_foreign_key("fk_recommendations_market_data_hash", "blobs", ["market_data_hash"], ["hash"])
+        batch_op.create_index("ix_recommendations_raw_input_hash", ["raw_input_hash"])
+        batch_op.create_index("ix_recommendations_market_data_hash", ["market_data_hash"])
+        batch_op.create_index("ix_recommendations_primary_protocol", ["primary_protocol"])
+        batch_op.create_index("ix_recommendations_user_created", ["user_id", "created_at", "id"])
+        batch_op.create_index(
+            "ix_recommendations_user_strategy_created", ["user_id", "strategy_type", "created_at", "id"]
+        )
+        batch_op.create_index("ix_recommendations_user_status_created", ["user_id", "status", "created_at", "id"])
+    
+    op.create_table(
+        "recommendation_jobs",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.String(36), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("params", sa.JSON(), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column(
+            "recommendation_id",
+            sa.String(36),
+            sa.ForeignKey("recommendations.id", ondelete="SET NULL")
+        ),
+        sa.Column("error", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("started_at", sa.DateTime(timezone=True)),
+        sa.Column("finished_at", sa.DateTime(timezone=True))
+    )
+    op.create_index("ix_recommendation_jobs_status_created", "recommendation_jobs", ["status", "created_at"])
+    op.create_index("ix_recommendation_jobs_user_created", "recommendation_jobs", ["user_id", "created_at"])
+    
+    op.create_table(
+        "recommendation_batch_runs",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("run_key", sa.String(32), nullable=False, unique=True),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("cursor", sa.String(36)),
+        sa.Column("market_data_hash", sa.String(64), sa.ForeignKey("blobs.hash")),
+        sa.Column("stats", sa.JSON(), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("checkpoint_at", sa.DateTime(timezone=True)),
+        sa.Column("finished_at", sa.DateTime(timezone=True))
+    )
+    
+    with op.batch_alter_table("wallets") as batch_op:
+        batch_op.add_column(sa.Column("descriptor", sa.Text()))
+        batch_op.add_column(sa.Column("gap_limit", sa.Integer()))
+        batch_op.add_column(sa.Column("tx_history_cursor", sa.String(100)))
+        batch_op.add_column(sa.Column("tx_history_complete", sa.Boolean()))
+        batch_op.add_column(sa.Column("tx_synced_at", sa.DateTime(timezone=True)))
+    
+    op.create_table(
+        "wallet_addresses",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("wallet_id", sa.String(36), sa.ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("branch", sa.Integer(), nullable=False),
+        sa.Column("derivation_index", sa.Integer(), nullable=False),
+        sa.Column("address", sa.String(100), nullable=False),
+        sa.Column("used", sa.Boolean(), nullable=False),
+        sa.Column("tx_count", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.BigInteger(), nullable=False),
+        sa.Column("unconfirmed_balance", sa.BigInteger(), nullable=False),
+        sa.Column("checked_at", sa.DateTime(timezone=True)),
+        sa.UniqueConstraint("wallet_id", "branch", "derivation_index", name="uq_wallet_addresses_path")
+    )
+    op.create_index("ix_wallet_addresses_wallet_id", "wallet_addresses", ["wallet_id"])
+    op.create_index("ix_wallet_addresses_address", "wallet_addresses", ["address"])
+    
+    op.create_table(
+        "transactions",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("wallet_id", sa.String(36), sa.ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("txid", sa.String(80), nullable=False),
+        sa.Column("block_height", sa.Integer(), nullable=False),
+        sa.Column("sequence", sa.BigInteger(), nullable=False),
+        sa.Column("block_time", sa.DateTime(timezone=True)),
+        sa.Column("data", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("wallet_id", "txid", name="uq_transactions_wallet_txid")
+    )
+    op.create_index("ix_transactions_wallet_sequence", "transactions", ["wallet_id", "sequence", "txid"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transactions_wallet_sequence", table_name="transactions")
+    op.drop_table("transactions")
+    op.drop_index("ix_wallet_addresses_address", table_name="wallet_addresses")
+    op.drop_index("ix_wallet_addresses_wallet_id", table_name="wallet_addresses")
+    op.drop_table("wallet_addresses")
+    
+    with op.batch_alter_table("wallets") as batch_op:
+        batch_op.drop_column("tx_synced_at")
+        batch_op.drop_column("tx_history_complete")
+        batch_op.drop_column("tx_history_cursor")
+        batch_op.drop_column("gap_limit")
+        batch_op.drop_column("descriptor")
+    
+    op.drop_table("recommendation_batch_runs")
+    op.drop_index("ix_recommendation_jobs_user_created", table_name="recommendation_jobs")
+    op.drop_index("ix_recommendation_jobs_status_created", table_name="recommendation_jobs")
+    op.drop_table("recommendation_jobs")
+    
+    with op.batch_alter_table("recommendations") as batch_op:
+        batch_op.add_column(sa.Column("raw_input", sa.JSON()))
+    
+    _restore_raw_input(op.get_bind())
+    
+    with op.batch_alter_table("recommendations") as batch_op:
+        batch_op.alter_column("raw_input", existing_type=sa.JSON(), nullable=False)
+        batch_op.drop_index("ix_recommendations_user_status_created")
+        batch_op.drop_index("ix_recommendations_user_strategy_created")
+        batch_op.drop_index("ix_recommendations_user_created")
+        batch_op.drop_index("ix_recommendations_primary_protocol")
+        batch_op.drop_index("ix_recommendations_market_data_hash")
+        batch_op.drop_index("ix_recommendations_raw_input_hash")
+        batch_op.drop_constraint("fk_recommendations_market_data_hash", type_="foreignkey")
+        batch_op.drop_constraint("fk_recommendations_raw_input_hash", type_="foreignkey")
+        for column in (
+            "archive_length", "archive_offset", "archive_segment", "archived_at",
+            "action_count", "primary_protocol", "input_fingerprint", "market_data_hash", "raw_input_hash"
+        ):
+            batch_op.drop_column(column)
+    
+    op.drop_index("ix_recommendation_actions_protocol_action", table_name="recommendation_actions")
+    op.drop_index("ix_recommendation_actions_recommendation_id", table_name="recommendation_actions")
+    op.drop_table("recommendation_actions")
+    op.drop_table("blobs")
+
+
+def _backfill_recommendations(bind) -> None:
+    """Store each row's raw_input as blobs and extract its actions from ai_output"""
+    stored = set()
+    last_id = ""
+    while True:
+        rows = bind.execute(
+            sa.select(recommendations.c.id, recommendations.c.raw_input, recommendations.c.ai_output)
+            .where(recommendations.c.id > last_id)
+            .order_by(recommendations.c.id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        
+        new_blobs = []
+        new_actions = []
+        for row in rows:
+            raw_input = row.raw_input
+            market_data = raw_input.get("market_data") if isinstance(raw_input, dict) else None
+            if market_data is not None:
+                raw_input = {key: item for key, item in raw_input.items() if key != "market_data"}
+            
+            raw_input_hash = _blob_row(raw_input, stored, new_blobs)
+            market_data_hash = _blob_row(market_data, stored, new_blobs) if market_data is not None else None
+            
+            row_actions = _actions_from_output(row.id, row.ai_output)
+            new_actions.extend(row_actions)
+            bind.execute(
+                recommendations.update()
+                .where(recommendations.c.id == row.id)
+                .values(
+                    raw_input_hash=raw_input_hash,
+                    market_data_hash=market_data_hash,
+                    primary_protocol=row_actions[0]["protocol"] if row_actions else None,
+                    action_count=len(row_actions)
+                )
+            )
+        
+        if new_blobs:
+            bind.execute(blobs.insert(), new_blobs)
+        if new_actions:
+            bind.execute(actions.insert(), new_actions)
+
+
+def _blob_row(payload, stored: set, new_blobs: list) -> str:
+    """Queue a blob row for a payload unless one is already stored; return its hash"""
+    raw = serialization.dumps(payload)
+    content_hash = serialization.content_hash(raw)
+    if content_hash not in stored:
+        codec, data = serialization.compress(raw)
+        new_blobs.append({"hash": content_hash, "codec": codec, "size": len(raw), "data": data})
+        stored.add(content_hash)
+    return content_hash
+
+
+def _actions_from_output(recommendation_id: str, ai_output) -> list:
+    """Action rows for ai_output["recommendations"], skipping malformed entries"""
+    items = ai_output.get("recommendations") if isinstance(ai_output, dict) else None
+    if not isinstance(items, list):
+        return []
+    
+    rows = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("protocol"):
+            continue
+        action = item.get("action")
+        amount = item.get("amount")
+        rows.append({
+            "recommendation_id": recommendation_id,
+            "position": len(rows),
+            "protocol": str(item["protocol"]).strip().lower()[:100],
+            "action": str(action).strip().lower()[:100] if action else None,
+            "amount": str(amount)[:100] if amount is not None else None
+        })
+    return rows
+
+
+def _restore_raw_input(bind) -> None:
+    """Write each row's blobs back into the raw_input column"""
+    last_id = ""
+    while True:
+        rows = bind.execute(
+            sa.select(recommendations.c.id, recommendations.c.raw_input_hash, recommendations.c.market_data_hash)
+            .where(recommendations.c.id > last_id)
+            .order_by(recommendations.c.id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        
+        hashes = {h for row in rows for h in (row.raw_input_hash, row.market_data_hash) if h}
+        payloads = {
+            blob.hash: serialization.loads(serialization.decompress(blob.codec, blob.data))
+            for blob in bind.execute(sa.select(blobs).where(blobs.c.hash.in_(hashes)))
+        }
+        for row in rows:
+            raw_input = payloads.get(row.raw_input_hash, {})
+            if row.market_data_hash and isinstance(raw_input, dict):
+                raw_input = {**raw_input, "market_data": payloads.get(row.market_data_hash)}
+            bind.execute(
+                recommendations.update().where(recommendations.c.id == row.id).values(raw_input=raw_input)
+            )
@@ -0,0 +1,46 @@
+"""
+Store recommendation timestamps in one format and index risk-filtered history
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.database import utcnow
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        # Pad CURRENT_TIMESTAMP values to the ORM format so keyset comparisons see one format
+        op.execute(
+            "UPDATE recommendations "
+            "SET created_at = substr(replace(created_at, 'T', ' ') || '.000000', 1, 26) "
+            "WHERE length(created_at) != 26"
+        )
+        with op.batch_alter_table("recommendations") as batch_op:
+            batch_op.alter_column(
+                "created_at",
+                existing_type=sa.DateTime(timezone=True),
+                server_default=utcnow()
+            )
+    op.create_index("ix_recommendations_user_risk", "recommendations", ["user_id", "risk_score"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_recommendations_user_risk", table_name="recommendations")
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table("recommendations") as batch_op:
+            batch_op.alter_column(
+                "created_at",
+                existing_type=sa.DateTime(timezone=True),
+                server_default=sa.func.now()
+            )
@@ -0,0 +1,35 @@
+"""
+Drop the unused primary_protocol summary of recommendation actions
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Protocol filters go through recommendation_actions
+    with op.batch_alter_table("recommendations") as batch_op:
+        batch_op.drop_index("ix_recommendations_primary_protocol")
+        batch_op.drop_column("primary_protocol")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("recommendations") as batch_op:
+        batch_op.add_column(sa.Column("primary_protocol", sa.String(100)))
+    op.execute(
+        "UPDATE recommendations SET primary_protocol = ("
+        "SELECT protocol FROM recommendation_actions "
+        "WHERE recommendation_actions.recommendation_id = recommendations.id AND position = 0)"
+    )
+    with op.batch_alter_table("recommendations") as batch_op:
+        batch_op.create_index("ix_recommendations_primary_protocol", ["primary_protocol"])
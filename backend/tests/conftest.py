@@ -18,6 +18,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
 from app.core.database import get_db, Base
+from app.core.cache import clear_caches
 from app.core.config import settings
 from app.models.user import User
 from app.models.wallet import Wallet, NetworkType
@@ -51,6 +52,13 @@ def event_loop() -> Generator:
     loop.close()
 
 
+@pytest.fixture(autouse=True)
+def clear_app_caches():
+    """Start every test with empty application caches."""
+    clear_caches()
+    yield
+
+
 @pytest.fixture(scope="function")
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
     """Create a test database session."""
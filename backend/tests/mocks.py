@@ -2,6 +2,7 @@
 Mock utilities for external APIs and services
 """
 
+import asyncio
 import json
 from unittest.mock import AsyncMock, MagicMock, patch
 from typing import Dict, Any, List
@@ -281,3 +282,71 @@ def mock_all_external_apis():
                 return await func(*args, **kwargs)
         return wrapper
     return decorator
+
+
+class ElectrumStubServer:
+    """Local Electrum server for tests
+    
+    Speaks newline-delimited JSON-RPC (single and batched requests) on
+    127.0.0.1. Balances, histories and UTXOs are keyed by script hash;
+    `messages` counts the messages received, so tests can check that
+    lookups were batched, and `notify` pushes a scripthash notification
+    to every connected client.
+    """
+    
+    def __init__(self):
+        self.balances: Dict[str, Dict[str, int]] = {}
+        self.histories: Dict[str, List[Dict[str, Any]]] = {}
+        self.unspent: Dict[str, List[Dict[str, Any]]] = {}
+        self.messages = 0
+        self.port = None
+        self._server = None
+        self._writers = []
+    
+    async def start(self) -> "ElectrumStubServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+    
+    async def stop(self) -> None:
+        for writer in self._writers:
+            writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+    
+    async def notify(self, scripthash: str) -> None:
+        message = {"jsonrpc": "2.0", "method": "blockchain.scripthash.subscribe", "params": [scripthash, "status"]}
+        for writer in self._writers:
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+    
+    async def _handle(self, reader, writer) -> None:
+        self._writers.append(writer)
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            self.messages += 1
+            request = json.loads(line)
+            if isinstance(request, list):
+                response = [self._respond(item) for item in request]
+            else:
+                response = self._respond(request)
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+    
+    def _respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        method, params = request["method"], request["params"]
+        if method == "server.version":
+            result = ["ElectrumStub 1.0", "1.4"]
+        elif method == "blockchain.scripthash.get_balance":
+            result = self.balances.get(params[0], {"confirmed": 0, "unconfirmed": 0})
+        elif method == "blockchain.scripthash.get_history":
+            result = self.histories.get(params[0], [])
+        elif method == "blockchain.scripthash.listunspent":
+            result = self.unspent.get(params[0], [])
+        elif method == "blockchain.scripthash.subscribe":
+            result = "status" if self.histories.get(params[0]) else None
+        else:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32601, "message": "unknown method"}}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
@@ -8,8 +8,12 @@ from httpx import AsyncClient
 from unittest.mock import patch, AsyncMock
 import uuid
 
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
 from app.models.user import User
-from app.services.auth_service import AuthService
+from app.services.auth_service import AuthService, CurrentUser
 
 
 @pytest.mark.auth
@@ -230,6 +234,41 @@ class TestAuthService:
         with pytest.raises(Exception):  # Should raise AuthenticationError
             await auth_service.get_current_user("invalid_token")
     
+    @pytest.mark.asyncio
+    async def test_get_current_user_cache_invalidated_on_update(self, tmp_path):
+        """Test the cached principal is dropped when the user row changes."""
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'auth.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        
+        async with Session() as db:
+            user = User(email="cached@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            token = AuthService(db).create_access_token(user.id)
+        
+        async with Session() as db:
+            current = await AuthService(db).get_current_user(token)
+            assert isinstance(current, CurrentUser)
+            assert current.is_active is True
+        
+        async with Session() as db:
+            stored = await db.get(User, user.id)
+            stored.is_active = False
+            await db.commit()
+        
+        async with Session() as db:
+            current = await AuthService(db).get_current_user(token)
+            assert current.is_active is False
+            
+            await db.delete(await db.get(User, user.id))
+            await db.commit()
+            with pytest.raises(Exception):  # Should raise AuthenticationError
+                await AuthService(db).get_current_user(token)
+        
+        await engine.dispose()
+    
     def test_password_hashing(self):
         """Test password hashing and verification."""
         auth_service = AuthService(None)
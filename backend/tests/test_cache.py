@@ -0,0 +1,131 @@
+"""
+Cache subsystem tests
+"""
+
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+
+from app.core.cache import Cache, MemoryBackend, RedisBackend, get_cache
+
+
+@pytest.mark.unit
+class TestMemoryBackend:
+    """Test the in-process LRU tier."""
+    
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted first."""
+        backend = MemoryBackend(max_entries=2)
+        backend.set("a", 1, ttl=60)
+        backend.set("b", 2, ttl=60)
+        backend.get("a")
+        backend.set("c", 3, ttl=60)
+        
+        assert len(backend) == 2
+        assert backend.get("a") == 1
+        assert backend.get("c") == 3
+    
+    @pytest.mark.asyncio
+    async def test_expiry(self):
+        """Test entries expire after their TTL."""
+        cache = Cache("test", ttl=0.01, max_entries=10, jitter=0)
+        await cache.set("key", "value")
+        assert await cache.get("key") == "value"
+        
+        await asyncio.sleep(0.02)
+        assert await cache.get("key", "default") == "default"
+
+
+@pytest.mark.unit
+class TestCache:
+    """Test the namespaced cache API."""
+    
+    @pytest.mark.asyncio
+    async def test_get_or_compute_deduplicates_concurrent_misses(self):
+        """Test concurrent misses share one computation."""
+        cache = Cache("test", ttl=60, max_entries=10)
+        calls = 0
+        
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"price": 1.0}
+        
+        results = await asyncio.gather(*[cache.get_or_compute("btc", compute) for _ in range(10)])
+        
+        assert calls == 1
+        assert all(result == {"price": 1.0} for result in results)
+        assert await cache.get_or_compute("btc", compute) == {"price": 1.0}
+        assert calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_get_or_compute_does_not_cache_errors(self):
+        """Test failed computations are retried on the next call."""
+        cache = Cache("test", ttl=60, max_entries=10)
+        
+        async def failing():
+            raise ValueError("upstream down")
+        
+        async def succeeding():
+            return "ok"
+        
+        with pytest.raises(ValueError):
+            await cache.get_or_compute("key", failing)
+        assert await cache.get_or_compute("key", succeeding) == "ok"
+    
+    @pytest.mark.asyncio
+    async def test_get_or_compute_waiter_takes_over_from_cancelled_owner(self):
+        """Test cancelling the computing caller does not cancel callers waiting on it."""
+        cache = Cache("test", ttl=60, max_entries=10)
+        started = asyncio.Event()
+        calls = 0
+        
+        async def compute():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.01)
+            return "value"
+        
+        owner = asyncio.create_task(cache.get_or_compute("key", compute))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0)
+        owner.cancel()
+        
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        assert await waiter == "value"
+        assert calls == 2
+    
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_falls_back_to_local(self):
+        """Test an unreachable Redis degrades to the local tier."""
+        remote = RedisBackend("redis://127.0.0.1:1/0")
+        cache = Cache("test", ttl=60, max_entries=10, remote=remote)
+        
+        await cache.set("key", "value")
+        
+        assert not remote.available
+        assert await cache.get("key") == "value"
+    
+    @pytest.mark.asyncio
+    async def test_unshared_entries_skip_the_remote_tier(self):
+        """Test shared=False keeps an entry out of the shared tier."""
+        remote = MemoryBackend(max_entries=10)
+        cache = Cache("test", ttl=60, max_entries=10, remote=AsyncMock(wraps=remote))
+        
+        async def compute():
+            return "value"
+        
+        assert await cache.get_or_compute("local", compute, shared=False) == "value"
+        assert await cache.get_or_compute("shared", compute) == "value"
+        
+        assert [call.args[0] for call in cache.remote.set.call_args_list] == [cache.key("shared")]
+        assert cache.remote.get.call_args_list[0].args[0] == cache.key("shared")
+    
+    def test_namespaced_keys(self):
+        """Test shared-tier keys include the namespace."""
+        assert get_cache("wallet:balances").key("stacks:SP123").endswith("wallet:balances:stacks:SP123")
+        assert get_cache("wallet:balances") is get_cache("wallet:balances")
@@ -5,8 +5,9 @@ Education endpoints tests
 import pytest
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 import json
+import httpx
 
 from app.services.education_service import EducationService
 
@@ -298,3 +299,35 @@ class TestEducationService:
         assert "JSON response" in prompt
         assert "key_concepts" in prompt
         assert "examples" in prompt
+    
+    @pytest.mark.asyncio
+    async def test_stream_education_content(self):
+        """Test streamed lessons yield fields as they complete and are cached for the next call."""
+        from app.core.rate_governor import RateGovernor
+        from app.services.llm_gateway import LLMGateway
+        from llm_stub import app as stub_app
+        
+        gateway = LLMGateway("http://stub/v1", "key", "stub", transport=httpx.ASGITransport(app=stub_app), governor=RateGovernor("test"))
+        education_service = EducationService(MagicMock())
+        with patch('app.services.education_service.llm_gateway', gateway):
+            first = [event async for event in education_service.stream_education_content("staking", "beginner")]
+            again = [event async for event in education_service.stream_education_content("staking", "beginner")]
+        
+        assert [event for event, _ in first].count("token") > 1
+        assert ("field", {"name": "explanation", "value": "Stub lesson."}) in first
+        assert first[-1] == ("content", again[-1][1])
+        assert first[-1][1]["explanation"] == "Stub lesson."
+        assert "token" not in [event for event, _ in again]
+        assert gateway.usage["requests"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stream_education_content_fallback(self):
+        """Test a failed stream falls back to static content fields."""
+        education_service = EducationService(MagicMock())
+        with patch('app.services.education_service.llm_gateway') as gateway:
+            gateway.stream_chat = MagicMock(side_effect=Exception("API error"))
+            events = [event async for event in education_service.stream_education_content("liquidity_provision", "beginner")]
+        
+        assert events[-1][0] == "content"
+        assert "Liquidity provision" in events[-1][1]["explanation"]
+        assert ("field", {"name": "topic", "value": "liquidity_provision"}) in events
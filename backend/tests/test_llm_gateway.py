@@ -0,0 +1,127 @@
+"""
+LLM gateway tests
+"""
+
+import pytest
+import json
+import httpx
+
+from app.core.exceptions import AIError
+from app.core.rate_governor import RateGovernor
+from app.services.json_stream import JSONFieldStream
+from app.services.llm_gateway import LLMGateway
+from llm_stub import app as stub_app
+
+
+def _gateway(handler=None, **kwargs) -> LLMGateway:
+    transport = httpx.MockTransport(handler) if handler else httpx.ASGITransport(app=stub_app)
+    return LLMGateway("http://stub/v1", "test-key", "stub-model", transport=transport, governor=RateGovernor("test"), **kwargs)
+
+
+class TestLLMGateway:
+    """Test the shared LLM gateway against the local stub."""
+    
+    @pytest.mark.asyncio
+    async def test_chat_against_stub_records_usage(self):
+        """Test completions come back with token usage and reach hooks."""
+        gateway = _gateway()
+        seen = []
+        gateway.hooks.append(lambda payload, completion: seen.append(completion["model"]))
+        
+        completion = await gateway.chat([
+            {"role": "system", "content": "You are an expert DeFi advisor. Provide strategies."},
+            {"role": "user", "content": "What should I do with 100 STX?"}
+        ])
+        await gateway.close()
+        
+        assert json.loads(completion["content"])["strategy_type"] == "yield_farming"
+        assert completion["usage"]["total_tokens"] > 0
+        assert gateway.usage["requests"] == 1
+        assert gateway.usage["total_tokens"] == completion["usage"]["total_tokens"]
+        assert seen == ["stub-model"]
+    
+    @pytest.mark.asyncio
+    async def test_retries_rate_limits_with_retry_after(self):
+        """Test 429s are retried after Retry-After and other errors are not."""
+        statuses = [429, 503, 200]
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            assert request.headers["authorization"] == "Bearer test-key"
+            status = statuses.pop(0)
+            if status != 200:
+                return httpx.Response(status, headers={"Retry-After": "0"})
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+        
+        gateway = _gateway(handler, max_retries=2)
+        completion = await gateway.chat([{"role": "user", "content": "hi"}])
+        assert completion["content"] == "ok"
+        assert gateway.usage["retries"] == 2
+        
+        gateway = _gateway(lambda request: httpx.Response(400), max_retries=2)
+        with pytest.raises(AIError):
+            await gateway.chat([{"role": "user", "content": "hi"}])
+        assert gateway.usage["retries"] == 0
+        assert gateway.usage["errors"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stream_chat_against_stub(self):
+        """Test streamed completions arrive in pieces and record usage at the end."""
+        gateway = _gateway()
+        seen = []
+        gateway.hooks.append(lambda payload, completion: seen.append((payload["stream"], completion["content"])))
+        
+        parts = [part async for part in gateway.stream_chat([
+            {"role": "system", "content": "You are an expert DeFi advisor. Provide strategies."},
+            {"role": "user", "content": "What should I do with 100 STX?"}
+        ])]
+        await gateway.close()
+        
+        assert len(parts) > 1
+        assert json.loads("".join(parts))["strategy_type"] == "yield_farming"
+        assert gateway.usage["requests"] == 1
+        assert gateway.usage["completion_tokens"] > 0
+        assert seen == [(True, "".join(parts))]
+    
+    @pytest.mark.asyncio
+    async def test_stream_chat_estimates_missing_usage(self):
+        """Test usage is estimated locally when the stream does not report it."""
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n"
+            for piece in ["Hello", " there"]
+        ) + "data: [DONE]\n\n"
+        gateway = _gateway(lambda request: httpx.Response(200, content=body.encode()))
+        
+        parts = [part async for part in gateway.stream_chat([{"role": "user", "content": "hi"}])]
+        
+        assert parts == ["Hello", " there"]
+        assert gateway.usage["completion_tokens"] == 2
+        assert gateway.usage["prompt_tokens"] == 1
+
+
+class TestJSONFieldStream:
+    """Test incremental parsing of streamed JSON answers."""
+    
+    def test_fields_complete_as_chunks_arrive(self):
+        """Test each top-level field is emitted once its value is complete."""
+        parser = JSONFieldStream()
+        assert parser.feed('Sure! ```json\n{"strategy_type": "sta') == []
+        assert parser.feed('king", "risk_score": 0.') == [("strategy_type", "staking")]
+        assert parser.feed('4, "explanation": "Use \\"STX\\" {not} [a] nest') == [("risk_score", 0.4)]
+        assert parser.feed('ed value", "recommendations": [{"protocol": "alex", "x": ["}"]}') == [
+            ("explanation", 'Use "STX" {not} [a] nested value')
+        ]
+        assert parser.feed('], "ok": true}\n```') == [
+            ("recommendations", [{"protocol": "alex", "x": ["}"]}]),
+            ("ok", True)
+        ]
+        assert parser.done
+    
+    def test_matches_json_for_any_chunking(self):
+        """Test the fields equal json.loads of the whole answer however it is split."""
+        answer = json.dumps({"a": None, "b": [1, {"c": "d"}], "e": -1.5e3, "f": "g\\h"}, indent=2)
+        for size in range(1, 9):
+            parser = JSONFieldStream()
+            fields = []
+            for start in range(0, len(answer), size):
+                fields += parser.feed(answer[start:start + size])
+            assert dict(fields) == json.loads(answer)
@@ -9,7 +9,8 @@ from datetime import datetime
 
 from app.models.user import User
 from app.models.wallet import Wallet, NetworkType
-from app.models.recommendation import Recommendation
+from app.models.recommendation import Recommendation, RecommendationAction
+from app.models.blob import Blob
 
 
 @pytest.mark.unit
@@ -311,3 +312,132 @@ class TestRecommendationModel:
         assert recommendation.explanation is None
         assert recommendation.strategy_type == "yield_farming"
         assert recommendation.risk_score == 0.8
+
+    
+    def test_set_actions_from_output(self):
+        """Test actions are extracted and summarized from AI output."""
+        recommendation = Recommendation()
+        recommendation.set_actions_from_output({
+            "recommendations": [
+                {"protocol": " ALEX ", "action": "Add_Liquidity", "amount": 1000},
+                {"protocol": "arkadiko"},
+                "not-an-action",
+                {"action": "missing_protocol"}
+            ]
+        })
+        
+        assert recommendation.action_count == 2
+        assert [a.protocol for a in recommendation.actions] == ["alex", "arkadiko"]
+        assert recommendation.actions[0].action == "add_liquidity"
+        assert recommendation.actions[0].amount == "1000"
+        assert recommendation.actions[1].action is None
+    
+    def test_actions_from_unstructured_output(self):
+        """Test free-text AI output yields no actions."""
+        assert RecommendationAction.from_ai_output({"explanation": "text"}) == []
+        assert RecommendationAction.from_ai_output({"recommendations": "text"}) == []
+
+
+@pytest.mark.unit
+class TestBlobModel:
+    """Test content-addressed Blob model."""
+    
+    def test_hash_ignores_key_order(self):
+        """Test equal payloads map to the same content address."""
+        first = Blob.from_payload({"a": 1, "b": [1, 2, 3]})
+        second = Blob.from_payload({"b": [1, 2, 3], "a": 1})
+        assert first.hash == second.hash
+        assert len(first.hash) == 64
+    
+    def test_large_payload_is_compressed(self):
+        """Test large payloads are compressed and round-trip."""
+        payload = {"pools": [{"pair": "STX/USDA", "tvl": i} for i in range(500)]}
+        blob = Blob.from_payload(payload)
+        assert blob.codec != "none"
+        assert len(blob.data) < blob.size
+        
+        loaded = Blob(hash=blob.hash, codec=blob.codec, size=blob.size, data=blob.data)
+        assert loaded.payload == payload
+    
+    def test_small_payload_is_stored_raw(self):
+        """Test small payloads skip compression."""
+        blob = Blob.from_payload({"test": "data"})
+        assert blob.codec == "none"
+    
+    def test_recommendation_raw_input_uses_blob(self):
+        """Test Recommendation.raw_input is backed by a blob."""
+        recommendation = Recommendation(raw_input={"test": "data"})
+        assert recommendation.raw_input == {"test": "data"}
+        assert recommendation.raw_input_blob.hash == Blob.from_payload({"test": "data"}).hash
+    
+    def test_recommendation_market_data_blob_is_shared(self):
+        """Test rows made from one market snapshot share its blob and only differ in the per-user part."""
+        market_data = {"alex_pools": [{"pair": "STX/USDA", "tvl": i} for i in range(100)]}
+        first = Recommendation(raw_input={"wallet_data": {"wallets": []}, "market_data": market_data})
+        second = Recommendation(raw_input={"wallet_data": {"wallets": [{"address": "SP1"}]}, "market_data": market_data})
+        
+        assert first.market_data_blob.hash == second.market_data_blob.hash
+        assert first.raw_input_blob.hash != second.raw_input_blob.hash
+        assert "market_data" not in first.raw_input_blob.payload
+        assert second.raw_input == {"wallet_data": {"wallets": [{"address": "SP1"}]}, "market_data": market_data}
+
+
+@pytest.mark.unit
+class TestMigrations:
+    """Test the Alembic upgrade of databases created before migrations existed."""
+    
+    @pytest.mark.asyncio
+    async def test_baseline_database_is_upgraded(self, tmp_path):
+        """Test raw_input of original rows is moved into blobs and read back unchanged."""
+        from alembic import command
+        from alembic.config import Config
+        from sqlalchemy import text
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import BACKEND_DIR, _migrate
+        import json
+        import os
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+        raw_input = {"wallet_data": {"wallets": []}, "market_data": {"alex_pools": [{"pair": "STX/USDA"}]}}
+        ai_output = {"recommendations": [{"protocol": "ALEX", "action": "Add_Liquidity", "amount": 100}]}
+        
+        def create_baseline(connection):
+            config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+            config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+            config.attributes["connection"] = connection
+            command.upgrade(config, "0001")
+            connection.exec_driver_sql("DROP TABLE alembic_version")
+        
+        async with engine.begin() as conn:
+            await conn.run_sync(create_baseline)
+            await conn.execute(text("INSERT INTO users (id, email, hashed_password) VALUES ('u1', 'a@b.c', 'x')"))
+            for rec_id in ("r1", "r2"):
+                await conn.execute(
+                    text(
+                        "INSERT INTO recommendations (id, user_id, raw_input, ai_output, strategy_type, risk_score) "
+                        "VALUES (:id, 'u1', :raw_input, :ai_output, 'yield_farming', 0.5)"
+                    ),
+                    {"id": rec_id, "raw_input": json.dumps(raw_input), "ai_output": json.dumps(ai_output)}
+                )
+        
+        async with engine.begin() as conn:
+            await conn.run_sync(_migrate)
+        
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_factory() as session:
+            first = await session.get(Recommendation, "r1")
+            second = await session.get(Recommendation, "r2")
+            assert first.raw_input == raw_input
+            assert first.market_data_hash == second.market_data_hash
+            assert first.action_count == 1
+            protocol = await session.execute(text("SELECT protocol FROM recommendation_actions WHERE recommendation_id = 'r1'"))
+            assert protocol.scalar() == "alex"
+            blob_count = (await session.execute(text("SELECT COUNT(*) FROM blobs"))).scalar()
+            assert blob_count == 2
+            columns = [row[1] for row in (await session.execute(text("PRAGMA table_info(recommendations)"))).all()]
+            assert "raw_input" not in columns
+            assert "primary_protocol" not in columns
+            version = (await session.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+            assert version == "0004"
+        await engine.dispose()
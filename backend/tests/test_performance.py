@@ -13,6 +13,7 @@ import concurrent.futures
 import threading
 
 from tests.mocks import mock_all_external_apis
+from app.core.write_coalescer import CoalescerStopped, WriteCoalescer
 
 
 class TestPerformance:
@@ -423,3 +424,157 @@ class TestPerformance:
             print(f"Cycle {cycle}: Memory increase {memory_increase:.1f}MB")
         
         print("No significant memory leaks detected")
+
+
+class FakeSession:
+    """Minimal async session that records commits"""
+    
+    def __init__(self, log: list, fail_on=None):
+        self.log = log
+        self.fail_on = fail_on
+        self.objects = []
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *args):
+        return False
+    
+    def add_all(self, objects):
+        self.objects.extend(objects)
+    
+    async def commit(self):
+        if self.fail_on is not None and self.fail_on in self.objects:
+            raise ValueError("constraint violation")
+        self.log.append(list(self.objects))
+
+
+class TestWriteCoalescer:
+    """Test group-commit write coalescing"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_submissions_share_commits(self):
+        """Test concurrent inserts are committed in a few shared transactions"""
+        commits = []
+        coalescer = WriteCoalescer(lambda: FakeSession(commits), max_rows=25, max_delay=0.05)
+        await coalescer.start()
+        
+        await asyncio.gather(*[coalescer.submit(i) for i in range(100)])
+        await coalescer.stop()
+        
+        assert sorted(obj for batch in commits for obj in batch) == list(range(100))
+        assert len(commits) <= 8
+        assert all(len(batch) <= 25 for batch in commits)
+    
+    @pytest.mark.asyncio
+    async def test_failed_submission_does_not_fail_others(self):
+        """Test a bad row only fails its own submission"""
+        commits = []
+        coalescer = WriteCoalescer(lambda: FakeSession(commits, fail_on="bad"), max_delay=0.05)
+        await coalescer.start()
+        
+        results = await asyncio.gather(
+            coalescer.submit("good"),
+            coalescer.submit("bad"),
+            coalescer.submit("also-good"),
+            return_exceptions=True
+        )
+        await coalescer.stop()
+        
+        assert results[0] is None
+        assert isinstance(results[1], ValueError)
+        assert results[2] is None
+        assert ["good"] in commits and ["also-good"] in commits
+    
+    @pytest.mark.asyncio
+    async def test_failed_row_does_not_fail_others_in_real_session(self, tmp_path):
+        """Test the per-submission retry inserts good rows, with their blobs, after a shared commit fails"""
+        from sqlalchemy import select
+        from sqlalchemy.exc import IntegrityError
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.blob import Blob
+        from app.models.recommendation import Recommendation
+        from app.models.user import User
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'coalesce.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        
+        def recommendation(recommendation_id, market):
+            row = Recommendation(
+                id=recommendation_id, user_id="user-1", ai_output={"recommendations": [{"protocol": "alex"}]},
+                strategy_type="staking", risk_score=0.3,
+                raw_input={"wallet_data": {"id": recommendation_id}, "market_data": market}
+            )
+            row.set_actions_from_output(row.ai_output)
+            return row
+        
+        async with session_factory() as session:
+            session.add(User(id="user-1", email="coalesce@example.com", hashed_password="hashed"))
+            session.add(recommendation("existing", {"pools": "shared"}))
+            await session.commit()
+        
+        coalescer = WriteCoalescer(session_factory, max_delay=0.05)
+        await coalescer.start()
+        good = recommendation("good", {"pools": "shared"})
+        results = await asyncio.gather(
+            coalescer.submit(good),
+            coalescer.submit(recommendation("existing", {"pools": "other"})),  # Duplicate primary key
+            return_exceptions=True
+        )
+        await coalescer.stop()
+        
+        assert results[0] is None
+        assert isinstance(results[1], IntegrityError)
+        async with session_factory() as session:
+            rows = {row.id: row for row in (await session.execute(select(Recommendation))).unique().scalars().all()}
+            blobs = (await session.execute(select(Blob.hash))).scalars().all()
+            assert set(rows) == {"existing", "good"}
+            assert rows["good"].raw_input == {"wallet_data": {"id": "good"}, "market_data": {"pools": "shared"}}
+            assert rows["good"].market_data_hash == rows["existing"].market_data_hash
+            assert len(blobs) == 3
+        assert good.action_count == 1
+        
+        await engine.dispose()
+    
+    @pytest.mark.asyncio
+    async def test_flush_error_fails_submissions_and_keeps_flushing(self):
+        """Test an error outside the commit fails its batch instead of leaving callers waiting"""
+        commits = []
+        coalescer = WriteCoalescer(lambda: FakeSession(commits), max_delay=0.01)
+        await coalescer.start()
+        
+        with patch("app.core.write_coalescer._snapshot", side_effect=RuntimeError("snapshot failed")):
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(coalescer.submit("first"), 1)
+        await asyncio.wait_for(coalescer.submit("second"), 1)
+        await coalescer.stop()
+        
+        assert commits == [["second"]]
+    
+    @pytest.mark.asyncio
+    async def test_persist_commits_directly_when_flusher_has_stopped(self):
+        """Test persist falls back to its own session once the flusher task is gone"""
+        from app.core import write_coalescer as module
+        
+        commits = []
+        coalescer = WriteCoalescer(lambda: FakeSession(commits), max_delay=1)
+        await coalescer.start()
+        db = AsyncMock()
+        db.add_all = lambda objects: None
+        
+        with patch.object(module, "write_coalescer", coalescer):
+            # Queued while the flusher runs, which then dies before committing it
+            pending = asyncio.create_task(module.persist(db, "queued"))
+            await asyncio.sleep(0.01)
+            coalescer._task.cancel()
+            await asyncio.wait_for(pending, 1)
+            await module.persist(db, "late")
+        
+        with pytest.raises(CoalescerStopped):
+            await coalescer.submit("rejected")
+        assert commits == []
+        assert [call.args for call in db.refresh.await_args_list] == [("queued",), ("late",)]
@@ -0,0 +1,88 @@
+"""
+Token-budgeted prompt assembly tests
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.exceptions import ValidationError
+from app.services.education_service import EducationService
+from app.services.prompt_assembler import PromptAssembler, estimate_tokens, truncate_to_tokens
+
+
+@pytest.mark.unit
+class TestPromptAssembler:
+    """Test token estimation, section budgeting and completion sizing."""
+    
+    def test_estimate_tokens(self):
+        """Test estimates track word, digit and symbol density."""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("hello world") == 2
+        assert estimate_tokens("1234567") == 3
+        assert estimate_tokens("alex|STX/ALEX|1.23M") == 10
+        text = "Liquidity provision is the act of depositing tokens into a pool. " * 20
+        assert 200 <= estimate_tokens(text) <= 320
+    
+    def test_truncate_keeps_leading_lines(self):
+        """Test truncation keeps whole lines from the top and notes the cut."""
+        text = "\n".join(f"row {i}|pool {i}|value {i}" for i in range(100))
+        cut = truncate_to_tokens(text, 60)
+        assert cut.startswith("row 0|pool 0|value 0\nrow 1|")
+        assert cut.endswith("more lines omitted)")
+        assert estimate_tokens(cut) <= 60
+        assert truncate_to_tokens("short", 60) == "short"
+    
+    def test_optional_sections_fit_budget_by_priority(self):
+        """Test required sections are kept whole and optional ones are cut in priority order."""
+        table = "\n".join(f"alex|T{i}/STX|1.2M|12.3|4.5K|0.003" for i in range(500))
+        prompt = (
+            PromptAssembler("You are a test.", context_window=1000, max_completion_tokens=400, min_completion_tokens=200, margin=0)
+            .add("profile", "User Profile: medium risk", required=True)
+            .add("market", table, priority=1)
+            .add("wallets", "stacks|SP1|STX|1M", priority=0)
+            .add("format", "Reply in JSON.", required=True)
+            .build()
+        )
+        
+        assert prompt.truncated == ["market"]
+        assert prompt.dropped == []
+        assert prompt.user.startswith("User Profile: medium risk\n\nalex|T0/STX|")
+        assert "stacks|SP1|STX|1M" in prompt.user
+        assert prompt.user.endswith("Reply in JSON.")
+        assert prompt.prompt_tokens + prompt.max_tokens <= 1000
+        assert 200 <= prompt.max_tokens <= 400
+    
+    def test_small_prompts_get_full_completion_budget(self):
+        """Test max_tokens is capped at the configured maximum when the window allows."""
+        prompt = PromptAssembler("System.", context_window=8192, max_completion_tokens=2000).add("q", "Question?").build()
+        assert prompt.max_tokens == 2000
+        assert prompt.messages[0] == {"role": "system", "content": "System."}
+    
+    def test_sections_are_dropped_when_budget_is_spent(self):
+        """Test an optional section is dropped rather than cut to a stub."""
+        prompt = (
+            PromptAssembler("System.", context_window=300, max_completion_tokens=200, min_completion_tokens=200, margin=0)
+            .add("format", "word " * 70, required=True)
+            .add("context", "extra " * 100)
+            .build()
+        )
+        assert prompt.dropped == ["context"]
+        assert "extra" not in prompt.user
+    
+    def test_required_sections_must_leave_minimum_completion(self):
+        """Test oversized required sections are rejected instead of squeezing the completion."""
+        assembler = (
+            PromptAssembler("System.", context_window=300, max_completion_tokens=200, min_completion_tokens=200, margin=0)
+            .add("format", "word " * 150, required=True)
+        )
+        with pytest.raises(ValidationError):
+            assembler.build()
+    
+    def test_education_prompt_cuts_long_context(self):
+        """Test a long user context is cut and max_tokens is sized to what is left."""
+        education_service = EducationService(MagicMock())
+        prompt = education_service._assemble_education_prompt("staking", "beginner", "background " * 20000)
+        
+        assert prompt.truncated == ["context"]
+        assert "key_concepts" in prompt.user
+        assert prompt.prompt_tokens + prompt.max_tokens <= 8192
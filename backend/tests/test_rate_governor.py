@@ -0,0 +1,79 @@
+"""
+Outbound rate governor tests
+"""
+
+import pytest
+import asyncio
+import time
+
+from app.core import deadline
+from app.core.exceptions import DeadlineExceededError
+from app.core.rate_governor import Priority, RateGovernor, set_priority, current_priority
+
+
+class TestRateGovernor:
+    """Test token buckets, priority lanes and upstream quota signals."""
+    
+    @pytest.mark.asyncio
+    async def test_queued_callers_are_served_by_lane(self):
+        """Test interactive waiters are released before earlier background ones."""
+        governor = RateGovernor("test", rate_per_minute=600, burst=1)
+        await governor.acquire(Priority.NORMAL)
+        
+        order = []
+        
+        async def call(priority, label):
+            await governor.acquire(priority)
+            order.append(label)
+        
+        tasks = [asyncio.create_task(call(Priority.BACKGROUND, "background"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call(Priority.INTERACTIVE, "interactive")))
+        await asyncio.wait_for(asyncio.gather(*tasks), 2)
+        
+        assert order == ["interactive", "background"]
+        stats = governor.stats()
+        assert stats["queued"] == 0
+        assert stats["lanes"]["background"]["queued"] == 1
+        assert stats["lanes"]["background"]["max_wait_seconds"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_response_pauses_bucket(self):
+        """Test a 429 with Retry-After holds callers until the quota resets."""
+        governor = RateGovernor("test")
+        governor.update({"retry-after": "0.2"}, 429)
+        assert governor.stats()["paused_seconds"] > 0
+        
+        started = time.monotonic()
+        await asyncio.wait_for(governor.acquire(), 2)
+        assert time.monotonic() - started >= 0.15
+    
+    @pytest.mark.asyncio
+    async def test_exhausted_quota_headers_pause_bucket(self):
+        """Test remaining/reset headers pause the bucket before a 429 arrives."""
+        governor = RateGovernor("test", rate_per_minute=6000)
+        governor.update({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "150ms"}, 200)
+        assert 0 < governor.paused_until - time.monotonic() <= 0.15
+    
+    @pytest.mark.asyncio
+    async def test_wait_is_bounded_by_request_deadline(self):
+        """Test a queued caller gives up when the request budget runs out."""
+        governor = RateGovernor("test")
+        governor.update({"retry-after": "5"}, 429)
+        
+        async def call():
+            deadline.narrow(0.05)
+            await governor.acquire()
+        
+        with pytest.raises(DeadlineExceededError):
+            await asyncio.create_task(call())
+    
+    @pytest.mark.asyncio
+    async def test_priority_is_scoped_to_task(self):
+        """Test a lane set inside a task does not leak to its caller."""
+        async def background():
+            set_priority(Priority.BACKGROUND)
+            return current_priority()
+        
+        assert await asyncio.create_task(background()) == Priority.BACKGROUND
+        assert current_priority() == Priority.NORMAL
@@ -8,10 +8,19 @@ from httpx import AsyncClient
 from unittest.mock import patch, AsyncMock, MagicMock
 import uuid
 import json
+import httpx
+from datetime import datetime
 
 from app.models.recommendation import Recommendation
 from app.models.wallet import Wallet
 from app.services.strategy_service import StrategyService
+from app.core.exceptions import ValidationError
+from app.core.pagination import encode_cursor, decode_cursor
+from app.services.archive_service import ArchiveService
+from app.services.market_data import normalize_market_data, normalize_pools
+from app.services.market_snapshot import MarketSnapshot, snapshot_to_rows
+from app.services.strategy_features import held_symbols, select_pools
+from app.core.config import settings
 from tests.mocks import mock_all_external_apis
 
 
@@ -140,6 +149,59 @@ class TestStrategyEndpoints:
         assert response.status_code == 403
 
 
+@pytest.mark.strategy
+class TestStrategyStreaming:
+    """Test the server-sent events recommendation endpoint."""
+    
+    @patch('app.services.strategy_service.StrategyService._collect_user_data', new_callable=AsyncMock, return_value={"wallets": [], "total_wallets": 0})
+    @patch('app.services.strategy_service.StrategyService._get_market_data', new_callable=AsyncMock, return_value={"alex_pools": []})
+    @patch('app.services.strategy_service.StrategyService._latest_recommendation', new_callable=AsyncMock, return_value=None)
+    @patch('app.services.auth_service.AuthService.get_current_user', new_callable=AsyncMock)
+    def test_stream_recommendation_emits_fields_then_persists(self, mock_user, mock_latest, mock_market_data, mock_user_data):
+        """Test tokens and completed fields are streamed before the persisted recommendation."""
+        from main import app
+        from app.core.database import get_db
+        from app.core.rate_governor import RateGovernor
+        from app.services.llm_gateway import LLMGateway
+        from llm_stub import app as stub_app
+        
+        async def override_get_db():
+            yield MagicMock()
+        
+        async def persist(db, recommendation):
+            recommendation.created_at = datetime.utcnow()
+        
+        mock_user.return_value = MagicMock(id=str(uuid.uuid4()))
+        gateway = LLMGateway("http://stub/v1", "key", "stub", transport=httpx.ASGITransport(app=stub_app), governor=RateGovernor("test"))
+        app.dependency_overrides[get_db] = override_get_db
+        try:
+            with patch('app.services.strategy_service.llm_gateway', gateway), \
+                    patch('app.services.strategy_service.persist', side_effect=persist) as mock_persist:
+                response = TestClient(app).post(
+                    "/api/v1/strategy/recommend/stream",
+                    json={"risk_tolerance": "low"},
+                    headers={"Authorization": "Bearer token"}
+                )
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+        names = [event for event, _ in events]
+        assert names.count("token") > 1
+        fields = [data["name"] for event, data in events if event == "field"]
+        assert fields[:2] == ["strategy_type", "risk_score"]
+        assert names.index("field") < len(names) - 2
+        assert names[-1] == "done"
+        assert events[-1][1]["strategy_type"] == "yield_farming"
+        assert events[-1][1]["ai_output"]["expected_apy"] == 8.5
+        assert mock_persist.call_count == 1
+
+
 @pytest.mark.strategy
 class TestStrategyService:
     """Test strategy service."""
@@ -175,6 +237,115 @@ class TestStrategyService:
         assert recommendation.expected_apy == 12.5
         assert recommendation.status == "pending"
     
+    @pytest.mark.asyncio
+    @patch('app.services.strategy_service.StrategyService._call_groq_api')
+    @patch('app.services.strategy_service.StrategyService._collect_user_data')
+    @patch('app.services.strategy_service.StrategyService._get_market_data')
+    @patch('app.services.strategy_service.StrategyService._latest_recommendation', new_callable=AsyncMock, return_value=None)
+    @patch('app.services.strategy_service.persist', new_callable=AsyncMock)
+    async def test_generate_recommendation_reuses_cached_output(self, mock_persist, mock_latest, mock_market_data, mock_user_data, mock_groq):
+        """Test near-identical inputs share one LLM call until the market changes."""
+        def wallets(stx_balance):
+            return {
+                "wallets": [{"address": "SP1", "network": "stacks", "balances": {"stx": {"balance": stx_balance}, "tokens": []}}],
+                "total_wallets": 1
+            }
+        
+        mock_market_data.return_value = {"alex_pools": [{"pool_id": "a", "apy": 10.0}]}
+        mock_groq.return_value = {"strategy_type": "staking", "risk_score": 0.3, "recommendations": []}
+        strategy_service = StrategyService(MagicMock())
+        user_id = str(uuid.uuid4())
+        
+        mock_user_data.return_value = wallets("1000000")
+        await strategy_service.generate_recommendation(user_id, risk_tolerance="Medium", investment_amount=1000.0)
+        mock_user_data.return_value = wallets("1010000")
+        await strategy_service.generate_recommendation(user_id, risk_tolerance="medium ", investment_amount=1005.0)
+        assert mock_groq.await_count == 1
+        
+        await strategy_service.generate_recommendation(user_id, risk_tolerance="high", investment_amount=1000.0)
+        assert mock_groq.await_count == 2
+        
+        mock_market_data.return_value = {"alex_pools": [{"pool_id": "a", "apy": 12.0}]}
+        await strategy_service.generate_recommendation(user_id, risk_tolerance="high", investment_amount=1000.0)
+        assert mock_groq.await_count == 3
+    
+    @pytest.mark.asyncio
+    @patch('app.services.strategy_service.StrategyService._call_groq_api')
+    @patch('app.services.strategy_service.StrategyService._collect_user_data', new_callable=AsyncMock, return_value={"wallets": [], "total_wallets": 0})
+    @patch('app.services.strategy_service.StrategyService._get_market_data', new_callable=AsyncMock, return_value={"alex_pools": []})
+    @patch('app.services.strategy_service.StrategyService._latest_recommendation', new_callable=AsyncMock, return_value=None)
+    @patch('app.services.strategy_service.persist', new_callable=AsyncMock)
+    async def test_fallback_output_is_not_cached(self, mock_persist, mock_latest, mock_market_data, mock_user_data, mock_groq):
+        """Test answers that were not JSON are never cached, blocking or streamed."""
+        strategy_service = StrategyService(MagicMock())
+        mock_groq.return_value = strategy_service._parse_ai_response("Hold your STX.")
+        user_id = str(uuid.uuid4())
+        
+        first = await strategy_service.generate_recommendation(user_id)
+        await strategy_service.generate_recommendation(user_id)
+        assert first.strategy_type == "general_advice"
+        assert mock_groq.await_count == 2
+        
+        streams = 0
+        
+        async def stream_chat(messages, **kwargs):
+            nonlocal streams
+            streams += 1
+            yield "Hold your STX."
+        
+        with patch('app.services.strategy_service.llm_gateway') as gateway:
+            gateway.stream_chat = stream_chat
+            for _ in range(2):
+                events = [event async for event in strategy_service.stream_recommendation(user_id)]
+                assert events[-1][1].strategy_type == "general_advice"
+        assert streams == 2
+    
+    @pytest.mark.asyncio
+    @patch('app.services.strategy_service.StrategyService._call_groq_api')
+    @patch('app.services.strategy_service.StrategyService._collect_user_data')
+    @patch('app.services.strategy_service.StrategyService._get_market_data')
+    @patch('app.services.strategy_service.StrategyService._latest_recommendation', new_callable=AsyncMock, return_value=None)
+    @patch('app.services.strategy_service.persist', new_callable=AsyncMock)
+    async def test_generate_recommendation_skips_unchanged_inputs(self, mock_persist, mock_latest, mock_market_data, mock_user_data, mock_groq):
+        """Test the last recommendation is reused until holdings or the market move past thresholds."""
+        def wallets(stx_balance):
+            return {
+                "wallets": [{"address": "SP1", "network": "stacks", "balances": {"stx": {"balance": stx_balance}, "tokens": []}}],
+                "total_wallets": 1
+            }
+        
+        def market(apy):
+            return {"alex_pools": [{"pair": "STX/ALEX", "apy": apy, "tvl": 1000000}]}
+        
+        mock_groq.return_value = {"strategy_type": "staking", "risk_score": 0.3, "recommendations": []}
+        strategy_service = StrategyService(MagicMock())
+        user_id = str(uuid.uuid4())
+        
+        mock_user_data.return_value = wallets("1000000")
+        mock_market_data.return_value = market(10.0)
+        first = await strategy_service.generate_recommendation(user_id)
+        first.created_at = datetime.utcnow()
+        assert first.input_fingerprint["holdings"] == {"stx": 1000000.0}
+        assert not first.reused
+        mock_latest.return_value = first
+        
+        mock_user_data.return_value = wallets("1020000")
+        mock_market_data.return_value = market(10.5)
+        again = await strategy_service.generate_recommendation(user_id)
+        assert again is first
+        assert again.reused
+        assert mock_persist.await_count == 1
+        
+        mock_market_data.return_value = market(12.0)
+        moved = await strategy_service.generate_recommendation(user_id)
+        assert moved is not first
+        assert not moved.reused
+        assert mock_persist.await_count == 2
+        
+        first.status = "executed"
+        mock_market_data.return_value = market(10.0)
+        assert (await strategy_service.generate_recommendation(user_id)) is not first
+    
     @pytest.mark.asyncio
     async def test_get_user_recommendations(self, db_session, test_user, test_recommendation: Recommendation):
         """Test getting user recommendations."""
@@ -335,3 +506,666 @@ class TestStrategyService:
         assert "1000" in prompt
         assert "long" in prompt
         assert "JSON response" in prompt
+
+
+@pytest.mark.strategy
+class TestRecommendationPagination:
+    """Test recommendation history cursors."""
+    
+    def test_cursor_round_trip(self):
+        """Test cursors decode to the encoded keyset values."""
+        cursor = encode_cursor("2024-01-01T10:00:00.123456", "abc")
+        assert decode_cursor(cursor, 2) == ["2024-01-01T10:00:00.123456", "abc"]
+    
+    def test_invalid_cursor(self):
+        """Test malformed cursors are rejected."""
+        with pytest.raises(ValidationError):
+            decode_cursor("not-a-cursor", 2)
+        with pytest.raises(ValidationError):
+            decode_cursor(encode_cursor("only-one"), 2)
+    
+    @pytest.mark.asyncio
+    async def test_pages_over_orm_and_server_default_timestamps(self, tmp_path):
+        """Test rows stamped by the ORM and by the server default are each paged once, in index order."""
+        from sqlalchemy import select, text
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.user import User
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pages.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        
+        async with session_factory() as session:
+            session.add(User(id="user-1", email="pages@example.com", hashed_password="hashed"))
+            for i, created_at in enumerate([
+                datetime(2024, 1, 1, 10, 0, 0, 500000),
+                datetime(2024, 1, 1, 10, 0, 1),
+                datetime(2024, 1, 1, 10, 0, 2, 250000),
+            ]):
+                session.add(Recommendation(
+                    id=f"orm-{i}", user_id="user-1", ai_output={}, strategy_type="staking",
+                    risk_score=0.3, created_at=created_at
+                ))
+            await session.commit()
+            # Rows stamped by the server default, as raw inserts are
+            for i in range(4):
+                await session.execute(text(
+                    "INSERT INTO recommendations (id, user_id, ai_output, strategy_type, risk_score, action_count, status) "
+                    "VALUES (:id, 'user-1', '{}', 'staking', 0.3, 0, 'pending')"
+                ), {"id": f"raw-{i}"})
+            await session.commit()
+            
+            stored = (await session.execute(text("SELECT id, created_at FROM recommendations"))).all()
+            assert {len(created_at) for _, created_at in stored} == {26}
+            expected = [row_id for row_id, _ in sorted(stored, key=lambda row: (row[1], row[0]), reverse=True)]
+            
+            strategy_service = StrategyService(session)
+            seen, cursor = [], None
+            for _ in range(10):
+                page, cursor = await strategy_service.get_recommendation_page("user-1", limit=2, cursor=cursor)
+                seen.extend(recommendation.id for recommendation in page)
+                if cursor is None:
+                    break
+            
+            # The cursor comparison and ordering run on the bare column, so the index serves them
+            _, cursor = await strategy_service.get_recommendation_page("user-1", limit=2)
+            created_at, _ = decode_cursor(cursor, 2)
+            query = (
+                select(Recommendation.id)
+                .where(Recommendation.user_id == "user-1")
+                .where(Recommendation.created_at < datetime.fromisoformat(created_at))
+                .order_by(Recommendation.created_at.desc(), Recommendation.id.desc())
+                .limit(3)
+            )
+            compiled = query.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+            plan = " ".join(
+                str(row[-1]) for row in (await session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))).all()
+            )
+        
+        assert seen == expected
+        assert "ix_recommendations_user_created" in plan
+        assert "TEMP B-TREE" not in plan
+        
+        await engine.dispose()
+    
+    def test_get_user_recommendations_invalid_limit(self, client: TestClient):
+        """Test history limit is bounded."""
+        response = client.get(
+            "/api/v1/strategy/recommendations?limit=1000",
+            headers={"Authorization": "Bearer token"}
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.strategy
+class TestRecommendationArchive:
+    """Test recommendation archival and rehydration."""
+    
+    @pytest.mark.asyncio
+    async def test_archive_and_rehydrate(self, tmp_path):
+        """Test old recommendations become stubs that can be rehydrated."""
+        from datetime import datetime, timedelta
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.user import User
+        
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        
+        async with session_factory() as session:
+            user = User(email="archive@example.com", hashed_password="hashed")
+            session.add(user)
+            await session.commit()
+            
+            old = Recommendation(
+                user_id=user.id,
+                raw_input={"market": "snapshot"},
+                ai_output={"strategy_type": "staking"},
+                strategy_type="staking",
+                risk_score=0.3,
+                explanation="Old explanation",
+                created_at=datetime.utcnow() - timedelta(days=400)
+            )
+            recent = Recommendation(
+                user_id=user.id,
+                raw_input={"market": "snapshot"},
+                ai_output={"strategy_type": "staking"},
+                strategy_type="staking",
+                risk_score=0.3
+            )
+            session.add_all([old, recent])
+            await session.commit()
+            
+            archive_service = ArchiveService(session, str(tmp_path))
+            assert await archive_service.archive_older_than(180) == 1
+            assert await archive_service.archive_older_than(180) == 0
+            
+            assert old.archived_at is not None
+            assert old.raw_input is None
+            assert old.ai_output == {}
+            assert old.strategy_type == "staking"
+            assert recent.archived_at is None
+            assert recent.raw_input == {"market": "snapshot"}
+            
+            payload = await archive_service.load_archived(old)
+            assert payload["raw_input"] == {"market": "snapshot"}
+            assert payload["ai_output"] == {"strategy_type": "staking"}
+            assert payload["explanation"] == "Old explanation"
+        
+        await engine.dispose()
+
+
+@pytest.mark.strategy
+class TestRecommendationJobs:
+    """Test the queued recommendation jobs and their worker pool."""
+    
+    async def _setup(self, tmp_path):
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.user import User
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_factory() as session:
+            user = User(email="jobs@example.com", hashed_password="hashed")
+            session.add(user)
+            await session.commit()
+        return engine, session_factory, user.id
+    
+    async def _wait_until_finished(self, session_factory, job_ids, timeout=5.0):
+        import asyncio
+        from app.models.job import RecommendationJob
+        
+        for _ in range(int(timeout / 0.02)):
+            async with session_factory() as session:
+                jobs = [await session.get(RecommendationJob, job_id) for job_id in job_ids]
+            if all(job.finished for job in jobs):
+                return {job.id: job for job in jobs}
+            await asyncio.sleep(0.02)
+        raise AssertionError("Jobs did not finish")
+    
+    @pytest.mark.asyncio
+    async def test_worker_pool_runs_retries_and_fails_jobs(self, tmp_path):
+        """Test jobs run at bounded concurrency, transient failures retry and bad input fails."""
+        import asyncio
+        from app.core.exceptions import AIError
+        from app.models.job import JOB_SUCCEEDED, JOB_FAILED
+        from app.services.job_service import JobService, RecommendationWorkerPool
+        
+        engine, session_factory, user_id = await self._setup(tmp_path)
+        async with session_factory() as session:
+            job_service = JobService(session)
+            ok = [(await job_service.enqueue(user_id, risk_tolerance="low")).id for _ in range(3)]
+            flaky = (await job_service.enqueue(user_id, risk_tolerance="flaky")).id
+            invalid = (await job_service.enqueue(user_id, risk_tolerance="invalid")).id
+        
+        running, peak, calls = 0, 0, {}
+        
+        async def generate(self, user_id, risk_tolerance="medium", **kwargs):
+            nonlocal running, peak
+            calls[risk_tolerance] = calls.get(risk_tolerance, 0) + 1
+            running += 1
+            peak = max(peak, running)
+            try:
+                await asyncio.sleep(0.05)
+                if risk_tolerance == "invalid":
+                    raise ValidationError("Invalid risk tolerance")
+                if risk_tolerance == "flaky" and calls["flaky"] == 1:
+                    raise AIError("Model unavailable")
+                return MagicMock(id=str(uuid.uuid4()))
+            finally:
+                running -= 1
+        
+        pool = RecommendationWorkerPool(session_factory, workers=2, poll_interval=0.05, max_attempts=2)
+        with patch('app.services.job_service.StrategyService.generate_recommendation', generate):
+            await pool.start()
+            try:
+                jobs = await self._wait_until_finished(session_factory, ok + [flaky, invalid])
+            finally:
+                await pool.stop()
+        
+        assert peak == 2
+        for job_id in ok:
+            assert jobs[job_id].status == JOB_SUCCEEDED
+            assert jobs[job_id].recommendation_id is not None
+            assert jobs[job_id].attempts == 1
+        assert jobs[flaky].status == JOB_SUCCEEDED
+        assert jobs[flaky].attempts == 2
+        assert jobs[invalid].status == JOB_FAILED
+        assert jobs[invalid].attempts == 1
+        assert jobs[invalid].error == "Invalid risk tolerance"
+        assert pool.stats == {"claimed": 6, "succeeded": 4, "failed": 1, "retried": 1}
+        
+        # Jobs are only visible to the user who queued them
+        async with session_factory() as session:
+            assert (await JobService(session).get_job(invalid, user_id=user_id)).id == invalid
+            assert await JobService(session).get_job(invalid, user_id=str(uuid.uuid4())) is None
+        
+        await engine.dispose()
+    
+    @pytest.mark.asyncio
+    async def test_stale_jobs_requeued_and_stop_returns_running_jobs(self, tmp_path):
+        """Test a restart picks up jobs a dead worker left running, and shutdown requeues in-flight jobs."""
+        import asyncio
+        from datetime import timedelta
+        from app.models.job import RecommendationJob, JOB_QUEUED, JOB_RUNNING, JOB_FAILED
+        from app.services.job_service import RecommendationWorkerPool
+        
+        engine, session_factory, user_id = await self._setup(tmp_path)
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        async with session_factory() as session:
+            stale = RecommendationJob(user_id=user_id, params={}, status=JOB_RUNNING, attempts=1, started_at=long_ago)
+            exhausted = RecommendationJob(user_id=user_id, params={}, status=JOB_RUNNING, attempts=2, started_at=long_ago)
+            session.add_all([stale, exhausted])
+            await session.commit()
+        
+        started = asyncio.Event()
+        
+        async def generate(self, user_id, **kwargs):
+            started.set()
+            await asyncio.Event().wait()
+        
+        pool = RecommendationWorkerPool(session_factory, workers=1, poll_interval=0.05, max_attempts=2, stale_after=60)
+        with patch('app.services.job_service.StrategyService.generate_recommendation', generate):
+            await pool.start()
+            await asyncio.wait_for(started.wait(), 5)
+            async with session_factory() as session:
+                assert (await session.get(RecommendationJob, stale.id)).status == JOB_RUNNING
+                assert (await session.get(RecommendationJob, stale.id)).attempts == 2
+            await pool.stop()
+        
+        async with session_factory() as session:
+            requeued = await session.get(RecommendationJob, stale.id)
+            failed = await session.get(RecommendationJob, exhausted.id)
+        assert requeued.status == JOB_QUEUED
+        assert requeued.attempts == 1
+        assert failed.status == JOB_FAILED
+        assert failed.finished_at is not None
+        
+        await engine.dispose()
+    
+    @patch('app.services.job_service.JobService.enqueue', new_callable=AsyncMock)
+    @patch('app.services.auth_service.AuthService.get_current_user', new_callable=AsyncMock)
+    def test_queue_recommendation_endpoint(self, mock_user, mock_enqueue):
+        """Test queueing a recommendation returns 202 with the queued job."""
+        from main import app
+        from app.core.database import get_db
+        from app.models.job import RecommendationJob, JOB_QUEUED
+        
+        async def override_get_db():
+            yield MagicMock()
+        
+        mock_user.return_value = MagicMock(id="user-1")
+        mock_enqueue.return_value = RecommendationJob(
+            id="job-1", user_id="user-1", params={}, status=JOB_QUEUED, attempts=0, created_at=datetime.utcnow()
+        )
+        app.dependency_overrides[get_db] = override_get_db
+        try:
+            response = TestClient(app).post(
+                "/api/v1/strategy/recommend/jobs",
+                json={"risk_tolerance": "high", "investment_amount": 500},
+                headers={"Authorization": "Bearer token"}
+            )
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 202
+        data = response.json()
+        assert data["id"] == "job-1"
+        assert data["status"] == "queued"
+        assert data["recommendation"] is None
+        assert mock_enqueue.call_args.args == ("user-1",)
+        assert mock_enqueue.call_args.kwargs["risk_tolerance"] == "high"
+        assert mock_enqueue.call_args.kwargs["investment_amount"] == 500
+
+
+@pytest.mark.strategy
+class TestBatchRecommendations:
+    """Test nightly batch generation with checkpoint and resume."""
+    
+    @pytest.mark.asyncio
+    async def test_batch_checkpoints_and_resumes(self, tmp_path):
+        """Test a failed run resumes after its last checkpoint with the same market data."""
+        from sqlalchemy import select
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.job import RecommendationBatchRun, JOB_FAILED, JOB_SUCCEEDED
+        from app.models.user import User
+        from app.models.wallet import NetworkType
+        from app.services.batch_service import BatchRecommendationService, batch_report
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'batch.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        
+        async with session_factory() as session:
+            users = [User(id=f"user-{i}", email=f"batch{i}@example.com", hashed_password="hashed") for i in range(5)]
+            users[4].is_active = False
+            session.add_all(users)
+            session.add(Wallet(user_id="user-0", address="SP000", network=NetworkType.STACKS))
+            session.add(Wallet(user_id="user-1", address="SP001", network=NetworkType.STACKS))
+            await session.commit()
+        
+        async def balances(self, wallet):
+            if wallet.address == "SP001":
+                raise Exception("Upstream down")
+            return {"STX": {"balance": 1_000_000}}
+        
+        async def chat(messages, **kwargs):
+            if "Risk Tolerance: medium" not in messages[-1]["content"]:
+                raise Exception("Unexpected prompt")
+            return {
+                "content": json.dumps({"strategy_type": "staking", "risk_score": 0.2, "recommendations": []}),
+                "usage": {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200}
+            }
+        
+        llm = MagicMock()
+        llm.chat = AsyncMock(side_effect=chat)
+        original_process = BatchRecommendationService._process_chunk
+        chunks = 0
+        
+        async def crash_on_second_chunk(self, user_ids, market_data):
+            nonlocal chunks
+            chunks += 1
+            rows = await original_process(self, user_ids, market_data)
+            if chunks == 2:
+                raise RuntimeError("Worker killed")
+            return rows
+        
+        with patch.object(settings, "BATCH_CHUNK_SIZE", 2), \
+                patch.object(settings, "STRATEGY_CACHE_TTL", 0), \
+                patch('app.services.strategy_service.StrategyService._get_market_data', new_callable=AsyncMock, return_value={"alex_pools": []}) as mock_market, \
+                patch('app.services.wallet_service.WalletService.get_wallet_balances', balances), \
+                patch('app.services.batch_service.llm_gateway', llm):
+            async with session_factory() as session:
+                with patch.object(BatchRecommendationService, "_process_chunk", crash_on_second_chunk):
+                    with pytest.raises(RuntimeError):
+                        await BatchRecommendationService(session, session_factory).run("2026-01-01")
+                run = (await session.execute(select(RecommendationBatchRun))).scalar_one()
+                assert run.status == JOB_FAILED
+                assert run.cursor == "user-1"
+                assert run.stats["users"] == 2
+            
+            async with session_factory() as session:
+                run = await BatchRecommendationService(session, session_factory).run("2026-01-01")
+                assert await BatchRecommendationService(session, session_factory).run("2026-01-01") is None
+        
+        assert run.status == JOB_SUCCEEDED
+        assert mock_market.call_count == 1
+        report = batch_report(run.stats)
+        assert report["users"] == 4
+        assert report["generated"] == 3
+        assert report["failed"] == 1  # user-1's only wallet could not be read
+        assert report["balance_errors"] == 1
+        assert [error["user_id"] for error in report["errors"]] == ["user-1"]
+        assert report["llm_calls"] == 3
+        assert report["prompt_tokens"] == 3000
+        assert llm.chat.call_count == 5  # The lost chunk's calls are redone
+        assert report["cost_usd"] == pytest.approx((3000 * 0.05 + 600 * 0.08) / 1_000_000)
+        
+        async with session_factory() as session:
+            rows = (await session.execute(select(Recommendation))).unique().scalars().all()
+        assert sorted(row.user_id for row in rows) == ["user-0", "user-2", "user-3"]
+        by_user = {row.user_id: row for row in rows}
+        assert by_user["user-0"].raw_input["wallet_data"]["wallets"][0]["balances"] == {"STX": {"balance": 1_000_000}}
+        assert by_user["user-0"].strategy_type == "staking"
+        
+        await engine.dispose()
+    
+    @pytest.mark.asyncio
+    async def test_failed_run_is_retried_with_backoff(self, tmp_path):
+        """Test a failed run is resumed after a growing delay until it succeeds."""
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.services.batch_service import BatchRecommendationService, run_until_finished
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'retry.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        
+        attempts = []
+        original_next_users = BatchRecommendationService._next_users
+        
+        async def flaky_next_users(self, cursor):
+            attempts.append(cursor)
+            if len(attempts) < 3:
+                raise RuntimeError("Database busy")
+            return await original_next_users(self, cursor)
+        
+        sleeps = []
+        
+        async def sleep(seconds):
+            sleeps.append(seconds)
+        
+        with patch.object(settings, "BATCH_RETRY_SECONDS", 10), \
+                patch.object(settings, "BATCH_RETRY_MAX_SECONDS", 15), \
+                patch('app.services.strategy_service.StrategyService._get_market_data', new_callable=AsyncMock, return_value={"alex_pools": []}), \
+                patch.object(BatchRecommendationService, "_next_users", flaky_next_users), \
+                patch('app.services.batch_service.asyncio.sleep', sleep):
+            await run_until_finished("2026-01-02", session_factory=session_factory)
+            # Nothing to resume at startup when no run exists
+            await run_until_finished("2026-01-03", create=False, session_factory=session_factory)
+        
+        assert sleeps == [10, 15]
+        async with session_factory() as session:
+            assert not await BatchRecommendationService(session).unfinished("2026-01-02")
+            assert not await BatchRecommendationService(session).unfinished("2026-01-03")
+        
+        await engine.dispose()
+    
+    @pytest.mark.asyncio
+    async def test_heartbeat_and_conditional_checkpoint(self, tmp_path):
+        """Test a long chunk keeps its run claimed, and a run taken over anyway discards its chunk."""
+        import asyncio
+        from sqlalchemy import select, update
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.job import RecommendationBatchRun, JOB_RUNNING
+        from app.models.user import User
+        from app.services.batch_service import BatchRecommendationService
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'takeover.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_factory() as session:
+            session.add_all([User(id=f"user-{i}", email=f"t{i}@example.com", hashed_password="hashed") for i in range(2)])
+            await session.commit()
+        
+        claims = []
+        
+        async def slow_chunk(self, user_ids, market_data):
+            if claims:
+                return []
+            claims.append("contending")
+            await asyncio.sleep(0.4)
+            # Past the stale timeout, but the heartbeat has kept the run fresh
+            async with session_factory() as other:
+                claims.append(await BatchRecommendationService(other, session_factory).run("2026-01-04"))
+                # Another process that took the run over anyway commits first
+                await other.execute(update(RecommendationBatchRun).values(cursor="user-9", status=JOB_RUNNING))
+                await other.commit()
+            return [self.strategy_service._build_recommendation(user_ids[0], {}, {}, {"strategy_type": "staking"})]
+        
+        with patch.object(settings, "BATCH_RUN_STALE_SECONDS", 0.3), \
+                patch('app.services.strategy_service.StrategyService._get_market_data', new_callable=AsyncMock, return_value={"alex_pools": []}), \
+                patch.object(BatchRecommendationService, "_process_chunk", slow_chunk):
+            async with session_factory() as session:
+                assert await BatchRecommendationService(session, session_factory).run("2026-01-04") is None
+        
+        assert claims == ["contending", None]
+        async with session_factory() as session:
+            run = (await session.execute(select(RecommendationBatchRun))).scalar_one()
+            assert (run.cursor, run.status) == ("user-9", JOB_RUNNING)
+            assert (await session.execute(select(Recommendation))).first() is None
+        
+        await engine.dispose()
+    
+    @pytest.mark.asyncio
+    async def test_startup_creates_missed_nightly_run(self):
+        """Test a process started after the nightly hour creates today's run, and only resumes yesterday's."""
+        import asyncio
+        from datetime import timedelta
+        from app.services import batch_service
+        
+        calls = []
+        
+        async def run_until_finished(run_key, create=True):
+            calls.append((run_key, create))
+        
+        async def stop(seconds):
+            raise asyncio.CancelledError
+        
+        today = datetime.utcnow().date()
+        with patch.object(settings, "BATCH_RECOMMENDATION_HOUR", 0), \
+                patch.object(batch_service, "run_until_finished", run_until_finished), \
+                patch('app.services.batch_service.asyncio.sleep', stop):
+            with pytest.raises(asyncio.CancelledError):
+                await batch_service.run_batch_recommendation_loop()
+        
+        yesterday = (today - timedelta(days=1)).isoformat()
+        assert calls == [(yesterday, False), (today.isoformat(), True)]
+    
+    def test_seconds_until_hour(self):
+        """Test the nightly run waits for the next occurrence of its hour."""
+        from app.services.batch_service import seconds_until_hour
+        
+        assert seconds_until_hour(3, datetime(2026, 1, 1, 1, 30)) == 5400
+        assert seconds_until_hour(3, datetime(2026, 1, 1, 3, 0)) == 86400
+
+
+@pytest.mark.unit
+class TestMarketSnapshot:
+    """Test normalized market data and the shared snapshot."""
+    
+    def test_normalize_pools(self):
+        """Test pool payloads are reduced to compact rows."""
+        payload = {"data": [
+            {"token_x": "SP3K8BC0PPEVCV7NZ6QSRWPQ2JE9E5B6N3PA0KBR9.token-wstx", "token_y": "token-abtc", "tvl": "1500.5", "apy": 12.3},
+            {"pool_id": 7, "liquidity": {"usd": 99}},
+            {"tvl": 1},
+        ]}
+        
+        rows = normalize_pools("alex", payload)
+        
+        assert rows == [
+            {"protocol": "alex", "pair": "token-wstx/token-abtc", "tvl": 1500.5, "apy": 12.3, "volume": None, "fee": None},
+            {"protocol": "alex", "pair": "7", "tvl": 99.0, "apy": None, "volume": None, "fee": None},
+        ]
+    
+    def test_select_pools_prefers_relevant_pools(self):
+        """Test pools with held tokens or preferred protocols are kept first."""
+        market_data = {
+            "alex_pools": {"data": [
+                {"token_x": "token-wstx", "token_y": "token-alex", "tvl": 1000, "apy": 5},
+                {"pair": "USDA/DIKO", "tvl": 90000000, "apy": 30},
+            ] + [{"pair": f"T{i}/U{i}", "tvl": 10 ** (i % 7), "apy": i} for i in range(40)]},
+            "velar_pools": [{"symbol": "VELAR-AEUSDC", "tvl_usd": "500", "apr": 1}],
+        }
+        
+        pools = select_pools(market_data, held_symbols({"stx": 1000000}), ["velar"], limit=3)
+        
+        assert [pool["pair"] for pool in pools] == ["VELAR-AEUSDC", "token-wstx/token-alex", "USDA/DIKO"]
+    
+    def test_strategy_prompt_uses_compact_tables(self):
+        """Test the prompt carries dense tables instead of the raw payloads."""
+        strategy_service = StrategyService(MagicMock())
+        pools = [{"pair": f"T{i}/STX", "tvl": 1234567.0 + i, "apy": 12.3456, "volume_24h": 4567, "fee": 0.003, "extra": "x" * 200} for i in range(100)]
+        input_data = {
+            "user_profile": {"risk_tolerance": "low", "investment_amount": 500, "time_horizon": "short"},
+            "wallet_data": {"wallets": [{"address": "SP2J6ZY48GV1EZ5V2V5RB9MP66SW86PYKKNRV9EJ7", "network": "stacks", "balances": {"stx": {"balance": "2500000"}, "tokens": []}}]},
+            "market_data": {"alex_pools": pools},
+        }
+        
+        prompt = strategy_service._create_strategy_prompt(input_data)
+        
+        assert "stacks|SP2J6Z…RV9EJ7|STX|2.5M" in prompt
+        assert "protocol|pair|tvl|apy|volume|fee" in prompt
+        assert "alex|T99/STX|1.23M|12.3|4.57K|0.003" in prompt
+        assert prompt.count("/STX|") == settings.STRATEGY_PROMPT_TOP_POOLS
+        assert "extra" not in prompt
+        assert len(prompt) < len(json.dumps(pools)) / 5
+    
+    def test_write_and_read_versions(self, tmp_path):
+        """Test readers see each published version from the other slot."""
+        path = str(tmp_path / "market.snap")
+        writer = MarketSnapshot(path, capacity=8)
+        reader = MarketSnapshot(path, capacity=8)
+        assert reader.read() is None
+        assert writer.try_become_writer()
+        assert not MarketSnapshot(path, capacity=8).try_become_writer()
+        
+        assert writer.write([{"protocol": "velar", "pair": "STX/VELAR", "tvl": 10.0, "apy": None}]) == 1
+        first = reader.read()
+        assert first["version"] == 1
+        assert snapshot_to_rows(first["pools"]) == [
+            {"protocol": "velar", "pair": "STX/VELAR", "tvl": 10.0, "apy": None, "volume": None, "fee": None},
+        ]
+        
+        writer.write([{"protocol": "alex", "pair": "STX/ALEX", "tvl": 1.0}] * 3)
+        second = reader.read()
+        assert second["version"] == 2
+        assert len(second["pools"]) == 3
+        assert second["pools"]["pair"][0] == b"STX/ALEX"
+    
+    def test_long_names_are_truncated_on_character_boundaries(self, tmp_path):
+        """Test multi-byte names cut at the column width still decode."""
+        snapshot = MarketSnapshot(str(tmp_path / "market.snap"), capacity=8)
+        snapshot.try_become_writer()
+        pair = "STX/" + "\u00e9" * 30  # 64 bytes, with a 2-byte character across byte 48
+        snapshot.write([{"protocol": "velar", "pair": pair}])
+        
+        row = snapshot_to_rows(snapshot.read()["pools"])[0]
+        assert row["pair"] == pair[:26]
+    
+    def test_capacity_change_replaces_the_file(self, tmp_path):
+        """Test a resize swaps in a new file, leaving mapped readers on the old one until they remap."""
+        path = str(tmp_path / "market.snap")
+        reader = MarketSnapshot(path, capacity=8)
+        MarketSnapshot(path, capacity=8).write([{"protocol": "alex", "pair": "STX/ALEX"}] * 8)
+        old = reader.read()
+        
+        MarketSnapshot(path, capacity=2).write([{"protocol": "velar", "pair": "STX/VELAR"}])
+        # The old mapping is intact, not truncated under the reader
+        assert len(old["pools"]) == 8 and old["pools"]["pair"][7] == b"STX/ALEX"
+        new = reader.read()
+        assert new["version"] == 1
+        assert snapshot_to_rows(new["pools"])[0]["pair"] == "STX/VELAR"
+    
+    @pytest.mark.asyncio
+    async def test_snapshot_and_fetch_return_same_market_data(self, tmp_path):
+        """Test the snapshot and the fetch fallback give the same normalized rows."""
+        payloads = {
+            "alex_pools": {"data": [{"token_x": "token-wstx", "token_y": "token-alex", "tvl": "1000", "apy": 5}]},
+            "arkadiko_pools": [],
+            "velar_pools": [{"symbol": "VELAR-AEUSDC", "tvl_usd": "500", "apr": 1, "fee": 0.003}],
+        }
+        snapshot = MarketSnapshot(str(tmp_path / "market.snap"), capacity=8)
+        snapshot.try_become_writer()
+        snapshot.write(normalize_market_data(payloads))
+        
+        with patch('app.services.strategy_service.fetch_pool_payloads', new_callable=AsyncMock, return_value=payloads):
+            fetched = await StrategyService(MagicMock())._fetch_market_data()
+        
+        from_snapshot = snapshot.read_market_data(max_age=60)
+        assert from_snapshot == fetched
+        assert fetched["velar_pools"] == [
+            {"protocol": "velar", "pair": "VELAR-AEUSDC", "tvl": 500.0, "apy": 1.0, "volume": None, "fee": 0.003},
+        ]
+        # Decoded once per published version
+        assert snapshot.read_market_data(max_age=60) is from_snapshot
+        assert snapshot.read_market_data(max_age=-1) is None
@@ -0,0 +1,229 @@
+"""
+Upstream endpoint pool tests
+"""
+
+import pytest
+from unittest.mock import patch
+import asyncio
+import time
+import httpx
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import deadline
+from app.core.exceptions import CircuitOpenError, DeadlineExceededError
+from app.core.upstream import EndpointPool, CircuitBreaker, HEDGE_MIN_SAMPLES
+
+
+def _response(url: str, status: int = 200) -> httpx.Response:
+    return httpx.Response(status, json={"url": url}, request=httpx.Request("GET", url))
+
+
+class TestEndpointPool:
+    """Test failover and latency-based endpoint selection."""
+    
+    def test_ranking_prefers_fast_healthy_endpoints(self):
+        """Test endpoints are ordered by latency, with demoted ones last."""
+        pool = EndpointPool("test", ["https://a", "https://b", "https://c"], "/health", alpha=0.5)
+        a, b, c = pool.endpoints
+        pool.record(a, True, 0.5)
+        pool.record(b, True, 0.1)
+        pool.record(c, True, 0.05)
+        assert pool.base_url == "https://c"
+        
+        pool.record(c, False)
+        pool.record(c, False)
+        assert not c.healthy
+        assert [endpoint.url for endpoint in pool.ranked()] == ["https://b", "https://a", "https://c"]
+    
+    @pytest.mark.asyncio
+    async def test_failover_and_probe(self):
+        """Test failed endpoints are skipped, demoted, and restored by a probe."""
+        pool = EndpointPool("test", ["https://a", "https://b"], "/health", alpha=0.5)
+        down = {"https://a"}
+        calls = []
+        
+        async def get(client, url, *args, **kwargs):
+            calls.append(url)
+            if any(url.startswith(base) for base in down):
+                raise httpx.ConnectError("connection refused")
+            return _response(url)
+        
+        async with httpx.AsyncClient() as client:
+            with patch("httpx.AsyncClient.get", get):
+                response = await pool.get(client, "/x")
+                assert response.json()["url"] == "https://b/x"
+                assert calls == ["https://a/x", "https://b/x"]
+                
+                await pool.get(client, "/x")
+                assert not pool.endpoints[0].healthy
+                calls.clear()
+                await pool.get(client, "/x")
+                assert calls == ["https://b/x"]
+                
+                down.clear()
+                await pool.probe(client)
+                assert pool.endpoints[0].healthy
+    
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_fail_over(self):
+        """Test 4xx responses are returned instead of counted against the endpoint."""
+        pool = EndpointPool("test", ["https://a", "https://b"], "/health")
+        
+        async def get(client, url, *args, **kwargs):
+            return _response(url, 404 if url.startswith("https://a") else 503)
+        
+        async with httpx.AsyncClient() as client:
+            with patch("httpx.AsyncClient.get", get):
+                response = await pool.get(client, "/missing")
+        assert response.status_code == 404
+        assert pool.endpoints[0].error_rate == 0.0
+    
+    @pytest.mark.asyncio
+    async def test_open_circuit_skips_endpoint_until_half_open_trial(self):
+        """Test a failing endpoint's circuit opens, then one trial request closes it."""
+        pool = EndpointPool("test", ["https://a"], "/health", breaker_failures=2, breaker_reset=60)
+        endpoint = pool.endpoints[0]
+        healthy = False
+        calls = []
+        
+        async def get(client, url, *args, **kwargs):
+            calls.append(url)
+            if not healthy:
+                raise httpx.ReadTimeout("timed out")
+            return _response(url)
+        
+        async with httpx.AsyncClient() as client:
+            with patch("httpx.AsyncClient.get", get):
+                # The first pass fails, the retry opens the circuit, and the last retry is refused
+                with pytest.raises(httpx.ReadTimeout):
+                    await pool.get(client, "/x")
+                assert endpoint.breaker.state == CircuitBreaker.OPEN
+                
+                with pytest.raises(CircuitOpenError):
+                    await pool.get(client, "/x")
+                assert len(calls) == 2
+                
+                healthy = True
+                endpoint.breaker.opened_at -= 60
+                await pool.get(client, "/x")
+                assert endpoint.breaker.state == CircuitBreaker.CLOSED
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_pauses_only_its_endpoint(self):
+        """Test a 429 pauses the endpoint that sent it while the others keep serving."""
+        from app.core.rate_governor import governors
+        
+        pool = EndpointPool("test", ["https://limited.example", "https://spare.example"], "/health")
+        limited, spare = pool.endpoints
+        calls = []
+        
+        async def get(client, url, *args, **kwargs):
+            calls.append(url)
+            if url.startswith(limited.url):
+                return httpx.Response(429, headers={"retry-after": "30"}, request=httpx.Request("GET", url))
+            return _response(url)
+        
+        try:
+            async with httpx.AsyncClient() as client:
+                with patch("httpx.AsyncClient.get", get):
+                    response = await pool.get(client, "/x")
+                    assert response.json()["url"] == "https://spare.example/x"
+                    assert limited.governor.paused and not spare.governor.paused
+                    
+                    calls.clear()
+                    started = time.monotonic()
+                    await asyncio.wait_for(pool.get(client, "/x"), 2)
+            assert calls == ["https://spare.example/x"]
+            assert time.monotonic() - started < 1
+        finally:
+            governors.pop("limited.example", None)
+            governors.pop("spare.example", None)
+    
+    @pytest.mark.asyncio
+    async def test_hedged_request_takes_first_answer(self):
+        """Test a request slower than the p95 is raced by a second attempt."""
+        pool = EndpointPool("test", ["https://slow", "https://fast"], "/health", hedge=True)
+        for _ in range(HEDGE_MIN_SAMPLES):
+            pool.record(pool.endpoints[0], True, 0.01)
+        pool.endpoints[1].latency = 0.02
+        
+        async def get(client, url, *args, **kwargs):
+            await asyncio.sleep(5 if url.startswith("https://slow") else 0)
+            return _response(url)
+        
+        async with httpx.AsyncClient() as client:
+            with patch("httpx.AsyncClient.get", get):
+                started = time.monotonic()
+                response = await pool.get(client, "/x")
+        assert response.json()["url"] == "https://fast/x"
+        assert time.monotonic() - started < 1
+        assert pool.hedges == 1
+        assert pool.endpoints[0].breaker.state == CircuitBreaker.CLOSED
+    
+    @pytest.mark.asyncio
+    async def test_get_retries_with_backoff(self):
+        """Test a GET failing on every endpoint is retried, and POSTs are not."""
+        pool = EndpointPool("test", ["https://a"], "/health", breaker_failures=10)
+        failures = [httpx.ConnectError("refused")]
+        calls = []
+        
+        async def request(client, method, url, *args, **kwargs):
+            calls.append(method)
+            if failures:
+                raise failures.pop()
+            return _response(url)
+        
+        async with httpx.AsyncClient() as client:
+            with patch("httpx.AsyncClient.request", request), \
+                 patch("httpx.AsyncClient.get", lambda client, url, **kwargs: request(client, "GET", url)), \
+                 patch("app.core.upstream.settings.UPSTREAM_RETRY_BACKOFF", 0.01):
+                response = await pool.get(client, "/x")
+                assert response.status_code == 200
+                assert calls == ["GET", "GET"]
+                
+                failures.append(httpx.ConnectError("refused"))
+                with pytest.raises(httpx.ConnectError):
+                    await pool.request(client, "POST", "/x")
+                assert calls[2:] == ["POST"]
+
+
+class TestDeadline:
+    """Test per-request deadline budgets."""
+    
+    @pytest.mark.asyncio
+    async def test_deadline_caps_timeouts_and_retries(self):
+        """Test upstream calls get the remaining budget and stop once it is spent."""
+        pool = EndpointPool("test", ["https://a"], "/health", breaker_failures=10, timeout=5.0)
+        timeouts = []
+        
+        async def get(client, url, *args, **kwargs):
+            timeouts.append(kwargs.get("timeout"))
+            await asyncio.sleep(kwargs["timeout"])
+            raise httpx.ReadTimeout("timed out")
+        
+        async def call():
+            deadline.narrow(0.1)
+            async with httpx.AsyncClient() as client:
+                with patch("httpx.AsyncClient.get", get):
+                    await pool.get(client, "/x")
+        
+        with pytest.raises(DeadlineExceededError):
+            await asyncio.create_task(call())
+        assert len(timeouts) == 1 and timeouts[0] <= 0.1
+        assert deadline.remaining() is None
+    
+    def test_header_and_endpoint_budgets(self):
+        """Test X-Request-Timeout starts the budget and endpoints can only narrow it."""
+        app = FastAPI()
+        app.add_middleware(deadline.DeadlineMiddleware, maximum=60)
+        
+        @app.get("/budget", dependencies=[deadline.request_deadline(10)])
+        async def budget():
+            return {"remaining": deadline.remaining()}
+        
+        with TestClient(app) as client:
+            assert 9 < client.get("/budget").json()["remaining"] <= 10
+            assert client.get("/budget", headers={"X-Request-Timeout": "2"}).json()["remaining"] <= 2
+            assert client.get("/budget", headers={"X-Request-Timeout": "junk"}).json()["remaining"] > 9
@@ -5,11 +5,22 @@ Wallet management tests
 import pytest
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
+import asyncio
 import uuid
 
 from app.models.wallet import Wallet, NetworkType
+from app.core.config import settings
+from app.core.exceptions import ValidationError
 from app.services.wallet_service import WalletService
+from app.services.chain_tip import ChainTipWatcher, stacks_tx_addresses
+from app.services.transaction_service import TransactionService, BITCOIN_PAGE_SIZE
+from app.models.transaction import WalletTransaction
+from app.services.utxo_index import UtxoSet
+from app.services.hd_wallet_service import HDWalletService, parse_descriptor, derive_address
+from app.services.electrum import ElectrumBackend, ElectrumClient, address_to_scripthash
+from app.core.pagination import encode_cursor
+from tests.mocks import ElectrumStubServer
 
 
 @pytest.mark.wallet
@@ -218,23 +229,38 @@ class TestWalletService:
     @patch('httpx.AsyncClient.get')
     async def test_get_bitcoin_balances(self, mock_get, db_session, test_wallet: Wallet):
         """Test getting Bitcoin wallet balances."""
-        # Mock API response
-        mock_response = AsyncMock()
-        mock_response.json.return_value = {
-            "chain_stats": {
-                "funded_txo_sum": 2000000,
-                "spent_txo_sum": 1000000,
-                "tx_count": 10
-            }
+        # Mock API responses for the address summary, UTXOs and transactions
+        address = "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"
+        payloads = {
+            f"/address/{address}": {
+                "chain_stats": {
+                    "funded_txo_sum": 2000000,
+                    "spent_txo_sum": 1000000,
+                    "tx_count": 10
+                },
+                "mempool_stats": {"funded_txo_sum": 5000, "spent_txo_sum": 0, "tx_count": 1}
+            },
+            f"/address/{address}/utxo": [
+                {"txid": "aa" * 32, "vout": 0, "value": 1000000, "status": {"confirmed": True, "block_height": 800000}},
+                {"txid": "bb" * 32, "vout": 1, "value": 5000, "status": {"confirmed": False}}
+            ],
+            f"/address/{address}/txs": []
         }
-        mock_get.return_value = mock_response
+        
+        def respond(url, *args, **kwargs):
+            response = MagicMock()
+            response.json.return_value = payloads[url.split("/api", 1)[1]]
+            return response
+        mock_get.side_effect = respond
         
         wallet_service = WalletService(db_session)
-        balances = await wallet_service._get_bitcoin_balances("1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa")
+        balances = await wallet_service._get_bitcoin_balances(address)
         
         assert "btc" in balances
         assert "network" in balances
         assert balances["network"] == "bitcoin"
+        assert balances["btc"]["balance"] == 1000000
+        assert balances["btc"]["unconfirmed_balance"] == 5000
     
     @pytest.mark.asyncio
     async def test_get_wallet_balances_stacks(self, db_session, test_wallet: Wallet):
@@ -277,3 +303,524 @@ class TestWalletService:
         # For now, we test the error handling
         with pytest.raises(Exception):  # Should raise BlockchainError
             await wallet_service.get_wallet_balances(None)
+
+
+class FakeTipSource:
+    """Chain tip source driven by the test."""
+    
+    network = "stacks"
+    mempool_complete = True
+    
+    def __init__(self):
+        self.blocks = {100: "a100"}
+        self.touched = set()
+        self.mempool = set()
+    
+    async def tip(self, client):
+        height = max(self.blocks)
+        return height, self.blocks[height]
+    
+    async def hash_at(self, client, height):
+        return self.blocks.get(height)
+    
+    async def touched_addresses(self, client, heights):
+        return self.touched
+    
+    async def mempool_addresses(self, client):
+        return self.mempool
+
+
+@pytest.mark.wallet
+class TestChainTipWatcher:
+    """Test block-height-aware cache keys."""
+    
+    @pytest.mark.asyncio
+    async def test_new_block_invalidates_only_touched_addresses(self):
+        """Test a new block changes keys only for addresses it involves."""
+        source = FakeTipSource()
+        watcher = ChainTipWatcher([source], interval=10)
+        await watcher.poll(None)
+        alice = watcher.cache_key("stacks", "SP_ALICE")
+        bob = watcher.cache_key("stacks", "SP_BOB")
+        
+        source.blocks[101] = "a101"
+        source.touched = {"SP_ALICE", "SP_UNWATCHED"}
+        await watcher.poll(None)
+        
+        assert watcher.tips["stacks"] == (101, "a101")
+        assert watcher.cache_key("stacks", "SP_ALICE") != alice
+        assert watcher.cache_key("stacks", "SP_BOB") == bob
+        assert watcher.cache_ttl("stacks") is not None
+    
+    @pytest.mark.asyncio
+    async def test_mempool_and_reorg(self):
+        """Test mempool activity and reorgs invalidate cached keys."""
+        source = FakeTipSource()
+        watcher = ChainTipWatcher([source], interval=10)
+        await watcher.poll(None)
+        alice = watcher.cache_key("stacks", "SP_ALICE")
+        bob = watcher.cache_key("stacks", "SP_BOB")
+        
+        source.mempool = {"SP_BOB"}
+        await watcher.poll(None)
+        assert watcher.cache_key("stacks", "SP_ALICE") == alice
+        bob_pending = watcher.cache_key("stacks", "SP_BOB")
+        assert bob_pending != bob
+        
+        source.mempool = set()
+        source.blocks = {100: "b100", 101: "b101"}
+        await watcher.poll(None)
+        
+        assert watcher.reorgs == 1
+        assert watcher.cache_key("stacks", "SP_ALICE") != alice
+        assert watcher.cache_key("stacks", "SP_BOB") not in (bob, bob_pending)
+    
+    @pytest.mark.asyncio
+    async def test_only_block_epochs_are_shared(self):
+        """Test processes at the same tip agree on block keys, and mempool keys stay local."""
+        source = FakeTipSource()
+        first, second = ChainTipWatcher([source], interval=10), ChainTipWatcher([source], interval=10)
+        await first.poll(None)
+        await second.poll(None)
+        
+        assert first.cache_key("stacks", "SP_ALICE") == second.cache_key("stacks", "SP_ALICE")
+        assert first.is_shared("stacks", "SP_ALICE")
+        
+        source.mempool = {"SP_ALICE"}
+        await first.poll(None)
+        assert not first.is_shared("stacks", "SP_ALICE")
+        
+        source.mempool = set()
+        source.blocks[101] = "a101"
+        source.touched = {"SP_ALICE"}
+        await first.poll(None)
+        await second.poll(None)
+        assert first.cache_key("stacks", "SP_ALICE") == second.cache_key("stacks", "SP_ALICE")
+        assert first.is_shared("stacks", "SP_ALICE")
+        
+        source.mempool_complete = False
+        assert first.cache_ttl("stacks") == min(settings.CHAIN_TIP_CACHE_TTL, settings.CHAIN_TIP_PENDING_TTL)
+    
+    @pytest.mark.asyncio
+    async def test_watched_addresses_are_bounded(self):
+        """Test the watch list is dropped when the floor moves and capped by invalidating the network."""
+        source = FakeTipSource()
+        watcher = ChainTipWatcher([source], interval=10, max_watched=2)
+        await watcher.poll(None)
+        alice = watcher.cache_key("stacks", "SP_ALICE")
+        bob = watcher.cache_key("stacks", "SP_BOB")
+        assert len(watcher._epochs["stacks"]) == 2
+        
+        # A third address moves the floor instead of growing the list
+        carol = watcher.cache_key("stacks", "SP_CAROL")
+        assert len(watcher._epochs["stacks"]) == 1
+        assert watcher.cache_key("stacks", "SP_ALICE") != alice
+        assert watcher.cache_key("stacks", "SP_BOB") != bob
+        
+        # Addresses watched again after the floor moved are still invalidated
+        alice = watcher.cache_key("stacks", "SP_ALICE")
+        watcher.invalidate("stacks", ["SP_ALICE"], pending=True)
+        assert watcher.cache_key("stacks", "SP_ALICE") != alice
+        
+        # Whole-network invalidations forget every watched address
+        source.blocks = {100: "b100", 101: "b101"}
+        await watcher.poll(None)
+        assert watcher.reorgs == 1
+        assert "stacks" not in watcher._epochs
+        assert watcher.cache_key("stacks", "SP_CAROL") != carol
+    
+    def test_stacks_tx_addresses(self):
+        """Test principals are extracted from Stacks transactions."""
+        tx = {
+            "sender_address": "SP_SENDER",
+            "contract_call": {
+                "contract_id": "SP_DEPLOYER.amm-swap",
+                "function_args": [{"type": "principal", "repr": "'SP_RECIPIENT"}, {"type": "uint", "repr": "u1"}]
+            }
+        }
+        
+        assert stacks_tx_addresses(tx) == {"SP_SENDER", "SP_DEPLOYER", "SP_RECIPIENT"}
+
+
+@pytest.mark.wallet
+class TestTransactionService:
+    """Test the local transaction history store."""
+    
+    @pytest.mark.asyncio
+    async def test_delta_sync_and_backfill(self):
+        """Test history is fetched once, backfilled on demand and delta-synced."""
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.cache import clear_caches
+        from app.core.database import Base
+        from app.models.user import User
+        
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        
+        # Upstream history, newest first, paged like Esplora's /txs/chain
+        chain = [
+            {"txid": f"tx{height:03d}", "status": {"confirmed": True, "block_height": height, "block_time": 1700000000}}
+            for height in range(60, 0, -1)
+        ]
+        fetches = []
+        
+        async def fetch_page(self, client, wallet, cursor):
+            fetches.append(cursor)
+            start = 0 if cursor is None else [tx["txid"] for tx in chain].index(cursor) + 1
+            page = chain[start:start + BITCOIN_PAGE_SIZE]
+            next_cursor = page[-1]["txid"] if len(page) == BITCOIN_PAGE_SIZE else None
+            return [WalletTransaction.row_from_api(wallet.id, wallet.network, tx) for tx in page], next_cursor
+        
+        async with session_factory() as session:
+            user = User(email="history@example.com", hashed_password="hashed")
+            session.add(user)
+            await session.commit()
+            wallet = Wallet(user_id=user.id, address="bc1qhistory", network=NetworkType.BITCOIN)
+            session.add(wallet)
+            await session.commit()
+            
+            service = TransactionService(session)
+            with patch.object(TransactionService, "_fetch_page", fetch_page):
+                page, cursor = await service.get_transactions(wallet, limit=30)
+                assert [tx.txid for tx in page[:2]] == ["tx060", "tx059"]
+                assert len(page) == 30 and cursor is not None
+                assert fetches == [None, "tx036"]
+                
+                page, cursor = await service.get_transactions(wallet, limit=30, cursor=cursor)
+                assert page[0].txid == "tx030" and page[-1].txid == "tx001"
+                assert cursor is None
+                assert wallet.tx_history_complete
+                assert fetches == [None, "tx036", "tx011"]
+                
+                chain.insert(0, {"txid": "tx061", "status": {"confirmed": True, "block_height": 61}})
+                clear_caches()
+                page, _ = await service.get_transactions(wallet, limit=5)
+                assert page[0].txid == "tx061"
+                assert fetches[-1] is None and len(fetches) == 4
+                
+                # Streaming walks the whole stored history page by page
+                streamed = [tx.txid async for tx in service.iter_transactions(wallet)]
+                assert len(streamed) == 61
+                assert streamed[0] == "tx061" and streamed[-1] == "tx001"
+                
+                resumed = service.iter_transactions(wallet, cursor=encode_cursor(page[2].sequence, page[2].txid), limit=2)
+                assert [tx.txid async for tx in resumed] == ["tx058", "tx057"]
+        
+        await engine.dispose()
+
+
+@pytest.mark.wallet
+class TestUtxoSet:
+    """Test the incremental Bitcoin UTXO set."""
+    
+    ADDRESS = "bc1qwallet"
+    
+    def _tx(self, txid, height, vin=(), vout=()):
+        return {
+            "txid": txid,
+            "status": {"confirmed": height is not None, "block_height": height},
+            "vin": [
+                {"txid": prev_txid, "vout": index, "prevout": {"scriptpubkey_address": self.ADDRESS, "value": value}}
+                for prev_txid, index, value in vin
+            ],
+            "vout": [{"scriptpubkey_address": address, "value": value} for address, value in vout]
+        }
+    
+    def test_incremental_updates(self):
+        """Test mempool spends, confirmations and coin selection."""
+        funding = self._tx("f1", 100, vout=[(self.ADDRESS, 50000), ("bc1qother", 1)])
+        utxo_set = UtxoSet(self.ADDRESS)
+        utxo_set.load(
+            {"chain_stats": {"funded_txo_count": 1, "funded_txo_sum": 50000, "tx_count": 1}},
+            [{"txid": "f1", "vout": 0, "value": 50000, "status": {"confirmed": True, "block_height": 100}}],
+            [funding]
+        )
+        assert utxo_set.confirmed_balance == 50000
+        
+        spend = self._tx("s1", None, vin=[("f1", 0, 50000)], vout=[("bc1qother", 30000), (self.ADDRESS, 19000)])
+        assert utxo_set.apply([spend, funding])
+        assert utxo_set.confirmed_balance == 50000
+        assert utxo_set.unconfirmed_balance == -31000
+        assert utxo_set.spendable() == []
+        assert [utxo["value"] for utxo in utxo_set.spendable(include_unconfirmed=True)] == [19000]
+        
+        spend["status"] = {"confirmed": True, "block_height": 101}
+        assert utxo_set.apply([spend, funding])
+        assert utxo_set.confirmed_balance == 19000
+        assert utxo_set.unconfirmed_balance == 0
+        
+        selection = utxo_set.select_coins(10000, fee_rate=2)
+        assert [utxo["txid"] for utxo in selection["inputs"]] == ["s1"]
+        assert selection["fee"] + selection["change"] + 10000 == 19000
+        with pytest.raises(ValidationError):
+            utxo_set.select_coins(20000, fee_rate=2)
+    
+    def test_dropped_mempool_tx_requires_reload(self):
+        """Test a vanished mempool transaction cannot be applied incrementally."""
+        utxo_set = UtxoSet(self.ADDRESS)
+        utxo_set.load({}, [], [self._tx("m1", None, vout=[(self.ADDRESS, 1000)])])
+        
+        assert not utxo_set.apply([])
+
+
+@pytest.mark.wallet
+class TestHDWalletService:
+    """Test xpub/descriptor wallets."""
+    
+    XPUB = "xpub6D615qvARkXJWJiBSBpYBcBUJ7BXxqEmQNHJHGKUxcmTU2oS9zrBmFM5piKbQQk6ttxUfg9kvkgcx5rnJ2jV1io5bhEaZCngmKkoAf1GDMH"
+    
+    @patch.object(settings, "BITCOIN_NETWORK", "mainnet")
+    def test_parse_descriptor(self):
+        """Test bare keys become two-branch descriptors."""
+        descriptor, canonical = parse_descriptor(self.XPUB)
+        assert canonical.startswith("pkh(") and canonical.endswith("/<0;1>/*)")
+        assert derive_address(descriptor, 0, 0) != derive_address(descriptor, 1, 0)
+        assert derive_address(descriptor, 0, 0).startswith("1")
+        
+        with pytest.raises(ValidationError):
+            parse_descriptor("not-a-key")
+    
+    @patch.object(settings, "BITCOIN_NETWORK", "testnet")
+    def test_parse_descriptor_rejects_other_network(self):
+        """Test keys for another network than the configured one are rejected."""
+        with pytest.raises(ValidationError):
+            parse_descriptor(self.XPUB)
+        with pytest.raises(ValidationError):
+            parse_descriptor(f"wpkh({self.XPUB}/<0;1>/*)")
+    
+    @pytest.mark.asyncio
+    @patch.object(settings, "BITCOIN_NETWORK", "mainnet")
+    async def test_gap_limit_scan(self):
+        """Test discovery stops after a full gap and refreshes only probe the frontier."""
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.user import User
+        
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        
+        descriptor, canonical = parse_descriptor(self.XPUB)
+        funded = {derive_address(descriptor, 0, 0): 1000, derive_address(descriptor, 0, 4): 2000}
+        probes = []
+        
+        async def get(client, url, *args, **kwargs):
+            address = url.rsplit("/", 1)[1]
+            probes.append(address)
+            response = MagicMock()
+            value = funded.get(address, 0)
+            response.json.return_value = {
+                "chain_stats": {"funded_txo_sum": value, "spent_txo_sum": 0, "tx_count": int(value > 0)},
+                "mempool_stats": {}
+            }
+            return response
+        
+        async with session_factory() as session:
+            user = User(email="hd@example.com", hashed_password="hashed")
+            session.add(user)
+            await session.commit()
+            wallet = Wallet(
+                user_id=user.id,
+                address=derive_address(descriptor, 0, 0),
+                network=NetworkType.BITCOIN,
+                descriptor=canonical,
+                gap_limit=5
+            )
+            session.add(wallet)
+            await session.commit()
+            
+            service = HDWalletService(session)
+            with patch("httpx.AsyncClient.get", get):
+                balances = await service.get_balances(wallet)
+                assert balances["btc"]["balance"] == 3000
+                assert balances["btc"]["used_addresses"] == 2
+                assert balances["next_receive_address"] == derive_address(descriptor, 0, 1)
+                # Receive: indexes 0-9 (gap after index 4); change: 0-4
+                assert len(probes) == 15
+                
+                probes.clear()
+                await service.get_balances(wallet)
+                # Funded addresses plus the unused frontier of each branch
+                assert len(probes) == 2 + 5 + 5
+        
+        await engine.dispose()
+    
+    async def _descriptor_wallet(self, session_factory, gap_limit=5):
+        """Store a user and an xpub wallet, returning the wallet and its parsed descriptor"""
+        from app.models.user import User
+        
+        descriptor, canonical = parse_descriptor(self.XPUB)
+        async with session_factory() as session:
+            user = User(email="hd@example.com", hashed_password="hashed")
+            session.add(user)
+            await session.commit()
+            wallet = Wallet(
+                user_id=user.id,
+                address=derive_address(descriptor, 0, 0),
+                network=NetworkType.BITCOIN,
+                descriptor=canonical,
+                gap_limit=gap_limit
+            )
+            session.add(wallet)
+            await session.commit()
+        return wallet, descriptor
+    
+    @staticmethod
+    def _summary(value):
+        response = MagicMock()
+        response.json.return_value = {
+            "chain_stats": {"funded_txo_sum": value, "spent_txo_sum": 0, "tx_count": int(value > 0)},
+            "mempool_stats": {}
+        }
+        return response
+    
+    @pytest.mark.asyncio
+    @patch.object(settings, "BITCOIN_NETWORK", "mainnet")
+    async def test_concurrent_scans_do_not_duplicate_addresses(self, tmp_path):
+        """Test concurrent scans of one wallet store each derived address once."""
+        from sqlalchemy import func, select
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.models.wallet import WalletAddress
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'hd.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        wallet, _ = await self._descriptor_wallet(session_factory)
+        
+        async def get(client, url, *args, **kwargs):
+            await asyncio.sleep(0.01)
+            return self._summary(0)
+        
+        async def scan():
+            async with session_factory() as session:
+                return await HDWalletService(session).scan(await session.get(Wallet, wallet.id))
+        
+        with patch("httpx.AsyncClient.get", get):
+            first, second = await asyncio.gather(scan(), scan())
+        
+        assert len(first) == len(second) == 10
+        async with session_factory() as session:
+            count = (await session.execute(select(func.count()).select_from(WalletAddress))).scalar()
+        assert count == 10
+        
+        await engine.dispose()
+    
+    @pytest.mark.asyncio
+    @patch.object(settings, "BITCOIN_NETWORK", "mainnet")
+    async def test_descriptor_balances_follow_derived_address_epochs(self, tmp_path):
+        """Test activity on a derived address invalidates the wallet's cached balances."""
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import Base
+        from app.services.chain_tip import chain_tip_watcher
+        
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'hd.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        wallet, descriptor = await self._descriptor_wallet(session_factory)
+        receive = derive_address(descriptor, 0, 3)
+        funded = {}
+        
+        async def get(client, url, *args, **kwargs):
+            return self._summary(funded.get(url.rsplit("/", 1)[1], 0))
+        
+        async with session_factory() as session:
+            service = WalletService(session)
+            with patch("httpx.AsyncClient.get", get):
+                assert (await service.get_wallet_balances(wallet))["btc"]["balance"] == 0
+                funded[receive] = 5000
+                assert (await service.get_wallet_balances(wallet))["btc"]["balance"] == 0  # Cached
+                
+                chain_tip_watcher.invalidate("bitcoin", [receive], pending=True)
+                assert (await service.get_wallet_balances(wallet))["btc"]["balance"] == 5000
+        
+        await engine.dispose()
+
+
+@pytest.mark.wallet
+class TestElectrumBackend:
+    """Test the Electrum-protocol Bitcoin backend."""
+    
+    ADDRESSES = ["mipcBbFg9gMiCh81Kj8tqqdgoZub1ZJRfn", "tb1qw508d6qejxtdg4y5r3zarvary0c5xw7kxpjzsx"]
+    
+    @pytest.mark.asyncio
+    async def test_batched_lookups_and_notifications(self):
+        """Test lookups share one connection and round trip, and notifications invalidate epochs."""
+        from app.services.chain_tip import chain_tip_watcher
+        
+        server = await ElectrumStubServer().start()
+        first, second = [address_to_scripthash(address) for address in self.ADDRESSES]
+        server.balances[first] = {"confirmed": 5000, "unconfirmed": -1000}
+        server.histories[first] = [{"tx_hash": "aa", "height": 100}, {"tx_hash": "bb", "height": 0}]
+        server.unspent[first] = [
+            {"tx_hash": "aa", "tx_pos": 0, "value": 4000, "height": 100},
+            {"tx_hash": "bb", "tx_pos": 1, "value": 1000, "height": 0},
+        ]
+        
+        backend = ElectrumBackend(ElectrumClient("127.0.0.1", server.port, use_ssl=False, timeout=5))
+        try:
+            balances = await backend.get_balances(self.ADDRESSES)
+            assert balances[self.ADDRESSES[0]] == {"confirmed": 5000, "unconfirmed": -1000, "tx_count": 2}
+            assert balances[self.ADDRESSES[1]]["tx_count"] == 0
+            # Version handshake, then one batch for both addresses
+            assert server.messages == 2
+            
+            utxos = await backend.list_unspent(self.ADDRESSES)
+            assert [(utxo["txid"], utxo["height"]) for utxo in utxos] == [("aa", 100), ("bb", None)]
+            assert server.messages == 3
+            
+            key = chain_tip_watcher.cache_key("bitcoin", self.ADDRESSES[0])
+            await server.notify(first)
+            for _ in range(50):
+                if chain_tip_watcher.cache_key("bitcoin", self.ADDRESSES[0]) != key:
+                    break
+                await asyncio.sleep(0.01)
+            assert chain_tip_watcher.cache_key("bitcoin", self.ADDRESSES[0]) != key
+        finally:
+            await backend.close()
+            await server.stop()
+    
+    @pytest.mark.asyncio
+    async def test_oversized_history_response(self):
+        """Test a history far larger than the default 64 KiB stream limit is read on one connection."""
+        server = await ElectrumStubServer().start()
+        scripthash = address_to_scripthash(self.ADDRESSES[0])
+        server.histories[scripthash] = [{"tx_hash": f"{i:064x}", "height": 100000 + i} for i in range(1000)]
+        
+        backend = ElectrumBackend(ElectrumClient("127.0.0.1", server.port, use_ssl=False, timeout=5))
+        try:
+            balances = await backend.get_balances([self.ADDRESSES[0]])
+            assert balances[self.ADDRESSES[0]]["tx_count"] == 1000
+            assert backend.client.connected
+        finally:
+            await backend.close()
+            await server.stop()
+    
+    @pytest.mark.asyncio
+    async def test_replayed_subscriptions_are_capped(self):
+        """Test only the most recently used subscriptions are kept for replay on reconnect."""
+        server = await ElectrumStubServer().start()
+        first, second = [address_to_scripthash(address) for address in self.ADDRESSES]
+        
+        backend = ElectrumBackend(
+            ElectrumClient("127.0.0.1", server.port, use_ssl=False, timeout=5, max_subscriptions=1)
+        )
+        try:
+            await backend.get_balances([self.ADDRESSES[0]])
+            await backend.get_balances([self.ADDRESSES[1]])
+            
+            assert not backend.client.is_subscribed("blockchain.scripthash.subscribe", [first])
+            assert backend.client.is_subscribed("blockchain.scripthash.subscribe", [second])
+            assert len(backend.client._subscriptions) == 1
+        finally:
+            await backend.close()
+            await server.stop()